@@ -35,27 +35,41 @@ __revision__ = '$Format:%H$'
 verbose = False
 
 from .cf_blobs import CFTask
+from .distance_engine import DistanceEngine,error_bounds,manhattan_error_bound
+from .point_store import PointStore
+from .cluster_scores import ClusterScores
+from .hierarchy_engines import NNChainLinkage,GenericLinkage,BoruvkaLinkage,cut_tree
+from .kmeans_engines import (LloydKMeans,HamerlyKMeans,MiniBatchKMeans,KDTreeKMeans,StreamingKMeans,
+                             FuzzyCMeans,SparseFuzzyCMeans,
+                             EmptyClusterError,kmeans_plusplus,kmeans_parallel,run_restarts,
+                             sensitivity_coreset)
 
 from qgis.core import QgsProcessingAlgorithm,QgsApplication,QgsProcessingProvider
 
 from PyQt5.QtCore import QCoreApplication,QVariant
 
-from qgis.core import (QgsField,QgsPoint,QgsPointXY,QgsDistanceArea,
+from qgis.core import (QgsField,QgsFields,QgsPointXY,QgsDistanceArea,
                        QgsProcessingParameterVectorLayer,QgsProcessingParameterBoolean,
                        QgsProcessingParameterEnum,QgsProcessingParameterNumber,
                        QgsProcessingParameterField,QgsVectorLayer,QgsFeature,
-                       QgsFeatureRequest,QgsGeometry)
+                       QgsFeatureRequest,QgsCoordinateTransform,
+                       QgsCoordinateReferenceSystem,QgsProcessingOutputNumber,
+                       QgsProcessingParameterFile,QgsProcessingParameterFileDestination,
+                       QgsVectorLayerFeatureSource,QgsProcessingParameterFeatureSink,
+                       QgsFeatureSink)
 
 from qgis.core import (QgsProcessing,QgsProcessingException,QgsProcessingAlgorithm,
                       Qgis,QgsTask,QgsMessageLog,QgsProject)
 
-from math import fsum,sqrt
+from itertools import islice
+from math import fsum
 from sys import float_info
-from bisect import bisect
 from time import sleep
 
-from numpy import argmax
+from numpy import arange,argpartition,argsort,array,concatenate,empty,searchsorted,sort
+from numpy.random import default_rng
 
+import json
 import random
 
 MESSAGE_CATEGORY = 'ClusterPoints: Clustering'
@@ -82,14 +96,34 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
     Points = 'Points'
     SelectedFeaturesOnly = 'SelectedFeaturesOnly'
     Cluster_Type = 'Cluster_Type'
+    KMeans_Method = 'KMeans_Method'
+    BatchSize = 'BatchSize'
+    ChunkSize = 'ChunkSize'
+    Initialization = 'Initialization'
+    Restarts = 'Restarts'
+    CoresetSize = 'CoresetSize'
+    MaxIterations = 'MaxIterations'
+    Tolerance = 'Tolerance'
+    Iterations = 'Iterations'
+    FinalShift = 'FinalShift'
     RandomSeed = 'RandomSeed'
     Linkage = 'Linkage'
     Fuzzifier = 'Fuzzifier'
+    TopMemberships = 'TopMemberships'
     Distance_Type = 'Distance_Type'
+    Distance_Method = 'Distance_Method'
     NumberOfClusters = 'NumberOfClusters'
+    MaxNumberOfClusters = 'MaxNumberOfClusters'
+    SelectedNumberOfClusters = 'SelectedNumberOfClusters'
     AggregationPercentile = 'AggregationPercentile'
     PercentAttrib = 'PercentAttrib'
     AttribValues = 'AttribValues'
+    WeightField = 'WeightField'
+    MergeTolerance = 'MergeTolerance'
+    InitialCentroids = 'InitialCentroids'
+    ModelFile = 'ModelFile'
+    ModelOutput = 'ModelOutput'
+    Output = 'Output'
 
     def initAlgorithm(self, config):
         """
@@ -109,37 +143,104 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
             self.Cluster_Type,
             self.tr("Cluster algorithm (K-Means, Fuzzy C-Means or Hierarchical)"),
             ['K-Means','Fuzzy C-Means','Hierarchical'],defaultValue='K-Means'))
+
+        self.addParameter(QgsProcessingParameterEnum(
+            self.KMeans_Method,
+            self.tr("Iteration scheme for K-Means algorithm"),
+            ['Lloyd (all distances)','Hamerly (triangle inequality bounds)',
+            'Mini-Batch (random samples)','Kd-tree filtering (planar distances only)',
+            'Streaming (online updates in chunks, writes Cluster_ID to a new output layer)'],
+            defaultValue=0))
+
+        self.addParameter(QgsProcessingParameterNumber(
+            self.BatchSize,
+            self.tr('Number of points per batch (only used for Mini-Batch K-Means)'),
+            defaultValue=1024,minValue=10))
+
+        self.addParameter(QgsProcessingParameterNumber(
+            self.ChunkSize,
+            self.tr('Number of features per chunk (only used for streaming K-Means)'),
+            defaultValue=100000,minValue=100))
+
+        self.addParameter(QgsProcessingParameterEnum(
+            self.Initialization,
+            self.tr("Initialization for K-Means and Fuzzy C-Means"),
+            ['K-Means++','K-Means|| (oversampling, for large numbers of clusters)'],
+            defaultValue=0))
+
+        self.addParameter(QgsProcessingParameterNumber(
+            self.Restarts,
+            self.tr('Number of independent K-Means runs (best result is kept)'),
+            defaultValue=1,minValue=1,maxValue=999))
   
+        self.addParameter(QgsProcessingParameterNumber(
+            self.CoresetSize,
+            self.tr('Size of weighted coreset for K-Means and Fuzzy C-Means (0 for all points)'),
+            defaultValue=0,minValue=0))
+
         self.addParameter(QgsProcessingParameterNumber(
             self.RandomSeed,
             self.tr('RandomSeed for initialization'),
             defaultValue=1,minValue=1,maxValue=999))
 
+        self.addParameter(QgsProcessingParameterNumber(
+            self.MaxIterations,
+            self.tr('Maximum number of iterations (K-Means and Fuzzy C-Means)'),
+            defaultValue=300,minValue=1))
+
+        self.addParameter(QgsProcessingParameterNumber(
+            self.Tolerance,
+            self.tr('Centroid shift for convergence (0 for machine precision)'),
+            type = QgsProcessingParameterNumber.Double,
+            defaultValue=0.0,minValue=0.0))
+
         self.addParameter(QgsProcessingParameterEnum(
             self.Linkage,
             self.tr("Link functions for Hierarchical algorithm"),
             ['Single (SLINK)','Single (Lance-Williams)',
             'Complete (Lance-Williams)','Median (Lance-Williams)',
             'Unweighted Average (Lance-Williams)',
-            'Ward\'s (Lance-Williams)','Centroid (Lance-Williams)'],
+            'Ward\'s (Lance-Williams)','Centroid (Lance-Williams)',
+            'Single (minimum spanning tree, planar distances only)'],
             optional=True))
         
         self.addParameter(QgsProcessingParameterEnum(
             self.Distance_Type,
-            self.tr("Distance calculation type"),
+            self.tr("Distance calculation type (Manhattan on geographic CRS uses "+ \
+                    "parallel arcs for the east-west legs, not ellipsoidal lines)"),
             ['Euclidean','Manhattan'],defaultValue='Euclidean'))
 
+        self.addParameter(QgsProcessingParameterEnum(
+            self.Distance_Method,
+            self.tr("Distance measurement (automatic uses planar distances for projected CRS)"),
+            ['Automatic','Ellipsoidal (QgsDistanceArea)',
+            'Haversine great circle (geographic CRS only)',
+            'Ellipsoid-corrected great circle (geographic CRS only)',
+            'Planar after local azimuthal equidistant projection'],defaultValue=0))
+
         self.addParameter(QgsProcessingParameterNumber(
             self.NumberOfClusters,
             self.tr('User-defined number of clusters'),
             defaultValue=2,minValue=2,maxValue=999))
 
+        self.addParameter(QgsProcessingParameterNumber(
+            self.MaxNumberOfClusters,
+            self.tr('Maximum number of clusters for automatic selection by silhouette '+ \
+                    '(0 for the user-defined number only)'),
+            defaultValue=0,minValue=0,maxValue=999))
+
         self.addParameter(QgsProcessingParameterNumber(
             self.Fuzzifier,
             self.tr('Fuzzifier coefficient m (only used for Fuzzy C-Means)'),
             type = QgsProcessingParameterNumber.Double,
             defaultValue=2.0,minValue=1.1))
 
+        self.addParameter(QgsProcessingParameterNumber(
+            self.TopMemberships,
+            self.tr('Number of largest memberships kept per point (only used for '+ \
+                    'Fuzzy C-Means, 0 for all clusters)'),
+            defaultValue=0,minValue=0,maxValue=999))
+
         self.addParameter(QgsProcessingParameterNumber(
             self.AggregationPercentile,
             self.tr('Cluster feature distance percentile (only used for Lance-Williams)'),
@@ -154,21 +255,80 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
             self.Points,type=QgsProcessingParameterField.Numeric,
             allowMultiple=True,optional=True))
 
+        self.addParameter(QgsProcessingParameterField(
+            self.WeightField,self.tr('Weight field (positive point weights)'),'',
+            self.Points,type=QgsProcessingParameterField.Numeric,
+            optional=True))
+
+        self.addParameter(QgsProcessingParameterNumber(
+            self.MergeTolerance,
+            self.tr('Grid size for merging co-located points (0 merges exact duplicates only)'),
+            type = QgsProcessingParameterNumber.Double,
+            defaultValue=0.0,minValue=0.0))
+
+        self.addParameter(QgsProcessingParameterVectorLayer(
+            self.InitialCentroids,
+            self.tr('Point layer with initial centroids (K-Means and Fuzzy C-Means)'),
+            [QgsProcessing.TypeVectorPoint],optional=True))
+
+        self.addParameter(QgsProcessingParameterFile(
+            self.ModelFile,
+            self.tr('Model file with initial centroids (K-Means and Fuzzy C-Means)'),
+            extension='json',optional=True))
+
+        self.addParameter(QgsProcessingParameterFileDestination(
+            self.ModelOutput,
+            self.tr('Model file for the final centroids (K-Means and Fuzzy C-Means)'),
+            fileFilter='JSON files (*.json)',optional=True,createByDefault=False))
+
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.Output,
+            self.tr('Clustered points (only used for streaming K-Means)'),
+            QgsProcessing.TypeVectorPoint,optional=True,createByDefault=True))
+
+        self.addOutput(QgsProcessingOutputNumber(
+            self.Iterations,self.tr('Number of iterations')))
+
+        self.addOutput(QgsProcessingOutputNumber(
+            self.FinalShift,self.tr('Final centroid shift')))
+
+        self.addOutput(QgsProcessingOutputNumber(
+            self.SelectedNumberOfClusters,self.tr('Selected number of clusters')))
+
     def processAlgorithm(self, parameters, context, progress):
 
         vlayer = self.parameterAsVectorLayer(parameters, self.Points, context)
         SelectedFeaturesOnly = self.parameterAsBool(parameters, self.SelectedFeaturesOnly, context)
         Cluster_Type = self.parameterAsEnum(parameters, self.Cluster_Type, context)
+        KMeans_Method = self.parameterAsEnum(parameters, self.KMeans_Method, context)
+        BatchSize = self.parameterAsInt(parameters, self.BatchSize, context)
+        ChunkSize = self.parameterAsInt(parameters, self.ChunkSize, context)
+        Initialization = self.parameterAsEnum(parameters, self.Initialization, context)
+        Restarts = self.parameterAsInt(parameters, self.Restarts, context)
+        CoresetSize = self.parameterAsInt(parameters, self.CoresetSize, context)
+        MaxIterations = self.parameterAsInt(parameters, self.MaxIterations, context)
+        Tolerance = self.parameterAsDouble(parameters, self.Tolerance, context)
         RandomSeed = self.parameterAsInt(parameters, self.RandomSeed, context)
         Linkage = self.parameterAsEnum(parameters, self.Linkage, context)
         Fuzzifier = self.parameterAsDouble(parameters, self.Fuzzifier, context)
+        TopMemberships = self.parameterAsInt(parameters, self.TopMemberships, context)
         Distance_Type = self.parameterAsEnum(parameters, self.Distance_Type, context)
+        Distance_Method = self.parameterAsEnum(parameters, self.Distance_Method, context)
         NumberOfClusters = self.parameterAsInt(parameters, self.NumberOfClusters, context)
+        MaxNumberOfClusters = self.parameterAsInt(parameters, self.MaxNumberOfClusters, context)
         AggregationPercentile = self.parameterAsInt(parameters, self.AggregationPercentile, context)
         PercentAttrib = self.parameterAsInt(parameters, self.PercentAttrib, context)
         AttribValues = self.parameterAsFields(parameters, self.AttribValues, context)
+        WeightField = self.parameterAsString(parameters, self.WeightField, context)
+        MergeTolerance = self.parameterAsDouble(parameters, self.MergeTolerance, context)
+        InitialCentroids = self.parameterAsVectorLayer(parameters, self.InitialCentroids, context)
+        ModelFile = self.parameterAsFile(parameters, self.ModelFile, context)
+        ModelOutput = self.parameterAsFileOutput(parameters, self.ModelOutput, context)
 
-        links = ["single", "single", "complete", "median", "average", "wards", "centroid"]
+        links = ["single", "single", "complete", "median", "average", "wards", "centroid", "single"]
+        methods = [None, "ellipsoid", "haversine", "lambert", None]
+        kmeans_methods = ["lloyd", "hamerly", "minibatch", "kdtree", "streaming"]
+        init_methods = ["plusplus", "parallel"]
 
         random.seed(RandomSeed)
 
@@ -178,25 +338,57 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
 
         d = QgsDistanceArea()
         d.setSourceCrs(sRs, context.transformContext())
-        d.setEllipsoid(context.project().ellipsoid())
+        ellipsoid = context.project().ellipsoid()
+        if Distance_Method in (2,3) and not sRs.isGeographic():
+            progress.pushInfo(self.tr("Great circle distances require a geographic CRS"))
+            Distance_Method = 0
+        if Distance_Method==0 and not sRs.isGeographic():
+            # plain Cartesian arithmetic on raw coordinates
+            d.setEllipsoid("NONE")
+        else:
+            d.setEllipsoid(ellipsoid)
+        method = methods[Distance_Method]
+        if method in ("haversine","lambert"):
+            progress.pushInfo(self.tr("Using vectorized {} distances ".format(method)+ \
+                                      "(documented error bound {:.2%})".format(
+                                      error_bounds[method])))
+        elif Distance_Method==4:
+            progress.pushInfo(self.tr("Using planar distances in a local "+ \
+                                      "azimuthal equidistant projection"))
+        elif d.willUseEllipsoid():
+            progress.pushInfo(self.tr("Using ellipsoidal distances on {}".format(
+                                      d.ellipsoid())))
+        else:
+            progress.pushInfo(self.tr("Using planar distances in units of {}".format(
+                                      sRs.authid())))
+        if Distance_Type==1 and sRs.isGeographic() and Distance_Method in (0,2,3) \
+           and d.willUseEllipsoid():
+            # east-west legs follow the parallels instead of the geodesics
+            extent = vlayer.extent()
+            bound = manhattan_error_bound(max(abs(extent.yMinimum()),abs(extent.yMaximum())),
+                                          extent.xMaximum()-extent.xMinimum())
+            progress.pushInfo(self.tr("Manhattan legs measured along parallels "+ \
+                                      "(error bound for the layer extent {:.4%})".format(bound)))
+
+        # stream features in chunks instead of copying the layer
+        streaming = Cluster_Type==0 and kmeans_methods[KMeans_Method]=="streaming"
+        if streaming:
+            request = QgsFeatureRequest()
+            if SelectedFeaturesOnly:
+                request.setFilterFids(vlayer.selectedFeatureIds())
+            source = QgsVectorLayerFeatureSource(vlayer)
 
         # copy layer
-        if SelectedFeaturesOnly:
+        elif SelectedFeaturesOnly:
             vlayer_new = vlayer.materialize(QgsFeatureRequest().setFilterFids(vlayer.selectedFeatureIds()))
         else:
             vlayer.selectAll()
             vlayer_new = vlayer.materialize(QgsFeatureRequest().setFilterFids(vlayer.selectedFeatureIds()))
             vlayer.removeSelection()
         
-        # retrieve features
-        fit = vlayer_new.getFeatures()
-            
         # add copied layer to canvas
-        QgsProject.instance().addMapLayer(vlayer_new)
-
-        # initialize points for clustering
-        points = {infeat.id():Cluster_point(infeat.geometry().asPoint()) for \
-                  infeat in fit}
+        if not streaming:
+            QgsProject.instance().addMapLayer(vlayer_new)
 
         # check on attribute contribution and correct if necessary
         if PercentAttrib>0 and len(''.join(AttribValues))==0:
@@ -204,54 +396,154 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
             PercentAttrib = 0
 
         # retrieve optional z values to consider in clustering
+        id_attr = []
         if PercentAttrib>0:
-            if SelectedFeaturesOnly:
-                fit = vlayer.getSelectedFeatures()
-            else:
-                fit = vlayer.getFeatures()
-            id_attr = []
             for j in range(len(AttribValues)):
-                id_attr.append(vlayer.dataProvider().fieldNameIndex(AttribValues[j]))
+                id_attr.append(vlayer.fields().indexFromName(AttribValues[j]))
                 if id_attr[-1]<0:
                     raise QgsProcessingException(
                               "Field {} not found in input layer".format(AttribValues[j]))
-            for infeat in fit:
-                for i in id_attr:
-                    if infeat[i] or infeat[i]==0:
-                        points[infeat.id()].addAttribute(infeat[i])
-                    else:
-                        del points[infeat.id()]
-                        break
+
+        # retrieve optional point weights
+        id_weight = None
+        if WeightField:
+            id_weight = vlayer.fields().indexFromName(WeightField)
+            if id_weight<0:
+                raise QgsProcessingException(
+                          "Field {} not found in input layer".format(WeightField))
+
+        # initialize columnar point store for clustering
+        if streaming:
+            # keep a random sample for initialization and standardization
+            points,count = self.sample_points(self.read_chunks(source,request,ChunkSize), \
+                                              id_attr,id_weight,ChunkSize,WeightField)
+            progress.pushInfo(self.tr("Drawn a sample of {} of {} valid ".format(len(points),count)+ \
+                                      "points for initialization and standardization"))
+        else:
+            points = PointStore.from_features(vlayer_new.getFeatures(),id_attr,id_weight)
+            self.check_weights(points,WeightField)
+
+        # read centroids of a previous run for a warm start
+        fields = AttribValues if PercentAttrib>0 else []
+        centroids = None
+        if Cluster_Type<2 and (InitialCentroids is not None or ModelFile):
+            if InitialCentroids is not None and ModelFile:
+                progress.pushInfo(self.tr("Using initial centroids from layer instead of model file"))
+            centroids = self.read_centroids(InitialCentroids,ModelFile,fields,sRs,context)
+            if len(centroids)<2:
+                raise QgsProcessingException("At least two initial centroids required")
+            progress.pushInfo(self.tr("Warm start from {} initial centroids".format(len(centroids))))
+            NumberOfClusters = len(centroids)
+            if MaxNumberOfClusters>0:
+                progress.pushInfo(self.tr("Automatic selection of the number of "+ \
+                                          "clusters not used for a warm start"))
+                MaxNumberOfClusters = 0
+            if Restarts>1:
+                progress.pushInfo(self.tr("Restarts not used for a warm start"))
+                Restarts = 1
+
+        # transform all points once into a local equidistant projection
+        transform = None
+        if Distance_Method==4 and len(points)>0:
+            local_crs = self.local_projection(points,sRs,context)
+            progress.pushInfo(self.tr("Points projected to {}".format(local_crs.toProj())))
+            transform = QgsCoordinateTransform(sRs,local_crs,context.transformContext())
+            self.transform_points(points,transform)
+            if centroids is not None:
+                self.transform_points(centroids,transform)
+            d = QgsDistanceArea()
+            d.setSourceCrs(local_crs, context.transformContext())
+            d.setEllipsoid("NONE")
 
         if NumberOfClusters>len(points):
             raise QgsProcessingException("Too little valid points "+ \
                                     "available for {} clusters".format(NumberOfClusters))
 
+        # compare great circle distances with QgsDistanceArea on a sample
+        if method in ("haversine","lambert") and d.willUseEllipsoid():
+            progress.pushInfo(self.tr("Maximum relative deviation from ellipsoidal "+ \
+                                      "distances on a sample: {:.4%}".format(
+                                      self.check_distance_error(points,d,method))))
+
         # standardize z values with standard deviation of horizontal distances
         if PercentAttrib>0:
             for j in range(len(AttribValues)):
-                if len(set([p.attributes[j] for p in points.values()]))==1:
+                if (points.attributes[:,j]==points.attributes[0,j]).all():
                     raise QgsProcessingException("Field {} must not be constant".format(AttribValues[j])) 
-            standard_factor = self.compute_sd_distance(points,d,Distance_Type==1,False)/ \
-                              self.compute_sd_distance(points,d,Distance_Type==1,True)
-            attr_centers = [] 
-            for j in range(len(AttribValues)):
-                attr_centers.append(fsum([p.attributes[j] for p in points.values()])/len(points))
-            for key in points.keys():
-                points[key].replaceAttributes([(points[key].attributes[j]-attr_centers[j]) \
-                                              *standard_factor for j in range(len(AttribValues))])
+            standard_factor = self.compute_sd_distance(points,d,Distance_Type==1,False,method)/ \
+                              self.compute_sd_distance(points,d,Distance_Type==1,True,method)
+            attr_centers = [fsum(points.weights*points.attributes[:,j])/fsum(points.weights) \
+                            for j in range(len(AttribValues))]
+            points.attributes -= attr_centers
+            points.attributes *= standard_factor
+            if centroids is not None:
+                centroids.attributes -= attr_centers
+                centroids.attributes *= standard_factor
+
+        # merge duplicate or co-located points into weighted representatives
+        all_fids = points.fids
+        if streaming:
+            merged_rows = arange(len(points))
+        else:
+            points,merged_rows = points.merge_duplicates(MergeTolerance)
+        if len(points)<len(all_fids):
+            progress.pushInfo(self.tr("Merged {} points into ".format(len(all_fids))+ \
+                                      "{} weighted representatives".format(len(points))))
+            if NumberOfClusters>len(points):
+                raise QgsProcessingException("Too little distinct points "+ \
+                                        "available for {} clusters".format(NumberOfClusters))
+
+        # evaluate a range of numbers of clusters on the same points
+        k_range = None
+        if MaxNumberOfClusters>NumberOfClusters and not streaming:
+            k_range = range(NumberOfClusters,min(MaxNumberOfClusters,len(points))+1)
+            progress.pushInfo(self.tr("Selecting the number of clusters between "+ \
+                                      "{} and {}".format(k_range[0],k_range[-1])))
+        elif MaxNumberOfClusters>NumberOfClusters:
+            progress.pushInfo(self.tr("Automatic selection of the number of "+ \
+                                      "clusters not used for streaming K-Means"))
 
         # define the clustering procedure
         if Cluster_Type==0:
         
             if parameters['Linkage'] is not None:
                 progress.pushInfo(self.tr("Linkage not used for K-Means"))
-            # K-means clustering
-            progress.pushInfo(self.tr("Processing K-Means clustering "+
-                                      "with {} points ...".format(len(points))))      
-            task = ClusterTask("K-Means clustering", \
-                               None,points,PercentAttrib, \
-                               NumberOfClusters,d,Distance_Type==1)
+            if KMeans_Method==3 and (method is not None or d.willUseEllipsoid()):
+                progress.pushInfo(self.tr("Kd-tree filtering requires planar distances, "+ \
+                                          "using Lloyd iterations instead"))
+                KMeans_Method = 0
+            if streaming:
+                # streaming K-means clustering with chunks read anew for every pass
+                if Restarts>1 or CoresetSize>0:
+                    progress.pushInfo(self.tr("Restarts and coreset not used for "+ \
+                                              "streaming K-Means"))
+                standardization = (attr_centers,standard_factor) if PercentAttrib>0 else None
+                chunks = lambda: (self.chunk_points(chunk,id_attr,id_weight,transform, \
+                                                    standardization) \
+                                  for chunk in self.read_chunks(source,request,ChunkSize))
+                progress.pushInfo(self.tr("Processing streaming K-Means clustering "+
+                                          "in chunks of {} features ...".format(ChunkSize)))
+                task = ClusterTask("K-Means clustering (streaming)", \
+                                   None,points,PercentAttrib, \
+                                   NumberOfClusters,d,Distance_Type==1,method=method, \
+                                   kmeans_method="streaming", \
+                                   init_method=init_methods[Initialization], \
+                                   max_iterations=MaxIterations, \
+                                   tolerance=Tolerance, centroids=centroids, \
+                                   chunks=chunks)
+            else:
+                # K-means clustering
+                progress.pushInfo(self.tr("Processing K-Means clustering "+
+                                          "with {} points ...".format(len(points))))      
+                task = ClusterTask("K-Means clustering", \
+                                   None,points,PercentAttrib, \
+                                   NumberOfClusters,d,Distance_Type==1,method=method,
+                                   kmeans_method=kmeans_methods[KMeans_Method], \
+                                   batch_size=BatchSize, \
+                                   init_method=init_methods[Initialization], \
+                                   restarts=Restarts, max_iterations=MaxIterations, \
+                                   tolerance=Tolerance, centroids=centroids, \
+                                   coreset_size=CoresetSize,k_range=k_range)
         
         elif Cluster_Type==1:
         
@@ -262,7 +554,11 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
                                       "with {} points ...".format(len(points))))      
             task = ClusterTask("Fuzzy C-Means clustering", \
                                None,points,PercentAttrib, \
-                               NumberOfClusters,d,Distance_Type==1,Fuzzifier)
+                               NumberOfClusters,d,Distance_Type==1,Fuzzifier,method=method, \
+                               init_method=init_methods[Initialization], \
+                               max_iterations=MaxIterations,tolerance=Tolerance, \
+                               centroids=centroids,coreset_size=CoresetSize, \
+                               k_range=k_range,top_memberships=TopMemberships)
                 
         else:
         
@@ -273,16 +569,27 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
                                              " Ward\'s or Centroid")
             progress.pushInfo(self.tr("Processing hierarchical clustering "+
                                       "with {} points ...".format(len(points))))      
-            if Linkage==0:
+            if Linkage==7 and (method is not None or d.willUseEllipsoid()):
+                progress.pushInfo(self.tr("Minimum spanning tree requires planar distances, "+ \
+                                          "using SLINK instead"))
+                Linkage = 0
+            if Linkage==7:
+                task = ClusterTask("Hierarchical clustering using a minimum spanning tree", \
+                                   links[Linkage],points,PercentAttrib, \
+                                   NumberOfClusters,d,Distance_Type==1,method=method, \
+                                   k_range=k_range)
+            elif Linkage==0:
                 task = ClusterTask("Hierarchical clustering using SLINK", \
                                    links[Linkage],points,PercentAttrib, \
-                                   NumberOfClusters,d,Distance_Type==1)             
+                                   NumberOfClusters,d,Distance_Type==1,method=method, \
+                                   k_range=k_range)
             else:
                 if AggregationPercentile>0:
                     task_add = CFTask("BIRCH-like preprocessing", points,
                                             AggregationPercentile, d=d,
                                             pa=PercentAttrib,
-                                            manhattan=(Distance_Type==1))
+                                            manhattan=(Distance_Type==1),
+                                            method=method)
                     
                     # run potentially expensive preparation in extra task
                     QgsApplication.taskManager().addTask(task_add)
@@ -298,12 +605,14 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
                     task_add.finished(task_add.result)
                     
                     if progress.isCanceled():
-                        cf_data = {}
+                        cf_data = points.subset([])
                     else:
                         cf_data = task_add.return_centroids()
                         if NumberOfClusters>len(cf_data):
                              raise QgsProcessingException("Too little valid cluster features "+ \
                                  "available for {} clusters".format(NumberOfClusters))
+                        if k_range is not None:
+                            k_range = range(NumberOfClusters,min(k_range[-1],len(cf_data))+1)
 
                     progress.pushInfo(self.tr("Processing hierarchical clustering "+
                                       "with {} cluster features ...".format(len(cf_data))))                    
@@ -312,7 +621,8 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
                 task = ClusterTask("Hierarchical clustering using "+ \
                                    "Lance-Williams distance updates", \
                                    links[Linkage],cf_data,PercentAttrib, \
-                                   NumberOfClusters,d,Distance_Type==1)
+                                   NumberOfClusters,d,Distance_Type==1,method=method, \
+                                   k_range=k_range)
         
         # run potentially expensive clustering in extra task
         QgsApplication.taskManager().addTask(task)
@@ -329,6 +639,55 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
 
         if "Lance-Williams" in task.description() and AggregationPercentile>0:
             task.clusters = [task_add.return_members(cluster) for cluster in task.clusters]
+
+        # add a table with the scores for every evaluated number of clusters
+        if len(task.scores)>0:
+            progress.pushInfo(self.tr("Selected {} clusters with the highest ".format(task.k)+ \
+                                      "silhouette coefficient"))
+            QgsProject.instance().addMapLayer(self.score_table(task.scores))
+
+        # expand clusters of representatives to all merged points
+        if len(points)<len(all_fids):
+            labels = empty(len(points),dtype=int)
+            for idx,cluster in enumerate(task.clusters):
+                labels[points.rows(cluster)] = idx
+            labels = labels[merged_rows]
+            task.clusters = [all_fids[labels==idx].tolist() for idx in range(len(task.clusters))]
+        representative_fids = points.fids
+
+        # save final centroids with original coordinates and attribute values
+        if ModelOutput and Cluster_Type<2 and task.centroids is not None:
+            centroids = PointStore(task.centroids.fids,task.centroids.x.copy(), \
+                                   task.centroids.y.copy(),task.centroids.attributes.copy())
+            if PercentAttrib>0:
+                centroids.attributes /= standard_factor
+                centroids.attributes += attr_centers
+            if transform is not None:
+                self.transform_points(centroids,transform,reverse=True)
+            self.write_model(ModelOutput,centroids,fields,sRs)
+            progress.pushInfo(self.tr("Final centroids written to {}".format(ModelOutput)))
+
+        # write the labels to the output layer with a second streaming pass
+        if streaming:
+            dest_id = None
+            if task.centroids is not None:
+                progress.pushInfo(self.tr("Writing output field Cluster_ID"))
+                out_fields = QgsFields()
+                for field in vlayer.fields():
+                    if field.name()!="Cluster_ID":
+                        out_fields.append(field)
+                out_fields.append(QgsField("Cluster_ID",QVariant.Int))
+                sink,dest_id = self.parameterAsSink(parameters,self.Output,context,out_fields, \
+                                                    vlayer.wkbType(),sRs)
+                if sink is None:
+                    raise QgsProcessingException("Streaming K-Means requires "+ \
+                                                 "an output layer for Cluster_ID")
+                self.write_labels(sink,out_fields,vlayer,request,ChunkSize,task,id_attr, \
+                                  id_weight,transform,standardization,progress)
+            progress.setProgress(100)
+            return {self.Output:dest_id,self.Iterations:task.iterations,
+                    self.FinalShift:task.shift,self.ModelOutput:ModelOutput,
+                    self.SelectedNumberOfClusters:task.k}
                 
         del points
 
@@ -354,8 +713,8 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
         for key in cluster_id.keys():
             vlayer_new.dataProvider().changeAttributeValues({key:{icl:cluster_id[key]}})
 
-        # output cluster weights for Fuzzy C-Means as string
-        if "Fuzzy C-Means" in task.description():
+        # output cluster weights for Fuzzy C-Means as string (not for failed tasks)
+        if "Fuzzy C-Means" in task.description() and task.weights is not None:
             if "Cluster_%" in [field.name() for field in fieldList]:
                 icl = fieldList.indexFromName("Cluster_%")
                 vlayer_new.dataProvider().deleteAttributes([icl])
@@ -366,17 +725,26 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
             fieldList = vlayer_new.dataProvider().fields()
             icl = fieldList.indexFromName("Cluster_%")
             fuzzifier_reverse = 1.0/Fuzzifier
-            for key in cluster_id.keys():
-                vlayer_new.dataProvider().changeAttributeValues({key:{icl: \
-                    ",".join(map(str,[round(100* \
-                    task.weights[i][key]**fuzzifier_reverse,2) \
-                    for i in range(len(task.weights))]))}})
+            keys = list(cluster_id.keys())
+            rows = self.merged_rows_of(all_fids,merged_rows,keys).tolist()
+            if task.sparse(task.k):
+                # largest memberships as pairs of cluster and percentage
+                clusters,weights = task.weights
+                for key,row in zip(keys,rows):
+                    vlayer_new.dataProvider().changeAttributeValues({key:{icl: \
+                        ",".join(["{}:{}".format(i,round(100*weight**fuzzifier_reverse,2)) \
+                        for i,weight in zip(clusters[row].tolist(),weights[row].tolist())])}})
+            else:
+                for key,row in zip(keys,rows):
+                    vlayer_new.dataProvider().changeAttributeValues({key:{icl: \
+                        ",".join(map(str,[round(100*weight**fuzzifier_reverse,2) \
+                        for weight in task.weights[:,row].tolist()]))}})
             
         # optionally output cluster feature membership here
         if verbose and "Lance-Williams" in task.description() and AggregationPercentile>0:
         
             cf_id = {}
-            for idx,cf in enumerate([task_add.return_members([j]) for j in cf_data.keys()]):
+            for idx,cf in enumerate([task_add.return_members([j]) for j in range(len(cf_data))]):
                 for key in cf:
                     cf_id[key] = idx
 
@@ -389,12 +757,16 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
 
             fieldList = vlayer_new.dataProvider().fields()
             icl = fieldList.indexFromName("CF_ID")
-            for key in cluster_id.keys():
-                vlayer_new.dataProvider().changeAttributeValues({key:{icl:cf_id[key]}})
+            keys = list(cluster_id.keys())
+            rows = self.merged_rows_of(all_fids,merged_rows,keys)
+            for key,fid in zip(keys,representative_fids[rows].tolist()):
+                vlayer_new.dataProvider().changeAttributeValues({key:{icl:cf_id[fid]}})
 
         progress.setProgress(100)
         
-        return {self.Points:"Cluster_ID"}
+        return {self.Points:"Cluster_ID",self.Iterations:task.iterations,
+                self.FinalShift:task.shift,self.ModelOutput:ModelOutput,
+                self.SelectedNumberOfClusters:task.k}
 
     def name(self):
         """
@@ -436,25 +808,208 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
     def createInstance(self):
         return ClusterPointsAlgorithm()
     
-    def compute_sd_distance(self, points, d, manhattan=False, attrib=False):
+    def compute_sd_distance(self, points, d, manhattan=False, attrib=False, method=None):
         """
         Computes standard deviation of distances for points 
-        (either Euclidean or Manhattan)
-        """
-        centerpoint = QgsGeometry.fromPolyline(points.values()).centroid().asPoint()
-        centerpoint = Cluster_point(centerpoint)
-        for j in range(list(points.values())[0].attr_size):
-                    centerpoint.addAttribute(fsum([p.attributes[j] \
-                                         for p in points.values()])/len(points))        
-        cluster = KMCluster(points.keys(),centerpoint,d,0,manhattan)
-        sd = []
+        (either Euclidean or Manhattan, weighted for weighted points)
+        """
+        engine = DistanceEngine(d,0,manhattan,method)
+        w = points.weights
         if attrib:
-            for p in points.values():
-                sd.append(cluster.attrDistance2center(p))
+            centerattr = [[fsum(w*points.attributes[:,j])/fsum(w) \
+                           for j in range(points.attr_size)]]
+            sd = engine.attribute(centerattr,points.attributes)[0]
         else:
-            for p in points.values():
-                sd.append(cluster.distance2center(p))
-        return fsum(sd)/len(sd)
+            # weighted mean position (the plain mean for unit weights)
+            sd = engine.spatial([fsum(w*points.x)/fsum(w)],[fsum(w*points.y)/fsum(w)], \
+                                points.x,points.y)[0]
+        return fsum(w*sd)/fsum(w)
+
+    def local_projection(self, points, crs, context):
+        """
+        Returns an azimuthal equidistant projection centred on the mean
+        position of the points
+        """
+        wgs84 = QgsCoordinateReferenceSystem("EPSG:4326")
+        center = QgsPointXY(fsum(points.x)/len(points),fsum(points.y)/len(points))
+        center = QgsCoordinateTransform(crs,wgs84,context.transformContext()).transform(center)
+        return QgsCoordinateReferenceSystem.fromProj("+proj=aeqd "+ \
+                   "+lat_0={:.6f} +lon_0={:.6f} ".format(center.y(),center.x())+ \
+                   "+x_0=0 +y_0=0 +datum=WGS84 +units=m +no_defs")
+
+    def transform_points(self, points, transform, reverse=False):
+        """
+        Transforms the coordinates of a point store in place
+        """
+        direction = QgsCoordinateTransform.ReverseTransform if reverse else \
+                    QgsCoordinateTransform.ForwardTransform
+        for i in range(len(points)):
+            p = transform.transform(QgsPointXY(points.x[i],points.y[i]),direction)
+            points.x[i] = p.x()
+            points.y[i] = p.y()
+
+    def read_centroids(self, layer, model_file, fields, crs, context):
+        """
+        Returns the centroids of a point layer or of a model file written
+        by a previous run with coordinates in crs and raw attribute values
+        """
+        if layer is not None:
+            id_attr = [layer.fields().indexFromName(field) for field in fields]
+            for field,i in zip(fields,id_attr):
+                if i<0:
+                    raise QgsProcessingException(
+                              "Field {} not found in centroid layer".format(field))
+            centroids = PointStore.from_features(layer.getFeatures(),id_attr)
+            source = layer.crs()
+        else:
+            with open(model_file) as f:
+                model = json.load(f)
+            if model["fields"]!=list(fields):
+                raise QgsProcessingException("Model file requires attribute "+ \
+                                             "fields {}".format(model["fields"]))
+            values = array(model["centroids"],dtype=float).reshape(-1,2+len(fields))
+            centroids = PointStore(arange(len(values)),values[:,0],values[:,1],values[:,2:])
+            source = QgsCoordinateReferenceSystem.fromWkt(model["crs"])
+        if source!=crs:
+            self.transform_points(centroids,QgsCoordinateTransform(source,crs, \
+                                  context.transformContext()))
+        return centroids
+
+    def write_model(self, path, centroids, fields, crs):
+        """
+        Writes centroids with their CRS and attribute fields to a JSON model file
+        """
+        model = {"crs": crs.toWkt(), "fields": list(fields),
+                 "centroids": [[float(centroids.x[i]),float(centroids.y[i])]+ \
+                               centroids.attributes[i].tolist() for i in range(len(centroids))]}
+        with open(path,"w") as f:
+            json.dump(model,f,indent=1)
+
+    def check_weights(self, points, field):
+        """
+        Raises an exception for point weights that are not positive
+        """
+        if (points.weights<=0).any():
+            raise QgsProcessingException("Field {} must only contain ".format(field)+ \
+                                         "positive weights")
+
+    def merged_rows_of(self, all_fids, merged_rows, fids):
+        """
+        Rows of the representatives of the given feature IDs, looked up in
+        the feature IDs before merging (aligned with merged_rows)
+        """
+        order = argsort(all_fids,kind='stable')
+        return merged_rows[order[searchsorted(all_fids,fids,sorter=order)]]
+
+    def read_chunks(self, source, request, size):
+        """
+        Iterates over the features of a feature source in lists of at most size features
+        """
+        features = source.getFeatures(request)
+        while True:
+            chunk = list(islice(features,size))
+            if len(chunk)==0:
+                return
+            yield chunk
+
+    def chunk_points(self, features, id_attr, id_weight, transform=None, standardization=None):
+        """
+        Returns the point store of a chunk of features with coordinates
+        transformed and attributes standardized like the sample
+        """
+        points = PointStore.from_features(features,id_attr,id_weight)
+        if transform is not None:
+            self.transform_points(points,transform)
+        if standardization is not None:
+            attr_centers,standard_factor = standardization
+            points.attributes -= attr_centers
+            points.attributes *= standard_factor
+        return points
+
+    def sample_points(self, chunks, id_attr, id_weight, size, weight_field):
+        """
+        Returns a uniform random sample of at most size valid points read
+        chunk by chunk (keeping the points with the smallest random keys)
+        and the total number of valid points
+        """
+        rng = default_rng(random.getrandbits(32))
+        sample = PointStore([],[],[],empty((0,len(id_attr))))
+        keys = empty(0)
+        count = 0
+        for chunk in chunks:
+            points = PointStore.from_features(chunk,id_attr,id_weight)
+            self.check_weights(points,weight_field)
+            count += len(points)
+            sample = PointStore.concatenate([sample,points])
+            keys = concatenate((keys,rng.random(len(points))))
+            if len(sample)>size:
+                keep = sort(argpartition(keys,size)[:size])
+                sample = sample.subset(keep)
+                keys = keys[keep]
+        return sample,count
+
+    def write_labels(self, sink, fields, layer, request, size, task, id_attr, id_weight,
+                     transform, standardization, progress):
+        """
+        Writes the features of the input layer chunk by chunk to the sink
+        with the output field Cluster_ID for the closest final centroid
+        (NULL for features skipped for missing values)
+        """
+        keep = [i for i,field in enumerate(layer.fields()) if field.name()!="Cluster_ID"]
+        centroids = task.centroids
+        source = QgsVectorLayerFeatureSource(layer)
+        for chunk in self.read_chunks(source,request,size):
+            if progress.isCanceled():
+                break
+            points = self.chunk_points(chunk,id_attr,id_weight,transform,standardization)
+            labels,_ = task.engine.nearest(points.x,points.y,points.a, \
+                                           centroids.x,centroids.y,centroids.a)
+            label = dict(zip(points.fids.tolist(),labels.tolist()))
+            features = []
+            for infeat in chunk:
+                feature = QgsFeature(fields)
+                feature.setGeometry(infeat.geometry())
+                attributes = infeat.attributes()
+                feature.setAttributes([attributes[i] for i in keep]+[label.get(infeat.id())])
+                features.append(feature)
+            sink.addFeatures(features,QgsFeatureSink.FastInsert)
+
+    def score_table(self, scores):
+        """
+        Returns a memory table with the scores for every number of clusters
+        """
+        table = QgsVectorLayer("None","Cluster scores","memory")
+        table.dataProvider().addAttributes([QgsField("k",QVariant.Int),
+                                            QgsField("inertia",QVariant.Double),
+                                            QgsField("silhouette",QVariant.Double),
+                                            QgsField("calinski_harabasz",QVariant.Double)])
+        table.updateFields()
+        features = []
+        for score in scores:
+            feature = QgsFeature(table.fields())
+            feature.setAttributes([score["k"],score["inertia"],score["silhouette"],
+                                   score["calinski_harabasz"]])
+            features.append(feature)
+        table.dataProvider().addFeatures(features)
+        return table
+
+    def check_distance_error(self, points, d, method, sample_size=100):
+        """
+        Computes the maximum relative deviation of vectorized great circle
+        distances from QgsDistanceArea measurements for random point pairs
+        """
+        sampler = random.Random(sample_size)
+        pairs = [sampler.sample(range(len(points)),2) for i in range(sample_size)]
+        engine = DistanceEngine(d,0,False,method)
+        deviation = 0.0
+        for p1,p2 in pairs:
+            reference = d.measureLine(QgsPointXY(points.x[p1],points.y[p1]), \
+                                      QgsPointXY(points.x[p2],points.y[p2]))
+            if reference > 0:
+                approximation = engine.spatial(points.x[p1:p1+1],points.y[p1:p1+1], \
+                                               points.x[p2:p2+1],points.y[p2:p2+1])[0,0]
+                deviation = max(deviation,abs(approximation-reference)/reference)
+        return deviation
 
 
 
@@ -462,7 +1017,11 @@ class ClusterPointsAlgorithm(QgsProcessingAlgorithm):
 
 class ClusterTask(QgsTask):
 
-    def __init__(self, description, link, points, pa, k, d, manhattan=False,fuzzifier=2.0):
+    def __init__(self, description, link, points, pa, k, d, manhattan=False,fuzzifier=2.0,
+                 method=None, kmeans_method="lloyd", batch_size=1024,
+                 init_method="plusplus", restarts=1, max_iterations=300, tolerance=0.0,
+                 centroids=None, coreset_size=0, chunks=None, k_range=None,
+                 top_memberships=0):
         super().__init__(description, QgsTask.CanCancel)
         self.link = link
         self.points = points
@@ -470,7 +1029,25 @@ class ClusterTask(QgsTask):
         self.k = k
         self.d = d
         self.manhattan = manhattan
+        self.engine = DistanceEngine(d,pa,manhattan,method)
         self.m = fuzzifier
+        self.kmeans_method = kmeans_method
+        self.batch_size = batch_size
+        self.init_method = init_method
+        self.restarts = restarts
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.initial = centroids
+        self.coreset_size = coreset_size
+        self.chunks = chunks
+        self.k_range = k_range
+        self.top = top_memberships
+        self.candidates = {}
+        self.scores = []
+        self.centroids = None
+        self.weights = None
+        self.iterations = 0
+        self.shift = 0.0
         self.clusters = []
         self.tree_progress = 0
         
@@ -488,14 +1065,21 @@ class ClusterTask(QgsTask):
     
         QgsMessageLog.logMessage(self.description(),MESSAGE_CATEGORY, Qgis.Info)
         if self.description().startswith("K-Means"):
-            self.result = self.kmeans()
+            if "streaming" in self.description():
+                self.result = self.kmeans_stream()
+            else:
+                self.result = self.kmeans()
         elif self.description().startswith("Fuzzy C-Means"):
             self.result = self.fuzzy_cmeans()
         elif self.description().startswith("Hierarchical"):
             if "SLINK" in self.description():
                 self.result = self.hcluster_slink()
+            elif "spanning tree" in self.description():
+                self.result = self.hcluster_mst()
             else:
                 self.result = self.hcluster()
+        if self.result and self.k_range is not None:
+            self.result = self.select_k()
         return self.result
 
     def finished(self,result):
@@ -510,343 +1094,445 @@ class ClusterTask(QgsTask):
              QgsMessageLog.logMessage(self.tr("Execution of clustering task failed"),
                        MESSAGE_CATEGORY, Qgis.Critical)
 
-    def init_kmeans_plusplus(self):
+    def select_k(self):
         """
-        Initializes the K-means algorithm according to
-        Arthur, D. and Vassilvitskii, S. (2007)
-        Referred to as K-means++
+        Scores the clusterings for all numbers of clusters and keeps
+        the one with the highest silhouette coefficient
         """
-        
-        keys = list(self.points.keys())
-        
-        # draw first point randomly from dataset with uniform weights
-        p = random.choice(keys)
-        inits = [KMCluster(set([p]),self.points[p], self.d, self.pa, self.manhattan)]
-        
-        # loop until k points were found
-        while len(inits)<self.k:
-            # define new probability weights for sampling
-            weights = [min([inits[i].distance2center(self.points[p]) \
-                       for i in range(len(inits))]) for p in keys]
-            # draw new point randomly with probability weights
-            p = random.uniform(0,sum(weights)-float_info.epsilon)
-            p = bisect([sum(weights[:i+1]) for i in range(len(weights))],p)
-            p = keys[p]
-            inits.append(KMCluster(set([p]),self.points[p], self.d, self.pa, self.manhattan))
-            
-        return inits
+
+        scorer = ClusterScores(self.engine,self.points,rng=default_rng(random.getrandbits(32)))
+        for k in sorted(self.candidates):
+            if self.isCanceled():
+                return False
+            candidate = self.candidates[k]
+            labels = candidate.get("labels")
+            if labels is None:
+                labels = empty(len(self.points),dtype=int)
+                for i,cluster in enumerate(candidate["clusters"]):
+                    labels[self.points.rows(cluster)] = i
+            self.scores.append(scorer.scores(labels,k))
+            QgsMessageLog.logMessage(self.tr("{} clusters: sum of distances {:.6g}, ".format(
+                                     k,self.scores[-1]["inertia"])+ \
+                                     "silhouette {:.4f}, Calinski-Harabasz {:.6g}".format(
+                                     self.scores[-1]["silhouette"],
+                                     self.scores[-1]["calinski_harabasz"])),
+                                     MESSAGE_CATEGORY, Qgis.Info)
+
+        best = ClusterScores.best(self.scores)
+        QgsMessageLog.logMessage(self.tr("Selected {} clusters with the ".format(best)+ \
+                                 "highest silhouette coefficient"),
+                                 MESSAGE_CATEGORY, Qgis.Success)
+        self.use_candidate(best)
+        return True
+
+    def use_candidate(self, k):
+        """
+        Takes over the clustering computed for k clusters
+        """
+
+        candidate = self.candidates[k]
+        self.k = k
+        if candidate.get("labels") is not None:
+            labels = candidate["labels"]
+            self.clusters = [self.points.fids[labels==i].tolist() for i in range(k)]
+        else:
+            self.clusters = candidate["clusters"]
+        self.centroids = candidate.get("centroids")
+        self.iterations = candidate.get("iterations",0)
+        self.shift = candidate.get("shift",0.0)
+        if "weights" in candidate:
+            self.weights = candidate["weights"]
+
+    def init_centroids(self, points, sampler=random, k=None):
+        """
+        Returns the row indices of the initial centroids drawn
+        with K-means++ or K-means||
+        """
+
+        k = self.k if k is None else k
+        if self.init_method=="parallel":
+            return kmeans_parallel(self.engine,points,k,sampler)
+        return kmeans_plusplus(self.engine,points,k,sampler)
+
+    def init_message(self):
+        if self.initial is not None:
+            return "Starting from {} given centroids".format(len(self.initial))
+        return "Initializing clusters with {}".format(
+            "K-means||" if self.init_method=="parallel" else "K-means++")
+
+    def coreset(self):
+        """
+        Returns a weighted coreset of the points drawn by sensitivity
+        sampling if a coreset size smaller than the number of points
+        is requested, otherwise all points
+        """
+
+        if self.coreset_size<=0 or self.coreset_size>=len(self.points):
+            return self.points
+        k = max(self.k_values())
+        coreset = sensitivity_coreset(self.engine,self.points,k,self.coreset_size,random)
+        if len(coreset)<k:
+            QgsMessageLog.logMessage(self.tr("Coreset too small for "+ \
+                                     "{} clusters, using all points".format(k)),
+                                     MESSAGE_CATEGORY, Qgis.Warning)
+            return self.points
+        QgsMessageLog.logMessage(self.tr("Clustering a coreset of {} ".format(len(coreset))+ \
+                                 "weighted points instead of {} points".format(
+                                 len(self.points))),
+                                 MESSAGE_CATEGORY, Qgis.Info)
+        return coreset
+
+    def k_values(self):
+        """
+        Returns the numbers of clusters to compute
+        """
+        return [self.k] if self.k_range is None else list(self.k_range)
 
     def kmeans(self):
 
         # Set cut-off distance for termination of iterations
-        cutoff=1.e6*float_info.epsilon
+        cutoff=max(self.tolerance,1.e6*float_info.epsilon)
 
-        # Create k clusters using the K-means++ initialization method
-        QgsMessageLog.logMessage(self.tr(
-            "Initializing clusters with K-means++"),
+        # cluster a weighted coreset instead of all points if requested
+        points = self.coreset()
+
+        # derive an independent random sequence for every restart
+        # and number of clusters
+        jobs = [k for k in self.k_values() for i in range(self.restarts)]
+        if len(jobs)>1:
+            samplers = [random.Random(random.getrandbits(32)) for k in jobs]
+        else:
+            samplers = [random]
+
+        QgsMessageLog.logMessage(self.tr(self.init_message()+ \
+            " for {} restart(s)".format(self.restarts)),
             MESSAGE_CATEGORY, Qgis.Info)
-        clusters = self.init_kmeans_plusplus()
+        results = run_restarts(lambda i,canceled: self.kmeans_run(points,samplers[i],
+                                                                  cutoff,canceled,jobs[i]),
+                               len(jobs),self.isCanceled,self.restart_workers())
+        if results is None or None in results:
+            return False
+
+        for k in self.k_values():
+            if self.k_range is not None:
+                QgsMessageLog.logMessage(self.tr("Results for {} clusters".format(k)),
+                                         MESSAGE_CATEGORY, Qgis.Info)
+            candidate = self.kmeans_best(points,[result for result,job in \
+                                         zip(results,jobs) if job==k],k,cutoff)
+            if candidate is not None:
+                self.candidates[k] = candidate
+
+        if len(self.candidates)==0:
+            QgsMessageLog.logMessage(self.tr("Algorithm failed: Choose a "+ \
+                                     "different random seed or "+ \
+                                     "a smaller number of clusters"),
+                                     MESSAGE_CATEGORY, Qgis.Critical)
+            return False
+        if self.k_range is None:
+            self.use_candidate(self.k)
+        return True
+
+    def kmeans_best(self, points, results, k, cutoff):
+        """
+        Returns the labels of all points, the centroids and the iteration
+        statistics of the restart with the smallest sum of distances
+        (None if all restarts failed)
+        """
+
+        for i,result in enumerate(results):
+            if result["labels"] is None:
+                QgsMessageLog.logMessage(self.tr("Restart {} failed after ".format(i+1)+ \
+                                         "{} iterations due to an empty cluster".format(
+                                         result["iterations"])),
+                                         MESSAGE_CATEGORY, Qgis.Warning)
+            else:
+                QgsMessageLog.logMessage(self.tr("Restart {}: sum of distances ".format(i+1)+ \
+                                         "{:.6g} after {} iterations".format(
+                                         result["inertia"],result["iterations"])),
+                                         MESSAGE_CATEGORY, Qgis.Info)
+
+        valid = [result for result in results if result["labels"] is not None]
+        if len(valid)==0:
+            return None
+        best = min(valid,key=lambda result: result["inertia"])
+        iterations = best["iterations"]
+
+        if best["converged"]:
+            QgsMessageLog.logMessage(self.tr(
+                "Converged after {} iterations").format(iterations),
+                MESSAGE_CATEGORY, Qgis.Success)
+        else:
+            QgsMessageLog.logMessage(self.tr(
+                "Stopped after {} iterations with a ".format(iterations)+ \
+                "final centroid shift of {:.6g}".format(best["shift"])),
+                MESSAGE_CATEGORY, Qgis.Warning)
+        if best["repairs"]>0:
+            QgsMessageLog.logMessage(self.tr(
+                "Re-seeded empty clusters {} times".format(best["repairs"])),
+                MESSAGE_CATEGORY, Qgis.Info)
+        total = iterations*len(points)*k
         QgsMessageLog.logMessage(self.tr(
-            "{} clusters successfully initialized".format(self.k)),
+            "Skipped {} of {} distance evaluations ({:.1%})").format(
+            total-best["evaluations"],total,1.0-best["evaluations"]/total),
             MESSAGE_CATEGORY, Qgis.Info)
     
-        # Loop through the dataset until the clusters stabilize
-        loopCounter = 0
-        while True:
+        labels = best["labels"]
+        if points is not self.points:
+            # assign all points to the centroids of the coreset in a single pass
+            assignment = LloydKMeans(self.engine,cutoff)
+            labels,dist = assignment.assign(self.points,best["centroids"])
+            inertia = float((self.points.weights*dist).sum())
+            assignment.repair(self.points,best["centroids"],labels,dist)
+            QgsMessageLog.logMessage(self.tr("Sum of distances {:.6g} for all points, ".format(
+                                     inertia)+"estimated on the coreset with a relative "+ \
+                                     "error of {:.2%}".format(
+                                     abs(best["inertia"]-inertia)/inertia if inertia>0 else 0.0)),
+                                     MESSAGE_CATEGORY, Qgis.Info)
+        return {"labels": labels, "centroids": best["centroids"],
+                "iterations": iterations, "shift": best["shift"]}
+
+    def kmeans_stream(self):
+        """
+        K-Means on chunks of points read anew for every pass over the
+        layer, initialized on the random sample of points
+        """
 
-            if self.isCanceled():
-                return False
+        # Set cut-off distance for termination of iterations
+        cutoff=max(self.tolerance,1.e6*float_info.epsilon)
 
-            # Create a list of lists to hold the points in each cluster
-            setList = [set() for i in range(self.k)]
-        
-            # Start counting loops
-            loopCounter += 1
+        QgsMessageLog.logMessage(self.tr(self.init_message()),
+            MESSAGE_CATEGORY, Qgis.Info)
+        if self.initial is not None:
+            initial = self.initial
+        else:
+            initial = self.points.subset(self.init_centroids(self.points))
+
+        # Loop through the chunks until the clusters stabilize
+        engine = StreamingKMeans(self.engine,cutoff,self.isCanceled,self.max_iterations)
+        centroids = engine.fit(self.chunks,initial)
+        if centroids is None:
+            return False
+        self.iterations = engine.iterations
+        self.shift = engine.shift
+        self.centroids = centroids
+
+        if engine.converged:
+            QgsMessageLog.logMessage(self.tr(
+                "Converged after {} passes over all features").format(self.iterations),
+                MESSAGE_CATEGORY, Qgis.Success)
+        else:
+            QgsMessageLog.logMessage(self.tr(
+                "Stopped after {} passes over all features with a ".format(self.iterations)+ \
+                "final centroid shift of {:.6g}".format(self.shift)),
+                MESSAGE_CATEGORY, Qgis.Warning)
+        return True
 
-            # For every point in the dataset ...
-            for p in list(self.points.keys()):
-                # Get the distance between that point and the all the cluster centroids
-                smallest_distance = float_info.max
-        
-                for i in range(self.k):
-                    distance = clusters[i].distance2center(self.points[p])
-                    if distance < smallest_distance:
-                        smallest_distance = distance
-                        clusterIndex = i
-                setList[clusterIndex].add(p)
-        
-            # Set biggest_shift to zero for this iteration
-            biggest_shift = 0.0
-        
-            for i in range(self.k):
-                # Calculate new centroid coordinates
-                numPoints = len(setList[i])
-                if numPoints == 0:
-                    QgsMessageLog.logMessage(self.tr("Algorithm failed after "+ \
-                                             "{} iterations: Choose a ".format(loopCounter)+ \
-                                             "different random seed or "+ \
-                                             "a smaller number of clusters"),
-                                             MESSAGE_CATEGORY, Qgis.Critical)
-                    return False
-                centerpoint = QgsGeometry.fromPolyline([self.points[p] \
-                                         for p in setList[i]]).centroid().asPoint()
-                centerpoint = Cluster_point(centerpoint)
-                for j in range(clusters[i].centerpoint.attr_size):
-                    centerpoint.addAttribute(sum([self.points[p].attributes[j] \
-                                         for p in setList[i]])/numPoints)
-                # Calculate how far the centroid moved in this iteration
-                shift = clusters[i].update(setList[i], centerpoint)
-                # Keep track of the largest move from all cluster centroid updates
-                biggest_shift = max(biggest_shift, shift)
+    def kmeans_run(self, points, sampler, cutoff, canceled, k=None):
+        """
+        Single K-Means run on the given points from k initial centroids drawn
+        with the given sampler
+        Returns a dictionary with the labels (None for an empty cluster),
+        the sum of distances to the centroids and iteration statistics
+        or None if canceled
+        """
 
-            # If the centroids have stopped moving much, say we're done!
-            if biggest_shift < cutoff:
-                #self.progress.setProgress(90)
-                QgsMessageLog.logMessage(self.tr(
-                    "Converged after {} iterations").format(loopCounter),
-                    MESSAGE_CATEGORY, Qgis.Success)
-                break
+        # Create k clusters using the K-means++ or K-means|| initialization method
+        if self.initial is not None:
+            initial = self.initial
+        else:
+            initial = points.subset(self.init_centroids(points,sampler,k))
     
-        self.clusters = [c.ids for c in clusters]
-        return True
+        # Loop through the dataset until the clusters stabilize
+        if self.kmeans_method=="hamerly":
+            engine = HamerlyKMeans(self.engine,cutoff,canceled,self.max_iterations)
+        elif self.kmeans_method=="minibatch":
+            engine = MiniBatchKMeans(self.engine,cutoff,self.batch_size,self.max_iterations,
+                                     rng=default_rng(sampler.getrandbits(32)),
+                                     canceled=canceled)
+        elif self.kmeans_method=="kdtree":
+            engine = KDTreeKMeans(self.engine,cutoff,canceled,self.max_iterations)
+        else:
+            engine = LloydKMeans(self.engine,cutoff,canceled,self.max_iterations)
+        result = {"labels": None, "inertia": None}
+        try:
+            labels = engine.fit(points,initial)
+            if labels is None:
+                return None
+            centroids = engine.centroids
+            result["labels"] = labels
+            result["centroids"] = centroids
+            result["inertia"] = float((points.weights*self.engine.paired(
+                points.x,points.y,points.a,
+                centroids.x[labels],centroids.y[labels],
+                None if centroids.a is None else centroids.a[labels])).sum())
+        except EmptyClusterError:
+            pass
+        result.update({"iterations": engine.iterations, "shift": engine.shift,
+                       "converged": engine.converged, "repairs": engine.repairs,
+                       "evaluations": engine.evaluations})
+        return result
 
     def fuzzy_cmeans(self):
 
-        m_exponent = -2.0/(self.m-1.0)
-
         # Set cut-off distance for termination of iterations
-        cutoff=1.e6*float_info.epsilon
+        cutoff=max(self.tolerance,1.e6*float_info.epsilon)
 
-        # Create k clusters using the K-means++ initialization method
-        QgsMessageLog.logMessage(self.tr(
-            "Initializing clusters with K-means++"),
-            MESSAGE_CATEGORY, Qgis.Info)
-        clusters = self.init_kmeans_plusplus()
-        QgsMessageLog.logMessage(self.tr(
-            "{} clusters successfully initialized".format(self.k)),
-            MESSAGE_CATEGORY, Qgis.Info)
-    
-        # Loop through the dataset until the clusters stabilize
-        loopCounter = 0
-        while True:
-
-            if self.isCanceled():
-                return False
+        # iterate on a weighted coreset instead of all points if requested
+        points = self.coreset()
 
-            # Create a list of lists to hold the points in each cluster
-            weights = [{} for i in range(self.k)]
-        
-            # Start counting loops
-            loopCounter += 1
+        # derive an independent random sequence for every number of clusters
+        ks = self.k_values()
+        if len(ks)>1:
+            samplers = [random.Random(random.getrandbits(32)) for k in ks]
+        else:
+            samplers = [random]
 
-            # For every point in the dataset ...
-            for p in list(self.points.keys()):
-                # Get the standardised distance between that point and all the cluster centroids
-                sum_of_weights = 0.0
-        
-                for i in range(self.k):
-                    distance = clusters[i].distance2center(self.points[p])
-                    weights[i][p] = distance**m_exponent if \
-                                        distance > cutoff else cutoff**m_exponent
-                    sum_of_weights += weights[i][p]
-                    
-                for i in range(self.k):
-                    weights[i][p] = (weights[i][p]/sum_of_weights)**self.m
-                    # power here for cluster centers / needs to be undone at the end
-        
-            # Set biggest_shift to zero for this iteration
-            biggest_shift = 0.0
-        
-            for i in range(self.k):
-                # Calculate new centroid coordinates
-                sum_of_weights = sum(weights[i].values())
-                centerpoint = QgsPointXY(sum([self.points[p].x()*weights[i][p] for \
-                                            p in weights[i].keys()])/ \
-                                            sum_of_weights, \
-                                         sum([self.points[p].y()*weights[i][p] for \
-                                            p in weights[i].keys()])/ \
-                                            sum_of_weights)
-                centerpoint = Cluster_point(centerpoint)
-                for j in range(clusters[i].centerpoint.attr_size):
-                    centerpoint.addAttribute(sum([self.points[p].attributes[j]*weights[i][p] \
-                                         for p in weights[i].keys()])/ \
-                                         sum_of_weights)
-                # Calculate how far the centroid moved in this iteration
-                shift = clusters[i].update(weights[i], centerpoint)
-                # Keep track of the largest move from all cluster centroid updates
-                biggest_shift = max(biggest_shift, shift)
+        # Create k clusters using the K-means++ or K-means|| initialization method
+        QgsMessageLog.logMessage(self.tr(self.init_message()),
+            MESSAGE_CATEGORY, Qgis.Info)
+        results = run_restarts(lambda i,canceled: self.fuzzy_cmeans_run(points,samplers[i], \
+                                   cutoff,canceled,ks[i]),len(ks),self.isCanceled, \
+                               self.restart_workers())
+        if results is None or None in results:
+            return False
 
+        for k,result in zip(ks,results):
             # If the centroids have stopped moving much, say we're done!
-            if biggest_shift < cutoff:
-                #self.progress.setProgress(90)
+            if result["converged"]:
                 QgsMessageLog.logMessage(self.tr(
-                    "Converged after {} iterations").format(loopCounter),
+                    "Converged after {} iterations for {} clusters").format(
+                    result["iterations"],k),
                     MESSAGE_CATEGORY, Qgis.Success)
-                break
-        
-        # assign the cluster with the highest weight to each point
-        max_clusters = [[] for i in range(self.k)]
-        for p in self.points.keys():
-            i = argmax([weights[i][p] for i in range(self.k)])
-            max_clusters[i].append(p)
-    
-        self.clusters = max_clusters
-        self.weights = weights
+            else:
+                QgsMessageLog.logMessage(self.tr(
+                    "Stopped after {} iterations for {} clusters ".format(
+                    result["iterations"],k)+ \
+                    "with a final centroid shift of {:.6g}".format(result["shift"])),
+                    MESSAGE_CATEGORY, Qgis.Warning)
+            self.candidates[k] = result
+
+        if self.k_range is None:
+            self.use_candidate(self.k)
         return True
 
+    def fuzzy_cmeans_run(self, points, sampler, cutoff, canceled, k=None):
+        """
+        Single Fuzzy C-Means run on the given points with k clusters
+        Returns a dictionary with the cluster of highest membership for
+        every point, the memberships raised to the power of the fuzzifier,
+        the centroids and iteration statistics or None if canceled
+        """
+
+        # Create k clusters using the K-means++ or K-means|| initialization method
+        if self.initial is not None:
+            initial = self.initial
+        else:
+            initial = points.subset(self.init_centroids(points,sampler,k))
+
+        # Loop through the dataset until the clusters stabilize with a fixed
+        # smallest distance to a centroid independent of the tolerance
+        floor = 1.e6*float_info.epsilon
+        if self.sparse(len(initial)):
+            engine = SparseFuzzyCMeans(self.engine,self.m,cutoff,self.top,canceled,
+                                       self.max_iterations,floor)
+        else:
+            engine = FuzzyCMeans(self.engine,self.m,cutoff,canceled,self.max_iterations,floor)
+        weights = engine.fit(points,initial)
+        if weights is None:
+            return None
+
+        # weights of all points for the centroids of the coreset in a single pass
+        if points is not self.points:
+            weights = engine.memberships(self.points,engine.centroids)
+
+        # assign the cluster with the highest weight to each point
+        return {"labels": engine.labels(weights), "weights": weights,
+                "centroids": engine.centroids, "iterations": engine.iterations,
+                "shift": engine.shift, "converged": engine.converged}
+
+    def restart_workers(self):
+        """
+        Number of threads for parallel restarts: one for distances measured
+        with QgsDistanceArea, which neither releases the GIL in the Python
+        loops nor is shared safely between threads (None for all cores)
+        """
+        return 1 if self.engine.measured else None
+
+    def sparse(self, k):
+        """
+        True if only the largest memberships of every point are kept for k clusters
+        """
+        return 0<self.top<k
+
+    def tree_built(self, fraction):
+        """
+        Displays the progress of building the cluster tree only at intervals of 5%
+        """
+        tree_progress = int(20*fraction)
+        if tree_progress > self.tree_progress:
+            self.tree_progress = tree_progress
+            QgsMessageLog.logMessage(self.tr("{}% of cluster tree built".format( \
+                                             5*tree_progress)),MESSAGE_CATEGORY,
+                                             Qgis.Info)
+
     def hcluster(self):
+        """
+        Hierarchical clustering with Lance-Williams distance updates using
+        nearest-neighbor chains for reducible linkages and the generic
+        algorithm otherwise, cut for every requested number of clusters
+        """
 
-        clust={}
-        distances={}
-        currentclustid=-1
         numPoints=len(self.points)
-        
         if numPoints==0:
             QgsMessageLog.logMessage(self.tr("No points provided"),
                 MESSAGE_CATEGORY, Qgis.Critical)
-            return False   
+            return False
 
-        # clusters are initially singletons
-        for ik,p in zip(range(numPoints-1, -1, -1), self.points.keys()):
-            clust[ik] = Cluster_node(members=[p],d=self.d,pa=self.pa,manhattan=self.manhattan)
-        
-        # compute pairwise distances
-        for ik in clust.keys():
-            if self.isCanceled():
-                return False
-            for jk in clust.keys():
-                if jk<ik:
-                    distances[(ik,jk)]=clust[ik].getDistance(self.points[clust[ik].members[0]], \
-                                       self.points[clust[jk].members[0]])
+        if self.link in NNChainLinkage.reducible:
+            linkage = NNChainLinkage(self.link,self.isCanceled,self.tree_built)
+        else:
+            linkage = GenericLinkage(self.link,self.isCanceled,self.tree_built)
 
-        while currentclustid>=self.k-numPoints:
-        
-            if self.isCanceled():
-                return False
-        
-            closest = float_info.max
-    
-            # loop through every pair looking for the smallest distance
-            for ik in clust.keys():
-                for jk in clust.keys():
-                    if jk<ik:
-                        dist=distances[(ik,jk)]
-                        if dist<closest:
-                            closest=dist
-                            ik_lowest=ik
-                            jk_lowest=jk
-            
-            # detect clusters to merge
-            ik = ik_lowest
-            jk = jk_lowest
-            
-            # create the new cluster
-            clust[currentclustid]=Cluster_node(members=clust[ik].members+ \
-                                  clust[jk].members,d=self.d,pa=self.pa)
-                                  
-            # compute updated distances according to the Lance-Williams algorithm
-            
-            if self.link == 'single':
-
-                alpha_i = 0.5
-                alpha_j = 0.5
-                gamma = -0.5
-                for lk in clust.keys():
-                    if lk not in (ik,jk,currentclustid):
-                        jl = (jk,lk) if jk>lk else (lk,jk)
-                        il = (ik,lk) if ik>lk else (lk,ik)
-                        distances[(lk,currentclustid)] = alpha_i*distances[il]+ \
-                                  alpha_j*distances[jl]+gamma*abs(distances[il]-distances[jl])
-
-            elif self.link == 'complete':
-            
-                alpha_i = 0.5
-                alpha_j = 0.5
-                gamma = 0.5
-                for lk in clust.keys():
-                    if lk not in (ik,jk,currentclustid):
-                        jl = (jk,lk) if jk>lk else (lk,jk)
-                        il = (ik,lk) if ik>lk else (lk,ik)
-                        distances[(lk,currentclustid)] = alpha_i*distances[il]+ \
-                                  alpha_j*distances[jl]+gamma*abs(distances[il]-distances[jl])
-
-            elif self.link == 'median':
-            
-                alpha_i = 0.5
-                alpha_j = 0.5
-                beta = -0.25
-                for lk in clust.keys():
-                    if lk not in (ik,jk,currentclustid):
-                        jl = (jk,lk) if jk>lk else (lk,jk)
-                        il = (ik,lk) if ik>lk else (lk,ik)
-                        distances[(lk,currentclustid)] = alpha_i*distances[il]+ \
-                                  alpha_j*distances[jl]+beta*distances[(ik,jk)]
-  
-            elif self.link == 'average':
-            
-                alpha_i = float(clust[ik].size)/clust[currentclustid].size
-                alpha_j = float(clust[jk].size)/clust[currentclustid].size
-                for lk in clust.keys():
-                    if lk not in (ik,jk,currentclustid):
-                        jl = (jk,lk) if jk>lk else (lk,jk)
-                        il = (ik,lk) if ik>lk else (lk,ik)
-                        distances[(lk,currentclustid)] = \
-                                  alpha_i*distances[il]+alpha_j*distances[jl]
-
-            elif self.link == 'wards':
-            
-                for lk in clust.keys():
-                    if lk not in (ik,jk,currentclustid):
-                        alpha_i = float(clust[ik].size+clust[lk].size)/ \
-                                  (clust[currentclustid].size+clust[lk].size)
-                        alpha_j = float(clust[jk].size+clust[lk].size)/ \
-                                  (clust[currentclustid].size+clust[lk].size)
-                        beta = -float(clust[lk].size)/ \
-                                (clust[currentclustid].size+clust[lk].size)
-                        jl = (jk,lk) if jk>lk else (lk,jk)
-                        il = (ik,lk) if ik>lk else (lk,ik)
-                        distances[(lk,currentclustid)] = alpha_i*distances[il]+ \
-                                  alpha_j*distances[jl]+beta*distances[(ik,jk)]
-
-            elif self.link == 'centroid':
-            
-                for lk in clust.keys():
-                    if lk not in (ik,jk,currentclustid):
-                        alpha_i = float(clust[ik].size)/clust[currentclustid].size
-                        alpha_j = float(clust[jk].size)/clust[currentclustid].size
-                        beta = -float(clust[ik].size*clust[jk].size)/ \
-                                (clust[currentclustid].size**2)
-                        jl = (jk,lk) if jk>lk else (lk,jk)
-                        il = (ik,lk) if ik>lk else (lk,ik)
-                        distances[(lk,currentclustid)] = alpha_i*distances[il]+ \
-                                  alpha_j*distances[jl]+beta*distances[(ik,jk)]
+        # compute condensed pairwise distances and merge all clusters
+        merges = linkage.fit(self.engine.pdist(self.points.x,self.points.y,self.points.a),
+                             self.points.weights.copy())
+        if merges is None:
+            return False
 
-            else:
+        QgsMessageLog.logMessage(self.tr("Cluster tree fully computed"),
+            MESSAGE_CATEGORY, Qgis.Info)
 
-                 QgsMessageLog.logMessage(self.tr(
-                     "Link function invalid/not found"),
-                     MESSAGE_CATEGORY, Qgis.Critical)
-                 super().cancel()
+        for k,labels in cut_tree(merges,numPoints,self.k_values(),linkage.ordered).items():
+            self.candidates[k] = {"labels": labels}
+        if self.k_range is None:
+            self.use_candidate(self.k)
+        return True
 
-            # delete deprecated clusters
-            del clust[ik]
-            del clust[jk]
-            
-            # display progress only at intervals of 5%
-            tree_progress = int(20*currentclustid/(self.k-numPoints))
-            if tree_progress > self.tree_progress:
-                self.tree_progress = tree_progress
-                QgsMessageLog.logMessage(self.tr("{}% of cluster tree built".format( \
-                                                 5*tree_progress)),MESSAGE_CATEGORY,
-                                                 Qgis.Info)
+    def hcluster_mst(self):
+        """
+        Single linkage clustering by cutting the longest edges of the
+        minimum spanning tree, built with a kd-tree without computing
+        all pairwise distances (planar distances only)
+        """
+
+        numPoints=len(self.points)
+        if numPoints==0:
+            QgsMessageLog.logMessage(self.tr("No points provided"),
+                MESSAGE_CATEGORY, Qgis.Critical)
+            return False
 
-            # cluster ids that weren't in the original set are negative
-            currentclustid-=1
+        linkage = BoruvkaLinkage(self.engine,self.isCanceled,self.tree_built)
+        merges = linkage.fit(self.points)
+        if merges is None:
+            return False
 
-        QgsMessageLog.logMessage(self.tr("Cluster tree fully computed"),
+        QgsMessageLog.logMessage(self.tr("Minimum spanning tree fully computed"),
             MESSAGE_CATEGORY, Qgis.Info)
 
-        self.clusters = [c.members for c in list(clust.values())]
+        for k,labels in cut_tree(merges,numPoints,self.k_values(),linkage.ordered).items():
+            self.candidates[k] = {"labels": labels}
+        if self.k_range is None:
+            self.use_candidate(self.k)
         return True
 
     def hcluster_slink(self):
@@ -860,17 +1546,15 @@ class ClusterTask(QgsTask):
             return members
 
         numPoints = len(self.points)
-        keys = list(self.points.keys())
+        keys = self.points.fids.tolist()
         Pi = [None]*numPoints
         Lambda = [None]*numPoints
         M = [None]*numPoints
-        iks = []
-        clusters = []
         
         # Initialize SLINK algorithm
         Pi[0] = 0
         Lambda[0] = float_info.max
-        cluster_sample=Cluster_node(d=self.d,pa=self.pa,manhattan=self.manhattan)
+        x,y,a = self.points.x,self.points.y,self.points.a
         
         # Iterate over vertices (called OTUs)
         for i in range(1,numPoints):
@@ -880,8 +1564,8 @@ class ClusterTask(QgsTask):
         
             Pi[i] = i
             Lambda[i] = float_info.max
-            M[:i] = [cluster_sample.getDistance(self.points[keys[p]],self.points[keys[i]]) \
-                     for p in range(i)]            
+            M[:i] = self.engine.cdist(x[:i],y[:i],None if a is None else a[:i], \
+                                      x[i:i+1],y[i:i+1],None if a is None else a[i:i+1])[:,0].tolist()
             for p in range(i):
                 if Lambda[p]>=M[p]:
                     M[Pi[p]] = min(M[Pi[p]],Lambda[p])
@@ -899,194 +1583,38 @@ class ClusterTask(QgsTask):
                                                  5*tree_progress)),MESSAGE_CATEGORY,
                                                  Qgis.Info)
 
-        # Identify clusters in pointer representation
-        for clusterIndex in range(1,self.k):
-            closest = float_info.min
-            
-            for p in range(numPoints-1):
-                if Lambda[p]>closest:
-                    ik = p
-                    closest = Lambda[p]
-            Lambda[ik] = float_info.min
-            iks.append(ik)
-
-        iks.reverse()
-        
-        for ik in iks:
-            clusters.append([keys[ik]]+findClusterMembers(Pi,keys,ik,clusters))
-            
-        # assign remaining points to the last cluster
-        clusters.append([p for p in keys if p not in [x for y in clusters for x in y]])
-
         #self.progress.setProgress(90)
         QgsMessageLog.logMessage(self.tr("Cluster tree fully computed"),
             MESSAGE_CATEGORY, Qgis.Info)
 
-        self.clusters = clusters
-        return True
+        # cut the same tree for every requested number of clusters
+        for k in self.k_values():
 
+            if self.isCanceled():
+                return False
 
-
-# Define required cluster classes
-
-class KMCluster:
-    '''
-    Class for k-means or fuzzy c-means clustering
-    '''
-    def __init__(self, ids, centerpoint, d, pa=0, manhattan=False):
-        '''
-        ids - set of integer IDs of the cluster points
-        centerpoint - point of centroid
-        d - distance calculation reference
-        pa - percentage contribution of the attribute values
-        '''
-        
-        if len(ids) == 0: raise Exception("Error: Empty cluster")
-        
-        # The point IDs that belong to this cluster
-        self.ids = ids
-        
-        # The center that belongs to this cluster
-        self.centerpoint = centerpoint
-
-        # Initialize distance computing
-        self.d = d
-        
-        # The percentage contribution of the z value
-        self.pa = pa
-        
-        # Whether to use the Manhattan distance 
-        self.manhattan = manhattan
-    
-    def update(self, ids, centerpoint):
-        '''
-        Returns the distance between the previous centroid coordinates
-        and the new centroid coordinates 
-        and updates the point IDs (i.e. point weights) and the centroid coordinates
-        '''
-        old_centerpoint = self.centerpoint
-        self.ids = ids
-        self.centerpoint = centerpoint
-        return self.distance2center(old_centerpoint)
-    
-    def distance2center(self, point):
-        '''
-        2-dimensional Euclidean distance or Manhattan distance to centerpoint
-        plus percentage contribution (pa) of attribute values
-        '''
-        dist = 0
-        if self.manhattan:
-            if self.pa < 100:
-                dist += (1-0.01*self.pa)* \
-                    (self.d.measureLine(QgsPointXY(self.centerpoint.x(),self.centerpoint.y()), \
-                    QgsPointXY(point.x(),self.centerpoint.y()))+ \
-                    self.d.measureLine(QgsPointXY(self.centerpoint.x(),self.centerpoint.y()), \
-                    QgsPointXY(self.centerpoint.x(),point.y()))+ \
-                    self.d.measureLine(QgsPointXY(point.x(),point.y()), \
-                    QgsPointXY(point.x(),self.centerpoint.y()))+ \
-                    self.d.measureLine(QgsPointXY(point.x(),point.y()), \
-                    QgsPointXY(self.centerpoint.x(),point.y())))
-            if self.pa > 0:
-                dist += 2*0.01*self.pa*self.attrDistance2center(point)
-        else:
-            if self.pa < 100:
-                dist += (1-0.01*self.pa)* \
-                    self.d.measureLine(QgsPointXY(self.centerpoint.x(),self.centerpoint.y()), \
-                    QgsPointXY(point.x(),point.y()))
-            if self.pa > 0:
-                dist += 0.01*self.pa*self.attrDistance2center(point)
-        return dist
+            # Identify clusters in pointer representation
+            heights = Lambda[:]
+            iks = []
+            clusters = []
+            for clusterIndex in range(1,k):
+                closest = float_info.min
                 
-    def attrDistance2center(self, point):
-        '''
-        2-dimensional Euclidean distance or Manhattan distance to centerpoint,
-        only derived from attributes
-        '''
-        attr_size = min(point.attr_size,self.centerpoint.attr_size)
-        if attr_size == 0:
-            return 0
-        dist = 0
-        if self.manhattan:
-            for i in range(attr_size):
-                dist += abs(point.attributes[i]-self.centerpoint.attributes[i])
-        else:
-            for i in range(attr_size):
-                dist += (point.attributes[i]-self.centerpoint.attributes[i])* \
-                        (point.attributes[i]-self.centerpoint.attributes[i])
-            dist = sqrt(dist)
-        return dist
-
-class Cluster_node:
-    '''
-    Class for hierarchical clustering
-    '''
-    def __init__(self, members=[], d=None, pa=0, manhattan=False):
-        self.members = members
-        self.size = len(members)
-        self.d = d
-        self.pa = pa
-        self.manhattan = manhattan
-
-    def getDistance(self, point1, point2):
-        '''
-        2-dimensional Euclidean distance or Manhattan distance between points 1 and 2
-        plus percentage contribution (pa) of attribute values
-        '''
-        dist = 0
-        if self.manhattan:
-            if self.pa < 100:
-                dist += (1-0.01*self.pa)* \
-                    (self.d.measureLine(QgsPointXY(point1.x(),point1.y()), \
-                    QgsPointXY(point2.x(),point1.y()))+ \
-                    self.d.measureLine(QgsPointXY(point1.x(),point1.y()), \
-                    QgsPointXY(point1.x(),point2.y()))+ \
-                    self.d.measureLine(QgsPointXY(point2.x(),point2.y()), \
-                    QgsPointXY(point2.x(),point1.y()))+ \
-                    self.d.measureLine(QgsPointXY(point2.x(),point2.y()), \
-                    QgsPointXY(point1.x(),point2.y())))
-            if self.pa > 0:
-                dist += 2*0.01*self.pa*self.getAttrDistance(point1,point2)
-        else:
-            if self.pa < 100:
-                dist += (1-0.01*self.pa)* \
-                self.d.measureLine(QgsPointXY(point1.x(),point1.y()), \
-                QgsPointXY(point2.x(),point2.y()))
-            if self.pa > 0:
-                dist += 0.01*self.pa*self.getAttrDistance(point1,point2)
-        return dist
+                for p in range(numPoints-1):
+                    if heights[p]>closest:
+                        ik = p
+                        closest = heights[p]
+                heights[ik] = float_info.min
+                iks.append(ik)
+
+            iks.reverse()
+            
+            for ik in iks:
+                clusters.append([keys[ik]]+findClusterMembers(Pi,keys,ik,clusters))
                 
-    def getAttrDistance(self, point1, point2):
-        '''
-        2-dimensional Euclidean distance or Manhattan distance between attributes
-        of points 1 and 2
-        '''
-        attr_size = min(point1.attr_size,point2.attr_size)
-        if attr_size == 0:
-            return 0
-        dist = 0
-        if self.manhattan:
-            for i in range(attr_size):
-                dist += abs(point1.attributes[i]-point2.attributes[i])
-        else:
-            for i in range(attr_size):
-                dist += (point1.attributes[i]-point2.attributes[i])* \
-                        (point1.attributes[i]-point2.attributes[i])
-            dist = sqrt(dist)
-        return dist
-
-class Cluster_point(QgsPoint):
-    '''
-    Class extends QgsPoint with attribute values
-    '''
-    def __init__(self,point):
-        super(Cluster_point, self).__init__(point)
-        self.attr_size = 0
-        self.attributes = []
-    
-    def addAttribute(self,v):
-        self.attr_size += 1
-        self.attributes.append(v)
-        
-    def replaceAttributes(self,v):
-        self.attr_size = len(v)
-        self.attributes = v
+            # assign remaining points to the last cluster
+            clusters.append([p for p in keys if p not in [x for y in clusters for x in y]])
+            self.candidates[k] = {"clusters": clusters}
+
+        self.clusters = self.candidates[self.k]["clusters"]
+        return True
@@ -37,18 +37,23 @@ number_correction_trials = 25
 
 import random
 
-from qgis.core import (QgsPoint,QgsPointXY,Qgis,QgsTask,QgsMessageLog)
+from qgis.core import (Qgis,QgsTask,QgsMessageLog)
 
-from math import floor,ceil,sqrt
+from math import floor,ceil
 from sys import float_info
 
+from numpy import arange,empty
+
+from .distance_engine import DistanceEngine
+from .point_store import PointStore
+
 MESSAGE_CATEGORY = 'ClusterPoints: Preparation'
 
 
 class CFTask(QgsTask):
     
     def __init__(self, description, data, agglomeration_percentile=0,
-                 d = None, pa = 0, manhattan = False):
+                 d = None, pa = 0, manhattan = False, method = None):
         super().__init__(description, QgsTask.CanCancel)
         self.__data = data
         self.__agglomeration_percentile = agglomeration_percentile
@@ -56,6 +61,7 @@ class CFTask(QgsTask):
         self.d = d
         self.pa = pa
         self.manhattan = manhattan
+        self.engine = DistanceEngine(d,pa,manhattan,method)
         self.size = 0
         
         self.result = None
@@ -92,19 +98,22 @@ class CFTask(QgsTask):
         # to estimate mean distance between individual points
         
         if len(self.__data)>number_sample_points:
-            subset = random.sample(list(self.__data.keys()),number_sample_points)
+            subset = random.sample(range(len(self.__data)),number_sample_points)
         else:
-            subset = list(self.__data.keys())
+            subset = list(range(len(self.__data)))
         
         # average pairwise distances
+
+        sample = self.__data.subset(subset)
+        subset_dist = self.engine.cdist(sample.x,sample.y,sample.a, \
+                                        sample.x,sample.y,sample.a).tolist()
         
         sample_dist = [0]*int(0.5*(len(subset)*(len(subset)+1)))
         
         for i in range(len(subset)-1,0,-1):
             ik = len(subset)-i
             for j in range(i,len(subset)):
-                sample_dist[int(0.5*ik*(ik+1))+j] = \
-                       self.getDistance(self.__data[subset[i]],self.__data[subset[j]])
+                sample_dist[int(0.5*ik*(ik+1))+j] = subset_dist[i][j]
 
         # sort sample distances
 
@@ -127,24 +136,22 @@ class CFTask(QgsTask):
         self.derive_cf_radius
         
         self.blobs = []
+
+        # centroids of all blobs (at most one blob per data point)
+        n = len(self.__data)
+        self.centroids = PointStore(arange(n),empty(n),empty(n), \
+                                    empty(self.__data.attributes.shape))
         
-        for key in self.__data.keys():
+        for row in range(n):
         
             if self.isCanceled():
                 return False
             
-            dist = float_info.max
-            for j in range(len(self.blobs)):
-                dist_j = self.blobs[j].distance2center(self.__data[key])
-                if dist_j<dist:
-                    min_j = j
-                    dist = dist_j
+            min_j,dist = self.closest_blob(row,range(len(self.blobs)))
             if dist<self.radius:
-                self.blobs[min_j].add_point(key,self.__data[key])
+                self.add_point(min_j,row)
             else:
-                self.blobs.append(cf_blob(self.d,self.pa,self.manhattan,
-                                 [key],self.__data[key]))
-                self.size += 1
+                self.add_blob(row)
                 
         '''
         Start iteration for misplaced members:
@@ -174,23 +181,17 @@ class CFTask(QgsTask):
                     blobs2loop = blobs2consider+[j]
             
                 for key in self.blobs[j].members:
-                    dist = float_info.max
-                    for jj in blobs2loop:
-                        dist_j = self.blobs[jj].distance2center(self.__data[key])
-                        if dist_j<dist:
-                            min_j = jj
-                            dist = dist_j
+                    row = self.__data.row(key)
+                    min_j,dist = self.closest_blob(row,blobs2loop)
                     if min_j!=j:
                         blobsChanged.add(j)
-                        self.blobs[j].remove_point(key,self.__data[key])
+                        self.add_point(j,row,remove=True)
                         if dist<self.radius:
                             blobsChanged.add(min_j)
-                            self.blobs[min_j].add_point(key,self.__data[key])
+                            self.add_point(min_j,row)
                         else:
                             blobsChanged.add(len(self.blobs))
-                            self.blobs.append(cf_blob(self.d,self.pa,self.manhattan,
-                                 [key],self.__data[key]))
-                            self.size += 1
+                            self.add_blob(row)
                         
             if len(blobsChanged) == 0:
                 break
@@ -210,9 +211,9 @@ class CFTask(QgsTask):
 
     def return_centroids(self):
     
-        # return dictionary of cluster feature centroids
+        # return point store of cluster feature centroids
     
-        return dict((i,self.blobs[i].centroid) for i in range(len(self.blobs)))
+        return self.centroids.subset(slice(0,len(self.blobs)))
         
     def return_members(self,keys):
     
@@ -220,171 +221,89 @@ class CFTask(QgsTask):
     
         return [p for b in [self.blobs[key].members for key in keys] for p in b]
 
-    def getDistance(self, point1, point2):
+    def closest_blob(self, row, blobs2loop):
         '''
-        2-dimensional Euclidean distance or Manhattan distance between points 1 and 2
-        plus percentage contribution (pa) of attribute values
+        Index of and distance to the closest blob centroid among blobs2loop
+        for the data point in the given row
         '''
-        dist = 0
-        if self.manhattan:
-            if self.pa < 100:
-                dist += (1-0.01*self.pa)* \
-                    (self.d.measureLine(QgsPointXY(point1.x(),point1.y()), \
-                    QgsPointXY(point2.x(),point1.y()))+ \
-                    self.d.measureLine(QgsPointXY(point1.x(),point1.y()), \
-                    QgsPointXY(point1.x(),point2.y()))+ \
-                    self.d.measureLine(QgsPointXY(point2.x(),point2.y()), \
-                    QgsPointXY(point2.x(),point1.y()))+ \
-                    self.d.measureLine(QgsPointXY(point2.x(),point2.y()), \
-                    QgsPointXY(point1.x(),point2.y())))
-            if self.pa > 0:
-                dist += 2*0.01*self.pa*self.getAttrDistance(point1,point2)
-        else:
-            if self.pa < 100:
-                dist += (1-0.01*self.pa)* \
-                self.d.measureLine(QgsPointXY(point1.x(),point1.y()), \
-                QgsPointXY(point2.x(),point2.y()))
-            if self.pa > 0:
-                dist += 0.01*self.pa*self.getAttrDistance(point1,point2)
-        return dist
-                
-    def getAttrDistance(self, point1, point2):
+        blobs2loop = list(blobs2loop)
+        if len(blobs2loop)==0:
+            return None,float_info.max
+        c = self.centroids
+        p = self.__data
+        dist = self.engine.cdist(c.x[blobs2loop],c.y[blobs2loop],
+                                 None if c.a is None else c.a[blobs2loop],
+                                 p.x[row:row+1],p.y[row:row+1],
+                                 None if p.a is None else p.a[row:row+1])[:,0]
+        j = dist.argmin()
+        return blobs2loop[j],dist[j]
+
+    def add_blob(self, row):
+        '''
+        Open a new blob with the data point in the given row as single member
+        '''
+        j = len(self.blobs)
+        self.centroids.x[j] = self.__data.x[row]
+        self.centroids.y[j] = self.__data.y[row]
+        self.centroids.attributes[j] = self.__data.attributes[row]
+        self.centroids.weights[j] = self.__data.weights[row]
+        self.blobs.append(cf_blob(j,[int(self.__data.fids[row])],self.centroids))
+        self.size += 1
+
+    def add_point(self, j, row, remove=False):
         '''
-        2-dimensional Euclidean distance or Manhattan distance between attributes
-        of points 1 and 2
+        Add the data point in the given row to blob j (or remove it)
         '''
-        attr_size = min(point1.attr_size,point2.attr_size)
-        if attr_size == 0:
-            return 0
-        dist = 0
-        if self.manhattan:
-            for i in range(attr_size):
-                dist += abs(point1.attributes[i]-point2.attributes[i])
+        p = self.__data
+        if remove:
+            self.blobs[j].remove_point(int(p.fids[row]),p.x[row],p.y[row],p.attributes[row],
+                                       p.weights[row])
         else:
-            for i in range(attr_size):
-                dist += (point1.attributes[i]-point2.attributes[i])* \
-                        (point1.attributes[i]-point2.attributes[i])
-            dist = sqrt(dist)
-        return dist
+            self.blobs[j].add_point(int(p.fids[row]),p.x[row],p.y[row],p.attributes[row],
+                                    p.weights[row])
 
 
 class cf_blob:
 
-    def __init__(self, d, pa, manhattan, members, centroid):
+    def __init__(self, index, members, centroids):
         """!
         @brief Constructor of single cluster feature (blob).
         
-        @param[in] d (QgsDistanceArea): Qgs Measurement object.
-        @param[in] pa (uint): Percentage contribution of attribute values.
-        @param[in] manhattan (bool): Bool for use of Manhattan distance.
+        @param[in] index (int): Row of the blob centroid (and total weight) in centroids.
         @param[in] members (list): List of member keys.
-        @param[in] centroid (QgsPoint): Qgs Point with initial centroid
+        @param[in] centroids (PointStore): Point store with all blob centroids.
         """
 
-        self.d = d
-        self.pa = pa
-        self.manhattan = manhattan
+        self.index = index
         self.members = members
         self.size = len(members)
-        self.centroid = centroid
+        self.centroids = centroids
         
-    def update_centroid(self,point,remove=False):
+    def update_centroid(self,x,y,attributes,w,remove=False):
         '''
         Update the centroid position with one additional point being added or removed
         '''
+        c = self.centroids
+        j = self.index
         if remove:
-            centroid = QgsPointXY(self.centroid.x()-(1.0/self.size)*(point.x()-self.centroid.x()), \
-                                  self.centroid.y()-(1.0/self.size)*(point.y()-self.centroid.y()))
-        else:
-            centroid = QgsPointXY(self.centroid.x()+(1.0/self.size)*(point.x()-self.centroid.x()), \
-                                  self.centroid.y()+(1.0/self.size)*(point.y()-self.centroid.y()))
-        centroid = Cluster_point(centroid)
-        
-        if remove:
-            centroid.replaceAttributes([self.centroid.attributes[j]- \
-                                        (1.0/self.size)*(point.attributes[j]- \
-                                        self.centroid.attributes[j]) for j in \
-                                        range(point.attr_size)])
+            c.x[j] = c.x[j]-(w/c.weights[j])*(x-c.x[j])
+            c.y[j] = c.y[j]-(w/c.weights[j])*(y-c.y[j])
+            c.attributes[j] = c.attributes[j]-(w/c.weights[j])*(attributes-c.attributes[j])
         else:
-            centroid.replaceAttributes([self.centroid.attributes[j]+ \
-                                        (1.0/self.size)*(point.attributes[j]- \
-                                        self.centroid.attributes[j]) for j in \
-                                        range(point.attr_size)])
-        self.centroid = centroid
+            c.x[j] = c.x[j]+(w/c.weights[j])*(x-c.x[j])
+            c.y[j] = c.y[j]+(w/c.weights[j])*(y-c.y[j])
+            c.attributes[j] = c.attributes[j]+(w/c.weights[j])*(attributes-c.attributes[j])
                
-    def add_point(self,index,point):
+    def add_point(self,key,x,y,attributes,w=1.0):
     
-        self.members.append(index)
+        self.members.append(key)
         self.size+=1
-        self.update_centroid(point)
+        self.centroids.weights[self.index]+=w
+        self.update_centroid(x,y,attributes,w)
         
-    def remove_point(self,index,point):
+    def remove_point(self,key,x,y,attributes,w=1.0):
     
-        self.members.remove(index)
-        self.update_centroid(point,remove=True)
+        self.members.remove(key)
+        self.update_centroid(x,y,attributes,w,remove=True)
         self.size-=1
-
-    def distance2center(self, point):
-        '''
-        2-dimensional Euclidean distance or Manhattan distance to centerpoint
-        plus percentage contribution (pa) of attribute values
-        '''
-        dist = 0
-        if self.manhattan:
-            if self.pa < 100:
-                dist += (1-0.01*self.pa)* \
-                    (self.d.measureLine(QgsPointXY(self.centroid.x(),self.centroid.y()), \
-                    QgsPointXY(point.x(),self.centroid.y()))+ \
-                    self.d.measureLine(QgsPointXY(self.centroid.x(),self.centroid.y()), \
-                    QgsPointXY(self.centroid.x(),point.y()))+ \
-                    self.d.measureLine(QgsPointXY(point.x(),point.y()), \
-                    QgsPointXY(point.x(),self.centroid.y()))+ \
-                    self.d.measureLine(QgsPointXY(point.x(),point.y()), \
-                    QgsPointXY(self.centroid.x(),point.y())))
-            if self.pa > 0:
-                dist += 2*0.01*self.pa*self.attrDistance2center(point)
-        else:
-            if self.pa < 100:
-                dist += (1-0.01*self.pa)* \
-                    self.d.measureLine(QgsPointXY(self.centroid.x(),self.centroid.y()), \
-                    QgsPointXY(point.x(),point.y()))
-            if self.pa > 0:
-                dist += 0.01*self.pa*self.attrDistance2center(point)
-        return dist
-                
-    def attrDistance2center(self, point):
-        '''
-        2-dimensional Euclidean distance or Manhattan distance to centerpoint,
-        only derived from attributes
-        '''
-        attr_size = min(point.attr_size,self.centroid.attr_size)
-        if attr_size == 0:
-            return 0
-        dist = 0
-        if self.manhattan:
-            for i in range(attr_size):
-                dist += abs(point.attributes[i]-self.centroid.attributes[i])
-        else:
-            for i in range(attr_size):
-                dist += (point.attributes[i]-self.centroid.attributes[i])* \
-                        (point.attributes[i]-self.centroid.attributes[i])
-            dist = sqrt(dist)
-        return dist
-
-
-class Cluster_point(QgsPoint):
-    '''
-    Class extends QgsPoint with attribute values
-    '''
-    def __init__(self,point):
-        super(Cluster_point, self).__init__(point)
-        self.attr_size = 0
-        self.attributes = []
-    
-    def addAttribute(self,v):
-        self.attr_size += 1
-        self.attributes.append(v)
-        
-    def replaceAttributes(self,v):
-        self.attr_size = len(v)
-        self.attributes = v
+        self.centroids.weights[self.index]-=w
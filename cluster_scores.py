@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ ClusterPoints
+                                 A QGIS plugin
+ Cluster Points conducts spatial clustering of points based on their mutual distance to each other. The user can select between the K-Means algorithm and (agglomerative) hierarchical clustering with several different link functions.
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2020-03-30
+        copyright            : (C) 2020 by Johannes Jenkner
+        email                : jjenkner@web.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Johannes Jenkner'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026 by Johannes Jenkner'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+
+import numpy as np
+
+from .kmeans_engines import centroids_from_labels
+
+
+class ClusterScores:
+    '''
+    Quality scores of clusterings of the same points for different
+    numbers of clusters, sharing the distances between a random sample
+    of the points for the silhouette coefficient
+    '''
+    def __init__(self, engine, points, sample_size=1000, rng=None):
+        """!
+        @brief Constructor of the cluster scores.
+
+        @param[in] engine (DistanceEngine): Distance calculation reference.
+        @param[in] points (PointStore): Clustered points.
+        @param[in] sample_size (uint): Number of points sampled for the silhouette coefficient.
+        @param[in] rng (numpy.random.Generator): Random generator for the sample.
+        """
+
+        self.engine = engine
+        self.points = points
+        rng = rng if rng is not None else np.random.default_rng()
+        if len(points) > sample_size:
+            self.sample = np.sort(rng.choice(len(points), sample_size, replace=False))
+        else:
+            self.sample = np.arange(len(points))
+
+        # distances between all sampled points, computed once for all clusterings
+        x,y,a = points.x[self.sample],points.y[self.sample],points.attributes[self.sample]
+        a = a if points.attr_size > 0 else None
+        self.distances = engine.cdist(x, y, a, x, y, a)
+
+    def scores(self, labels, k):
+        '''
+        Sum of (weighted) distances to the cluster centroids, silhouette
+        coefficient on the sample and Calinski-Harabasz index for the
+        cluster index of every point
+        '''
+        points = self.points
+        w = points.weights
+        clusters = k
+
+        # leave out empty clusters
+        used,labels = np.unique(labels, return_inverse=True)
+        labels = labels.ravel()
+        k = len(used)
+        centroids = centroids_from_labels(points, labels, k)
+        dist = self.engine.paired(points.x, points.y, points.a,
+                                  centroids.x[labels], centroids.y[labels],
+                                  None if centroids.a is None else centroids.a[labels])
+        return {'k': clusters,
+                'inertia': float((w*dist).sum()),
+                'silhouette': self.silhouette(labels, k),
+                'calinski_harabasz': self.calinski_harabasz(centroids, dist, k)}
+
+    @staticmethod
+    def best(scores):
+        '''
+        Number of clusters with the highest silhouette coefficient
+        (the first of the scores on ties)
+        '''
+        return max(scores, key=lambda score: score['silhouette'])['k']
+
+    def silhouette(self, labels, k):
+        '''
+        Weighted mean silhouette coefficient of the sampled points
+        (Rousseeuw, 1987), with zero for points alone in their cluster
+        '''
+        labels = labels[self.sample]
+        w = self.points.weights[self.sample]
+        members = np.zeros((len(labels),k))
+        members[np.arange(len(labels)),labels] = w
+        total = members.sum(axis=0)
+
+        # mean distance to the members of every cluster, excluding the point itself
+        own = total[labels]-w
+        sums = self.distances@members
+        inner = np.divide(sums[np.arange(len(labels)),labels], own,
+                          out=np.zeros(len(labels)), where=own>0)
+        means = np.where(total>0, sums/np.where(total>0, total, 1.0), np.inf)
+        means[np.arange(len(labels)),labels] = np.inf
+        outer = means.min(axis=1)
+        outer[~np.isfinite(outer)] = 0.0
+
+        denominator = np.maximum(inner, outer)
+        coefficient = np.divide(outer-inner, denominator,
+                                out=np.zeros(len(labels)), where=(own>0) & (denominator>0))
+        return float((w*coefficient).sum()/w.sum())
+
+    def calinski_harabasz(self, centroids, dist, k):
+        '''
+        Ratio of the between-cluster to the within-cluster dispersion
+        (Calinski and Harabasz, 1974), with squared combined distances
+        and the total weight as number of points
+        '''
+        points = self.points
+        w = points.weights
+        n = w.sum()
+        center = centroids_from_labels(points, np.zeros(len(points), dtype=np.intp), 1)
+        between = self.engine.paired(centroids.x, centroids.y, centroids.a,
+                                     np.repeat(center.x, k), np.repeat(center.y, k),
+                                     None if center.a is None else np.repeat(center.a, k, axis=0))
+        within = (w*dist**2).sum()
+        if within <= 0 or n <= k or k < 2:
+            return 0.0
+        return float((centroids.weights*between**2).sum()/(k-1)/(within/(n-k)))
@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ ClusterPoints
+                                 A QGIS plugin
+ Cluster Points conducts spatial clustering of points based on their mutual distance to each other. The user can select between the K-Means algorithm and (agglomerative) hierarchical clustering with several different link functions.
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2020-03-30
+        copyright            : (C) 2020 by Johannes Jenkner
+        email                : jjenkner@web.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Johannes Jenkner'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026 by Johannes Jenkner'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import numpy as np
+
+# number of matrix entries computed at once in blocked distance kernels
+block_entries = 2**22
+
+# WGS84 ellipsoid used for geodesic approximations without project ellipsoid
+wgs84_semi_major = 6378137.0
+wgs84_inverse_flattening = 298.257223563
+
+# documented maximum relative deviation of Euclidean distances from ellipsoidal
+# QgsDistanceArea results (Manhattan legs add manhattan_error_bound)
+error_bounds = {'planar': 0.0, 'ellipsoid': 0.0, 'geodesic': 0.0,
+                'haversine': 6.0e-3, 'lambert': 1.0e-4}
+
+
+def manhattan_error_bound(lat, dlon):
+    '''
+    Maximum relative excess of the parallel arcs used for the east-west
+    Manhattan legs over the geodesic between both ends of a leg, for
+    latitudes up to lat and longitude differences up to dlon in degrees
+    (spherical estimate; the meridian legs are exact)
+    '''
+    cos_lat = np.cos(np.radians(min(abs(lat), 90.0)))
+    half = 0.5*np.radians(min(abs(dlon), 180.0))
+    if half == 0:
+        return 0.0
+    if cos_lat*np.sin(half) <= 0:
+        # limit near the poles where the leg degenerates
+        return float(half/np.sin(half)-1)
+    return float(cos_lat*half/np.arcsin(cos_lat*np.sin(half))-1)
+
+
+class DistanceEngine:
+    '''
+    Batched distance computations for arrays of points
+    (Euclidean or Manhattan distance plus percentage contribution
+    of attribute values)
+    '''
+    def __init__(self, d=None, pa=0, manhattan=False, method=None):
+        """!
+        @brief Constructor of the shared distance engine.
+
+        @param[in] d (QgsDistanceArea): Qgs Measurement object (None for planar distances).
+        @param[in] pa (uint): Percentage contribution of attribute values.
+        @param[in] manhattan (bool): Bool for use of Manhattan distance.
+        @param[in] method (str): 'planar', 'ellipsoid' (QgsDistanceArea for all legs),
+                   'geodesic' (QgsDistanceArea, per-axis legs for Manhattan),
+                   'haversine' (great circle) or 'lambert' (ellipsoid-corrected
+                   great circle); derived from d if None.
+        """
+
+        self.d = d
+        self.pa = pa
+        self.manhattan = manhattan
+
+        # QgsDistanceArea without ellipsoid measures plain Cartesian distances
+        if method is None:
+            method = 'planar' if d is None or not d.willUseEllipsoid() else 'geodesic'
+        self.method = method
+
+        # ellipsoid parameters for the vectorized geodesic approximations
+        self.semi_major = wgs84_semi_major
+        self.flattening = 1.0/wgs84_inverse_flattening
+        if d is not None and d.willUseEllipsoid():
+            self.semi_major = d.ellipsoidSemiMajor()
+            self.flattening = 1.0/d.ellipsoidInverseFlattening()
+        self.radius = self.semi_major*(1-self.flattening/3.0)
+
+        # weights of spatial and attribute contributions
+        self.spatial_weight = 1-0.01*pa
+        self.attr_weight = (2 if manhattan else 1)*0.01*pa
+
+    @property
+    def measured(self):
+        '''
+        True if spatial distances are measured pair by pair with
+        QgsDistanceArea instead of vectorized kernels
+        '''
+        return self.method == 'ellipsoid' or (self.method == 'geodesic' and not self.manhattan)
+
+    def spatial(self, x1, y1, x2, y2):
+        '''
+        Matrix of 2-dimensional Euclidean or Manhattan distances between
+        the n points (x1,y1) and the k points (x2,y2)
+        '''
+        x1 = np.asarray(x1, dtype=float)
+        y1 = np.asarray(y1, dtype=float)
+        x2 = np.asarray(x2, dtype=float)
+        y2 = np.asarray(y2, dtype=float)
+        if self.measured:
+            return self._measure(x1, y1, x2, y2)
+        return self._spatial(x1[:,None], y1[:,None], x2[None,:], y2[None,:])
+
+    def attribute(self, a1, a2):
+        '''
+        Matrix of Euclidean or Manhattan distances between the attribute
+        rows of a1 (n x m) and a2 (k x m)
+        '''
+        a1 = np.asarray(a1, dtype=float)
+        a2 = np.asarray(a2, dtype=float)
+        return self._attribute(a1[:,None,:], a2[None,:,:])
+
+    def cdist(self, x1, y1, a1, x2, y2, a2):
+        '''
+        Matrix of combined distances between the n points of set 1 and the
+        k points of set 2, computed in blocks of rows
+        '''
+        n = len(x1)
+        k = len(x2)
+        dist = np.empty((n,k))
+        step = max(1, block_entries//max(1,k))
+        for start in range(0, n, step):
+            stop = min(n, start+step)
+            dist[start:stop] = self._block(x1[start:stop], y1[start:stop],
+                                           None if a1 is None else a1[start:stop],
+                                           x2, y2, a2)
+        return dist
+
+    def nearest(self, x1, y1, a1, x2, y2, a2):
+        '''
+        Index of and distance to the closest point of set 2
+        for every point of set 1
+        '''
+        n = len(x1)
+        k = len(x2)
+        labels = np.empty(n, dtype=np.intp)
+        dist = np.empty(n)
+        step = max(1, block_entries//max(1,k))
+        for start in range(0, n, step):
+            stop = min(n, start+step)
+            block = self._block(x1[start:stop], y1[start:stop],
+                                None if a1 is None else a1[start:stop],
+                                x2, y2, a2)
+            labels[start:stop] = block.argmin(axis=1)
+            dist[start:stop] = block[np.arange(stop-start), labels[start:stop]]
+        return labels, dist
+
+    def nearest_two(self, x1, y1, a1, x2, y2, a2):
+        '''
+        Index of and distance to the closest point of set 2 plus the
+        distance to the second closest point for every point of set 1
+        '''
+        n = len(x1)
+        k = len(x2)
+        labels = np.empty(n, dtype=np.intp)
+        dist = np.empty(n)
+        second = np.empty(n)
+        step = max(1, block_entries//max(1,k))
+        for start in range(0, n, step):
+            stop = min(n, start+step)
+            block = self._block(x1[start:stop], y1[start:stop],
+                                None if a1 is None else a1[start:stop],
+                                x2, y2, a2)
+            labels[start:stop] = block.argmin(axis=1)
+            dist[start:stop] = block[np.arange(stop-start), labels[start:stop]]
+            second[start:stop] = np.partition(block, 1, axis=1)[:,1]
+        return labels, dist, second
+
+    def nearest_m(self, x1, y1, a1, x2, y2, a2, m):
+        '''
+        Indices of and distances to the m closest points of set 2 in
+        ascending order of distance for every point of set 1
+        '''
+        n = len(x1)
+        k = len(x2)
+        m = min(m, k)
+        labels = np.empty((n,m), dtype=np.intp)
+        dist = np.empty((n,m))
+        step = max(1, block_entries//max(1,k))
+        for start in range(0, n, step):
+            stop = min(n, start+step)
+            block = self._block(x1[start:stop], y1[start:stop],
+                                None if a1 is None else a1[start:stop],
+                                x2, y2, a2)
+            closest = np.argpartition(block, m-1, axis=1)[:,:m]
+            closest_dist = np.take_along_axis(block, closest, axis=1)
+            order = np.argsort(closest_dist, axis=1, kind='stable')
+            labels[start:stop] = np.take_along_axis(closest, order, axis=1)
+            dist[start:stop] = np.take_along_axis(closest_dist, order, axis=1)
+        return labels, dist
+
+    def pdist(self, x, y, a):
+        '''
+        Condensed vector of pairwise distances (i<j, row-major order)
+        '''
+        n = len(x)
+        dist = np.empty(n*(n-1)//2)
+        pos = 0
+        step = max(1, block_entries//max(1,n))
+        for start in range(0, n-1, step):
+            stop = min(n-1, start+step)
+            block = self._block(x[start:stop], y[start:stop],
+                                None if a is None else a[start:stop], x, y, a)
+            for i in range(start, stop):
+                dist[pos:pos+n-i-1] = block[i-start, i+1:]
+                pos += n-i-1
+        return dist
+
+    def paired(self, x1, y1, a1, x2, y2, a2):
+        '''
+        Combined distances between the i-th points of set 1 and set 2
+        '''
+        x1 = np.asarray(x1, dtype=float)
+        y1 = np.asarray(y1, dtype=float)
+        x2 = np.asarray(x2, dtype=float)
+        y2 = np.asarray(y2, dtype=float)
+        dist = np.zeros(len(x1))
+        if self.pa < 100:
+            if self.measured:
+                spatial = np.array([self._measure(x1[i:i+1], y1[i:i+1],
+                                                  x2[i:i+1], y2[i:i+1])[0,0]
+                                    for i in range(len(x1))])
+            else:
+                spatial = self._spatial(x1, y1, x2, y2)
+            dist = dist+self.spatial_weight*spatial
+        if self.pa > 0 and a1 is not None and a2 is not None and \
+                np.shape(a1)[-1] > 0:
+            dist = dist+self.attr_weight*self._attribute(np.asarray(a1, dtype=float),
+                                                         np.asarray(a2, dtype=float))
+        return dist
+
+    def box_bounds(self, lo, hi, x2, y2, a2):
+        '''
+        Lower and upper bounds of the combined distances between any point
+        inside the n boxes [lo, hi] (columns x, y and attributes) and the
+        k points of set 2; valid for planar distances only
+        '''
+        n = len(lo)
+        k = len(x2)
+        lower = np.empty((n,k))
+        upper = np.empty((n,k))
+        columns = np.vstack((x2, y2) if a2 is None else (x2, y2, np.transpose(a2)))
+        step = max(1, block_entries//max(1,k*len(columns)))
+        for start in range(0, n, step):
+            stop = min(n, start+step)
+            below = lo[start:stop,:,None]-columns
+            above = columns-hi[start:stop,:,None]
+            lower[start:stop] = self._gaps(np.maximum(np.maximum(below, above), 0))
+            upper[start:stop] = self._gaps(np.maximum(np.abs(below), np.abs(above)))
+        return lower, upper
+
+    def paired_box_bounds(self, lo1, hi1, lo2, hi2):
+        '''
+        Lower and upper bounds of the combined distances between any point
+        inside the i-th box of set 1 and any point inside the i-th box of
+        set 2 (columns x, y and attributes); valid for planar distances only
+        '''
+        lower = np.maximum(np.maximum(lo1-hi2, lo2-hi1), 0)
+        upper = np.maximum(hi1-lo2, hi2-lo1)
+        return self._gaps(lower[:,:,None])[:,0], self._gaps(upper[:,:,None])[:,0]
+
+    def _gaps(self, gaps):
+        '''
+        Combined distances from coordinate and attribute gaps (n x D x k)
+        '''
+        dist = 0
+        if self.pa < 100:
+            dist = self.spatial_weight*self._spatial(gaps[:,0], gaps[:,1], 0, 0)
+        if self.pa > 0 and gaps.shape[1] > 2:
+            dist = dist+self.attr_weight*self._attribute(np.moveaxis(gaps[:,2:], 1, -1),
+                                                         np.zeros(gaps.shape[1]-2))
+        return dist
+
+    def _block(self, x1, y1, a1, x2, y2, a2):
+        '''
+        Combined distances for a single block of rows
+        '''
+        dist = 0
+        if self.pa < 100:
+            dist = self.spatial(x1, y1, x2, y2)
+            dist *= self.spatial_weight
+        if self.pa > 0 and a1 is not None and a2 is not None and \
+                np.shape(a1)[-1] > 0:
+            attr = self.attribute(a1, a2)
+            attr *= self.attr_weight
+            dist = dist+attr
+        return np.broadcast_to(dist, (len(x1), len(x2)))
+
+    def _spatial(self, x1, y1, x2, y2):
+        '''
+        Vectorized spatial distances between broadcastable coordinate arrays
+        '''
+        if self.method != 'planar' and self.manhattan:
+            return self._axes(x1, y1, x2, y2)
+        if self.method in ('haversine', 'lambert'):
+            return self._geodesic(x1, y1, x2, y2)
+        dx = x1-x2
+        dy = y1-y2
+        if self.manhattan:
+            # sum of the four legs of the rectangle spanned by both points
+            dx = np.abs(dx)
+            dy = np.abs(dy)
+            return dx+dy+dy+dx
+        dx *= dx
+        dy *= dy
+        dx += dy
+        return np.sqrt(dx, out=dx)
+
+    def _attribute(self, a1, a2):
+        '''
+        Attribute distances between broadcastable attribute arrays
+        '''
+        dist = 0
+        for j in range(a1.shape[-1]):
+            diff = a1[...,j]-a2[...,j]
+            if self.manhattan:
+                dist = dist+np.abs(diff)
+            else:
+                dist = dist+diff*diff
+        return dist if self.manhattan else np.sqrt(dist)
+
+    def _geodesic(self, x1, y1, x2, y2):
+        '''
+        Vectorized great circle distances between longitudes/latitudes
+        in degrees
+        '''
+        return self._arc(np.radians(x1), np.radians(y1),
+                         np.radians(x2), np.radians(y2))
+
+    def _axes(self, x1, y1, x2, y2):
+        '''
+        Manhattan distances between longitudes/latitudes in degrees from
+        per-point axis components: the two meridian legs are differences
+        of meridian arc lengths, the two east-west legs are parallel arcs
+        '''
+        m1, r1 = self._components(y1)
+        m2, r2 = self._components(y2)
+        dlon = np.abs(np.radians(x1)-np.radians(x2))
+        dlon = np.minimum(dlon, 2*np.pi-dlon)
+        return dlon*(r1+r2)+2*np.abs(m1-m2)
+
+    def _components(self, lat):
+        '''
+        Meridian arc length from the equator and radius of the parallel
+        for latitudes in degrees
+        '''
+        lat = np.radians(lat)
+        if self.method == 'haversine':
+            return self.radius*lat, self.radius*np.cos(lat)
+        e2 = self.flattening*(2-self.flattening)
+        e4 = e2*e2
+        e6 = e4*e2
+        m = self.semi_major*((1-e2/4-3*e4/64-5*e6/256)*lat- \
+                             (3*e2/8+3*e4/32+45*e6/1024)*np.sin(2*lat)+ \
+                             (15*e4/256+45*e6/1024)*np.sin(4*lat)- \
+                             (35*e6/3072)*np.sin(6*lat))
+        r = self.semi_major*np.cos(lat)/np.sqrt(1-e2*np.sin(lat)**2)
+        return m, r
+
+    def _arc(self, lon1, lat1, lon2, lat2):
+        '''
+        Haversine distance on the sphere of mean radius or, for the lambert
+        method, Lambert's ellipsoidal correction of the central angle
+        between reduced latitudes
+        '''
+        if self.method == 'lambert':
+            lat1 = np.arctan((1-self.flattening)*np.tan(lat1))
+            lat2 = np.arctan((1-self.flattening)*np.tan(lat2))
+        h = np.sin(0.5*(lat2-lat1))**2+ \
+            np.cos(lat1)*np.cos(lat2)*np.sin(0.5*(lon2-lon1))**2
+        sigma = 2*np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+        if self.method != 'lambert':
+            return self.radius*sigma
+        P = 0.5*(lat1+lat2)
+        Q = 0.5*(lat2-lat1)
+        sin_half = np.sin(0.5*sigma)**2
+        cos_half = 1-sin_half
+        with np.errstate(divide='ignore', invalid='ignore'):
+            X = (sigma-np.sin(sigma))*np.sin(P)**2*np.cos(Q)**2/cos_half
+            Y = (sigma+np.sin(sigma))*np.cos(P)**2*np.sin(Q)**2/sin_half
+            dist = self.semi_major*(sigma-0.5*self.flattening*(X+Y))
+        return np.where(sigma > 0, dist, 0.0)
+
+    def _measure(self, x1, y1, x2, y2):
+        '''
+        Ellipsoidal distances measured pair by pair with QgsDistanceArea
+        '''
+        from qgis.core import QgsPointXY
+
+        dist = np.empty((len(x1),len(x2)))
+        measure = self.d.measureLine
+        p2 = [QgsPointXY(x, y) for x, y in zip(x2, y2)]
+        for i, (x, y) in enumerate(zip(x1, y1)):
+            p1 = QgsPointXY(x, y)
+            if self.manhattan:
+                for j, (xx, yy) in enumerate(zip(x2, y2)):
+                    dist[i,j] = measure(p1, QgsPointXY(xx, y))+ \
+                                measure(p1, QgsPointXY(x, yy))+ \
+                                measure(p2[j], QgsPointXY(xx, y))+ \
+                                measure(p2[j], QgsPointXY(x, yy))
+            else:
+                for j in range(len(p2)):
+                    dist[i,j] = measure(p1, p2[j])
+        return dist
+
@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ ClusterPoints
+                                 A QGIS plugin
+ Cluster Points conducts spatial clustering of points based on their mutual distance to each other. The user can select between the K-Means algorithm and (agglomerative) hierarchical clustering with several different link functions.
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2020-03-30
+        copyright            : (C) 2020 by Johannes Jenkner
+        email                : jjenkner@web.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Johannes Jenkner'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026 by Johannes Jenkner'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+
+import heapq
+
+import numpy as np
+
+from .distance_engine import block_entries
+from .kd_tree import KDTree
+
+
+def condensed_index(n, i, j):
+    '''
+    Position of the distance between points i and j (i != j) in the
+    condensed vector of pairwise distances of n points
+    '''
+    i,j = np.minimum(i, j),np.maximum(i, j)
+    return n*i-i*(i+1)//2+j-i-1
+
+
+def lance_williams(link, d_il, d_jl, d_ij, size_i, size_j, size_l):
+    '''
+    Distance between the union of clusters i and j and cluster l
+    according to the Lance-Williams update of the given linkage,
+    elementwise for arrays of distances d_il, d_jl and sizes size_l
+    '''
+    size = size_i+size_j
+    if link == 'single':
+        return 0.5*d_il+0.5*d_jl-0.5*np.abs(d_il-d_jl)
+    elif link == 'complete':
+        return 0.5*d_il+0.5*d_jl+0.5*np.abs(d_il-d_jl)
+    elif link == 'median':
+        return 0.5*d_il+0.5*d_jl-0.25*d_ij
+    elif link == 'average':
+        return size_i/size*d_il+size_j/size*d_jl
+    elif link == 'wards':
+        return (size_i+size_l)/(size+size_l)*d_il+(size_j+size_l)/(size+size_l)*d_jl- \
+               size_l/(size+size_l)*d_ij
+    elif link == 'centroid':
+        return size_i/size*d_il+size_j/size*d_jl-size_i*size_j/size**2*d_ij
+    raise ValueError("Link function {} not found".format(link))
+
+
+def cut_tree(merges, n, ks, ordered=False):
+    '''
+    Cluster index of every point after cutting the tree given by the
+    merges (rows of the two merged clusters, each represented by one of
+    its points, and the merge distance) for every number of clusters in ks;
+    merges are replayed in order of distance unless they are ordered
+    '''
+    parent = np.arange(n)
+    if ordered:
+        order = np.arange(len(merges))
+    else:
+        order = np.argsort(merges[:,2], kind='stable')
+    partitions = {}
+    for step in range(n):
+        if n-step in ks:
+            # follow the parents up to the root of every point
+            roots = parent.copy()
+            while True:
+                grand = roots[roots]
+                if np.array_equal(grand, roots):
+                    break
+                roots = grand
+            partitions[n-step] = np.unique(roots, return_inverse=True)[1].ravel()
+        if step < n-1:
+            i,j = merges[order[step],:2].astype(np.intp)
+            while parent[i] != i:
+                i = parent[i]
+            while parent[j] != j:
+                j = parent[j]
+            parent[i] = j
+    return partitions
+
+
+class NNChainLinkage:
+    '''
+    Agglomerative hierarchical clustering with the nearest-neighbor chain
+    algorithm (Murtagh, 1983) on a condensed vector of pairwise distances:
+    a chain of nearest neighbors is followed until two clusters are their
+    mutual nearest neighbors, which are merged right away; exact for the
+    reducible linkages (single, complete, average and Ward's) in O(n²)
+    time and memory for n(n-1)/2 distances
+    '''
+    reducible = ('single', 'complete', 'average', 'wards')
+    ordered = False
+
+    def __init__(self, link, canceled=None, progress=None):
+        """!
+        @brief Constructor of the nearest-neighbor chain engine.
+
+        @param[in] link (string): Linkage (single, complete, average or wards).
+        @param[in] canceled (callable): Returns True if the computation should stop.
+        @param[in] progress (callable): Called with the fraction of merges done.
+        """
+
+        if link not in self.reducible:
+            raise ValueError("Linkage {} is not reducible".format(link))
+        self.link = link
+        self.canceled = canceled if canceled is not None else lambda: False
+        self.progress = progress if progress is not None else lambda fraction: None
+
+    def fit(self, distances, sizes):
+        '''
+        Merges all n clusters, updating the condensed distances and the
+        cluster sizes in place; returns the n-1 merges as rows of the two
+        merged clusters and the merge distance or None if canceled
+        '''
+        n = len(sizes)
+        active = np.ones(n, dtype=bool)
+        merges = np.empty((max(n-1,0),3))
+        chain = []
+        others = np.arange(n)
+        for step in range(n-1):
+
+            if self.canceled():
+                return None
+
+            if len(chain) == 0:
+                chain.append(int(np.argmax(active)))
+
+            # grow the chain until its last two clusters are mutual nearest neighbors
+            while True:
+                a = chain[-1]
+                row = distances[condensed_index(n, a, others)]
+                row[~active] = np.inf
+                row[a] = np.inf
+                b = int(np.argmin(row))
+                if len(chain) > 1 and row[chain[-2]] <= row[b]:
+                    b = chain[-2]
+                    break
+                chain.append(b)
+
+            chain.pop()
+            chain.pop()
+            d_ab = row[b]
+            merges[step] = a,b,d_ab
+
+            # update the whole row of the merged cluster kept in row b
+            active[a] = active[b] = False
+            remaining = np.flatnonzero(active)
+            al = condensed_index(n, a, remaining)
+            bl = condensed_index(n, b, remaining)
+            distances[bl] = lance_williams(self.link, distances[al], distances[bl],
+                                           d_ab, sizes[a], sizes[b], sizes[remaining])
+            active[b] = True
+            sizes[b] += sizes[a]
+
+            self.progress((step+1)/(n-1))
+
+        return merges
+
+
+class GenericLinkage:
+    '''
+    Agglomerative hierarchical clustering with the generic algorithm of
+    Müllner (2011) on a condensed vector of pairwise distances: every
+    cluster caches a nearest neighbor among the clusters of higher row
+    with a lower bound of their distance, kept in a heap of candidates
+    that are lazily invalidated and only rescanned when they reach the
+    top with an outdated distance; exact for all linkages including the
+    non-reducible median and centroid linkages
+    '''
+    ordered = True
+
+    def __init__(self, link, canceled=None, progress=None):
+        """!
+        @brief Constructor of the generic linkage engine.
+
+        @param[in] link (string): Linkage of the Lance-Williams update.
+        @param[in] canceled (callable): Returns True if the computation should stop.
+        @param[in] progress (callable): Called with the fraction of merges done.
+        """
+
+        self.link = link
+        self.canceled = canceled if canceled is not None else lambda: False
+        self.progress = progress if progress is not None else lambda fraction: None
+
+    def fit(self, distances, sizes):
+        '''
+        Merges all n clusters in the order of increasing distance,
+        updating the condensed distances and the cluster sizes in place;
+        returns the n-1 merges as rows of the two merged clusters and
+        the merge distance or None if canceled
+        '''
+        n = len(sizes)
+        active = np.ones(n, dtype=bool)
+        merges = np.empty((max(n-1,0),3))
+        neighbor = np.zeros(n, dtype=np.intp)
+        mindist = np.full(n, np.inf)
+        heap = []
+
+        def rescan(x):
+            # nearest neighbor among the active clusters of higher row
+            start = condensed_index(n, x, x+1)
+            row = np.where(active[x+1:], distances[start:start+n-x-1], np.inf)
+            y = int(np.argmin(row))
+            neighbor[x] = x+1+y
+            mindist[x] = row[y]
+            heapq.heappush(heap, (mindist[x], x))
+
+        for x in range(n-1):
+            rescan(x)
+
+        for step in range(n-1):
+
+            if self.canceled():
+                return None
+
+            # closest pair from the heap, skipping invalidated entries
+            while True:
+                delta,a = heapq.heappop(heap)
+                if not active[a] or delta != mindist[a] or a == n-1:
+                    continue
+                b = neighbor[a]
+                if active[b] and delta == distances[condensed_index(n, a, b)]:
+                    break
+                rescan(a)
+            merges[step] = a,b,delta
+
+            # update the whole row of the merged cluster kept in row b
+            active[a] = active[b] = False
+            remaining = np.flatnonzero(active)
+            al = condensed_index(n, a, remaining)
+            bl = condensed_index(n, b, remaining)
+            distances[bl] = lance_williams(self.link, distances[al], distances[bl],
+                                           delta, sizes[a], sizes[b], sizes[remaining])
+            active[b] = True
+            sizes[b] += sizes[a]
+
+            # redirect neighbors of the retired cluster to the merged cluster
+            lower = np.flatnonzero(active[:a] & (neighbor[:a] == a))
+            neighbor[lower] = b
+
+            # lower the cached distances of clusters now closer to the merged cluster
+            lower = np.flatnonzero(active[:b])
+            closer = distances[condensed_index(n, lower, b)]
+            for x,d in zip(lower[closer < mindist[lower]].tolist(),
+                           closer[closer < mindist[lower]].tolist()):
+                neighbor[x] = b
+                mindist[x] = d
+                heapq.heappush(heap, (d, x))
+            if b < n-1 and active[b+1:].any():
+                rescan(b)
+
+            self.progress((step+1)/(n-1))
+
+        return merges
+
+
+class BoruvkaLinkage:
+    '''
+    Single linkage from the minimum spanning tree of the points, built with
+    the dual-tree Borůvka algorithm (March et al., 2010) over a kd-tree of
+    coordinates and standardized attributes: in every round the shortest
+    edge leaving each component is searched by a level-wise traversal of
+    pairs of nodes, discarding pairs within a single component or farther
+    apart than the current bounds of their components; O(n log n) time
+    and O(n) memory in practice (planar distances only)
+    '''
+    ordered = False
+
+    def __init__(self, engine, canceled=None, progress=None, leaf_size=8):
+        """!
+        @brief Constructor of the minimum spanning tree engine.
+
+        @param[in] engine (DistanceEngine): Distance calculation reference (planar).
+        @param[in] canceled (callable): Returns True if the computation should stop.
+        @param[in] progress (callable): Called with the fraction of edges found.
+        @param[in] leaf_size (uint): Maximum number of points in a leaf of the kd-tree.
+        """
+
+        self.engine = engine
+        self.canceled = canceled if canceled is not None else lambda: False
+        self.progress = progress if progress is not None else lambda fraction: None
+        self.leaf_size = leaf_size
+
+    def fit(self, points):
+        '''
+        Builds the minimum spanning tree of the points; returns its n-1
+        edges as rows of the two connected points and the edge length
+        (the merges of single linkage) or None if canceled
+        '''
+        n = len(points)
+        tree = KDTree(np.column_stack((points.x, points.y, points.attributes)),
+                      self.leaf_size)
+        is_leaf = tree.is_leaf(np.arange(len(tree)))
+        leaves = np.flatnonzero(is_leaf)
+        leaves = leaves[np.argsort(tree.start[leaves])]
+        inner = np.flatnonzero(~is_leaf)
+        parent = np.full(len(tree), -1, dtype=np.intp)
+        parent[tree.left[inner]] = inner
+        parent[tree.right[inner]] = inner
+
+        # inner nodes level by level from the deepest level upwards
+        upward = []
+        nodes = np.zeros(1, dtype=np.intp)
+        while len(nodes) > 0:
+            nodes = nodes[~is_leaf[nodes]]
+            upward.insert(0, nodes)
+            nodes = np.concatenate((tree.left[nodes], tree.right[nodes]))
+        _,diameter = self.engine.paired_box_bounds(tree.lo, tree.hi, tree.lo, tree.hi)
+        span = np.arange((tree.end-tree.start)[leaves].max())
+
+        # coordinates and attributes in the permuted row order of the tree
+        x,y = points.x[tree.perm],points.y[tree.perm]
+        a = None if points.a is None else points.a[tree.perm]
+
+        component = np.arange(n)
+        best = np.empty(n)
+        best_first = np.empty(n, dtype=np.intp)
+        best_second = np.empty(n, dtype=np.intp)
+        bound = np.empty(n)
+        merges = np.empty((max(n-1,0),3))
+        edges = 0
+
+        def aggregate(values, reduce):
+            # reduce values in the permuted row order over leaves and inner nodes
+            result = np.empty(len(tree), dtype=values.dtype)
+            result[leaves] = reduce.reduceat(values, tree.start[leaves])
+            for nodes in upward:
+                result[nodes] = reduce(result[tree.left[nodes]], result[tree.right[nodes]])
+            return result
+
+        def scan(q, r):
+            # shortest edges between different components in pairs of leaves
+            step = max(1, block_entries//len(span)**2)
+            for first in range(0, len(q), step):
+                q_block,r_block = q[first:first+step],r[first:first+step]
+                i = (tree.start[q_block][:,None]+span)[:,:,None]
+                j = (tree.start[r_block][:,None]+span)[:,None,:]
+                valid = (i < tree.end[q_block][:,None,None]) & \
+                        (j < tree.end[r_block][:,None,None]) & \
+                        ((q_block != r_block)[:,None,None] | (i < j))
+                i = np.broadcast_to(i, valid.shape)[valid]
+                j = np.broadcast_to(j, valid.shape)[valid]
+                keep = component[i] != component[j]
+                i,j = np.minimum(i[keep], j[keep]),np.maximum(i[keep], j[keep])
+                if len(i) == 0:
+                    continue
+                dist = self.engine.paired(x[i], y[i], None if a is None else a[i],
+                                          x[j], y[j], None if a is None else a[j])
+
+                # shortest edge per component with ties broken by the positions
+                labels = np.concatenate((component[i], component[j]))
+                dist = np.concatenate((dist, dist))
+                previous = best[labels]
+                np.minimum.at(best, labels, dist)
+                shortest = np.flatnonzero(dist == best[labels])
+                i = np.concatenate((i, i))[shortest]
+                j = np.concatenate((j, j))[shortest]
+                labels,dist,previous = labels[shortest],dist[shortest],previous[shortest]
+                order = np.lexsort((j, i, labels))
+                first_label = np.ones(len(order), dtype=bool)
+                first_label[1:] = labels[order][1:] != labels[order][:-1]
+                order = order[first_label]
+                labels,dist,previous,i,j = labels[order],dist[order],previous[order],i[order],j[order]
+                better = (dist < previous) | (i < best_first[labels]) | \
+                         ((i == best_first[labels]) & (j < best_second[labels]))
+                labels = labels[better]
+                best_first[labels] = i[better]
+                best_second[labels] = j[better]
+                bound[labels] = np.minimum(bound[labels], dist[better])
+
+        while edges < n-1:
+
+            if self.canceled():
+                return None
+
+            # component of every node (-1 for nodes with several components)
+            low = aggregate(component, np.minimum)
+            node_component = np.where(low == aggregate(component, np.maximum), low, -1)
+
+            # bound every component by the smallest node with another component
+            ancestor = leaves.copy()
+            single = node_component[ancestor] >= 0
+            while single.any():
+                ancestor[single] = parent[ancestor[single]]
+                single = node_component[ancestor] >= 0
+            bound[:] = np.inf
+            np.minimum.at(bound, component, np.repeat(diameter[ancestor],
+                                                      tree.end[leaves]-tree.start[leaves]))
+            best[:] = np.inf
+            best_first[:] = n
+            best_second[:] = n
+
+            # tighten the bounds within leaves before the traversal
+            mixed = leaves[node_component[leaves] < 0]
+            scan(mixed, mixed)
+            node_bound = aggregate(bound[component], np.maximum)
+
+            # traverse pairs of nodes level by level
+            q = np.zeros(1, dtype=np.intp)
+            r = np.zeros(1, dtype=np.intp)
+            while len(q) > 0:
+
+                if self.canceled():
+                    return None
+
+                lower,_ = self.engine.paired_box_bounds(tree.lo[q], tree.hi[q],
+                                                        tree.lo[r], tree.hi[r])
+                keep = (lower <= np.maximum(node_bound[q], node_bound[r])) & \
+                       ((node_component[q] < 0) | (node_component[q] != node_component[r]))
+                q,r = q[keep],r[keep]
+                leaf = is_leaf[q] & is_leaf[r]
+                scan(q[leaf & (q != r)], r[leaf & (q != r)])
+
+                # split inner nodes, visiting pairs of children of one node once
+                q,r = q[~leaf],r[~leaf]
+                split_q,split_r = ~is_leaf[q],~is_leaf[r]
+                cross = split_q & (q != r)
+                both = split_q & split_r
+                q_first = np.where(split_q, tree.left[q], q)
+                r_first = np.where(split_r, tree.left[r], r)
+                q,r = (np.concatenate((q_first, q_first[split_r], tree.right[q[cross]],
+                                       tree.right[q[both]])),
+                       np.concatenate((r_first, tree.right[r[split_r]], r_first[cross],
+                                       tree.right[r[both]])))
+
+            # join every component with the component across its shortest edge
+            roots = np.flatnonzero(component == np.arange(n))
+            target = np.arange(n)
+            target[roots] = np.where(component[best_first[roots]] == roots,
+                                     component[best_second[roots]], component[best_first[roots]])
+            kept = (target[target[roots]] == roots) & (roots < target[roots])
+            joined = roots[~kept]
+            target[roots[kept]] = roots[kept]
+            while True:
+                jumped = target[target]
+                if np.array_equal(jumped, target):
+                    break
+                target = jumped
+            component = target[component]
+            merges[edges:edges+len(joined)] = np.column_stack((tree.perm[best_first[joined]],
+                                                               tree.perm[best_second[joined]],
+                                                               best[joined]))
+            edges += len(joined)
+
+            self.progress(edges/(n-1))
+
+        return merges
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ ClusterPoints
+                                 A QGIS plugin
+ Cluster Points conducts spatial clustering of points based on their mutual distance to each other. The user can select between the K-Means algorithm and (agglomerative) hierarchical clustering with several different link functions.
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2020-03-30
+        copyright            : (C) 2020 by Johannes Jenkner
+        email                : jjenkner@web.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Johannes Jenkner'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026 by Johannes Jenkner'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import numpy as np
+
+
+class KDTree:
+    '''
+    Array-based kd-tree over the rows of a coordinate matrix: nodes are
+    stored in flat arrays with their bounding boxes and the contiguous
+    range of their points in the permuted row order
+    '''
+    def __init__(self, coords, leaf_size=16):
+        """!
+        @brief Constructor of the kd-tree.
+
+        @param[in] coords (array): n x D matrix of point coordinates.
+        @param[in] leaf_size (uint): Maximum number of points in a leaf.
+        """
+
+        coords = np.asarray(coords, dtype=float)
+        n = len(coords)
+        self.perm = np.arange(n)
+        lo = []
+        hi = []
+        start = []
+        end = []
+        left = []
+        right = []
+
+        # split the widest dimension at the median until leaves are small
+        stack = [(0, n, -1, False)]
+        while stack:
+            first, last, parent, is_right = stack.pop()
+            node = len(start)
+            if parent >= 0:
+                if is_right:
+                    right[parent] = node
+                else:
+                    left[parent] = node
+            box = coords[self.perm[first:last]]
+            lo.append(box.min(axis=0))
+            hi.append(box.max(axis=0))
+            start.append(first)
+            end.append(last)
+            left.append(-1)
+            right.append(-1)
+            if last-first > leaf_size:
+                dim = int(np.argmax(hi[-1]-lo[-1]))
+                if hi[-1][dim] > lo[-1][dim]:
+                    middle = (last-first)//2
+                    order = np.argpartition(box[:,dim], middle)
+                    self.perm[first:last] = self.perm[first:last][order]
+                    stack.append((first+middle, last, node, True))
+                    stack.append((first, first+middle, node, False))
+
+        self.lo = np.array(lo).reshape(len(start), coords.shape[1])
+        self.hi = np.array(hi).reshape(len(start), coords.shape[1])
+        self.start = np.array(start, dtype=np.intp)
+        self.end = np.array(end, dtype=np.intp)
+        self.left = np.array(left, dtype=np.intp)
+        self.right = np.array(right, dtype=np.intp)
+
+    def __len__(self):
+        return len(self.start)
+
+    def is_leaf(self, nodes):
+        return self.left[nodes] < 0
+
+    def members(self, nodes):
+        '''
+        Row indices of the points in the given nodes (concatenated)
+        and the number of points per node
+        '''
+        counts = self.end[nodes]-self.start[nodes]
+        offsets = np.repeat(self.start[nodes]-np.cumsum(counts)+counts, counts)
+        return self.perm[offsets+np.arange(counts.sum())], counts
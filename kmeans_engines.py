@@ -0,0 +1,806 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ ClusterPoints
+                                 A QGIS plugin
+ Cluster Points conducts spatial clustering of points based on their mutual distance to each other. The user can select between the K-Means algorithm and (agglomerative) hierarchical clustering with several different link functions.
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2020-03-30
+        copyright            : (C) 2020 by Johannes Jenkner
+        email                : jjenkner@web.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Johannes Jenkner'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026 by Johannes Jenkner'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+from concurrent.futures import FIRST_COMPLETED,ThreadPoolExecutor,wait
+from os import cpu_count
+from sys import float_info
+import threading
+
+import numpy as np
+
+from .point_store import PointStore
+from .kd_tree import KDTree
+
+
+class EmptyClusterError(Exception):
+    '''
+    Raised when a cluster loses all of its members
+    '''
+
+
+def centroids_from_labels(points, labels, k):
+    '''
+    Point store with the weighted mean coordinates and attributes of the
+    members of each of the k clusters and their total weights
+    '''
+    if (np.bincount(labels, minlength=k) == 0).any():
+        raise EmptyClusterError("Empty cluster")
+    w = points.weights
+    total = np.bincount(labels, weights=w, minlength=k)
+    x = np.bincount(labels, weights=w*points.x, minlength=k)/total
+    y = np.bincount(labels, weights=w*points.y, minlength=k)/total
+    attributes = np.empty((k,points.attr_size))
+    for j in range(points.attr_size):
+        attributes[:,j] = np.bincount(labels, weights=w*points.attributes[:,j],
+                                      minlength=k)/total
+    return PointStore(np.arange(k), x, y, attributes, total)
+
+
+def kmeans_plusplus(engine, points, k, sampler):
+    """
+    Initializes the K-means algorithm according to
+    Arthur, D. and Vassilvitskii, S. (2007)
+    Referred to as K-means++
+    Keeps the distance of every point to its closest seed and draws
+    from the cumulative sums with a binary search (multiplied by the
+    weights of weighted points)
+    Returns the row indices of the initial centroids
+    """
+
+    x,y,a = points.x,points.y,points.a
+    weights = points.weights if points.weighted else None
+
+    # draw first point randomly from dataset with uniform (or given) weights
+    if weights is None:
+        inits = [sampler.choice(range(len(points)))]
+    else:
+        inits = [draw(np.cumsum(weights), sampler)]
+
+    closest = np.full(len(points), np.inf)
+    while len(inits)<k:
+        # update distances to the closest seed with the latest seed
+        new = inits[-1]
+        np.minimum(closest, engine.cdist(x, y, a, x[new:new+1], y[new:new+1],
+                                         None if a is None else a[new:new+1])[:,0],
+                   out=closest)
+        # draw new point randomly with probability weights
+        inits.append(draw(np.cumsum(closest if weights is None else closest*weights),
+                          sampler))
+
+    return inits
+
+
+def kmeans_parallel(engine, points, k, sampler, oversampling=None, rounds=5):
+    """
+    Initializes the K-means algorithm according to
+    Bahmani, B. et al. (2012)
+    Referred to as K-means||
+    Samples about oversampling candidates per round independently, weights
+    the candidates by the number of points closest to them and reduces
+    them to k seeds with weighted K-means++
+    Returns the row indices of the initial centroids
+    """
+
+    x,y,a = points.x,points.y,points.a
+    n = len(points)
+    if oversampling is None:
+        oversampling = max(1, k//2)
+    rng = np.random.default_rng(sampler.getrandbits(32))
+
+    # draw first point randomly from dataset with uniform weights
+    candidates = [sampler.choice(range(n))]
+    closest = engine.cdist(x, y, a, x[candidates], y[candidates],
+                           None if a is None else a[candidates])[:,0]
+    for _ in range(rounds):
+        cost = points.weights*closest
+        if cost.sum() <= 0:
+            break
+        new = np.flatnonzero(rng.random(n) < oversampling*cost/cost.sum())
+        if len(new) == 0:
+            continue
+        candidates.extend(new.tolist())
+        np.minimum(closest, engine.nearest(x, y, a, x[new], y[new],
+                                           None if a is None else a[new])[1],
+                   out=closest)
+
+    if len(candidates) <= k:
+        return kmeans_plusplus(engine, points, k, sampler)
+
+    candidates = np.array(candidates)
+    labels,_ = engine.nearest(x, y, a, x[candidates], y[candidates],
+                              None if a is None else a[candidates])
+    candidate_points = points.subset(candidates)
+    candidate_points.weights = np.bincount(labels, weights=points.weights,
+                                           minlength=len(candidates))
+    inits = kmeans_plusplus(engine, candidate_points, k, sampler)
+    return candidates[inits].tolist()
+
+
+def sensitivity_coreset(engine, points, k, size, sampler):
+    """
+    Builds a weighted coreset by sensitivity sampling according to
+    Feldman, D. and Langberg, M. (2011) and Bachem, O. et al. (2018)
+    The sensitivity of every point is bounded with a rough K-means++
+    solution by its share of the total distance plus its share of the
+    weight of its rough cluster; size points are drawn with probabilities
+    proportional to the sensitivities and weighted with their inverse
+    probabilities, so that the total weight is preserved in expectation
+    Returns the coreset with repeatedly drawn points merged
+    """
+
+    x,y,a = points.x,points.y,points.a
+    w = points.weights
+    rng = np.random.default_rng(sampler.getrandbits(32))
+
+    # rough solution and the distance of every point to it
+    seeds = kmeans_plusplus(engine, points, k, sampler)
+    labels,dist = engine.nearest(x, y, a, x[seeds], y[seeds],
+                                 None if a is None else a[seeds])
+    cost = w*dist
+    sensitivity = w/np.bincount(labels, weights=w, minlength=k)[labels]
+    if cost.sum() > 0:
+        sensitivity += cost/cost.sum()
+    probability = sensitivity/sensitivity.sum()
+
+    rows,counts = np.unique(rng.choice(len(points), size, p=probability),
+                            return_counts=True)
+    coreset = points.subset(rows)
+    coreset.weights = counts*w[rows]/(size*probability[rows])
+    return coreset
+
+
+def run_restarts(run, count, canceled=None, workers=None):
+    """
+    Calls run(index, canceled) for every index in range(count) and returns
+    the results in order (None if canceled)
+    Restarts run in a pool of threads: forking from the thread of a QgsTask
+    would copy the locks held by the other QGIS threads, and spawned
+    interpreters cannot receive the QGIS objects of the engines. Threads
+    only run in parallel where the vectorized NumPy kernels release the
+    GIL; engines measuring with QgsDistanceArea hold it in Python loops
+    and must use a single worker (workers=1)
+    """
+
+    canceled = canceled if canceled is not None else lambda: False
+    if count == 1:
+        return [run(0, canceled)]
+
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(min(count, workers or cpu_count() or 1))
+    try:
+        futures = [executor.submit(run, index, stop.is_set) for index in range(count)]
+        pending = set(futures)
+        while pending:
+            _,pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            if canceled():
+                stop.set()
+                wait(pending)
+                return None
+        return [future.result() for future in futures]
+    finally:
+        executor.shutdown()
+
+
+def draw(cumulative, sampler):
+    """
+    Index drawn randomly with probabilities given by cumulative weights
+    """
+
+    p = sampler.uniform(0,cumulative[-1]-float_info.epsilon)
+    return int(np.searchsorted(cumulative, p, side='right'))
+
+
+class LloydKMeans:
+    '''
+    Vectorized K-Means (Lloyd's algorithm): each iteration computes all
+    point-to-centroid distances in blocks, assigns the points with argmin
+    and updates the centroids with bincount sums
+    '''
+    def __init__(self, engine, cutoff, canceled=None, max_iterations=None):
+        """!
+        @brief Constructor of the K-Means engine.
+
+        @param[in] engine (DistanceEngine): Distance calculation reference.
+        @param[in] cutoff (float): Centroid shift for termination of iterations.
+        @param[in] canceled (callable): Returns True if the computation should stop.
+        @param[in] max_iterations (uint): Maximum number of iterations (None for no limit).
+        """
+
+        self.engine = engine
+        self.cutoff = cutoff
+        self.canceled = canceled if canceled is not None else lambda: False
+        self.max_iterations = max_iterations
+
+        self.iterations = 0
+        self.shift = 0.0
+        self.converged = False
+        # number of computed point-to-centroid distances
+        self.evaluations = 0
+        # number of points moved into empty clusters
+        self.repairs = 0
+        self.labels = None
+        self.centroids = None
+
+    def assign(self, points, centroids):
+        '''
+        Index of and distance to the closest centroid for every point
+        '''
+        self.evaluations += len(points)*len(centroids)
+        return self.engine.nearest(points.x, points.y, points.a,
+                                   centroids.x, centroids.y, centroids.a)
+
+    def fit(self, points, centroids):
+        '''
+        Iterates until the centroids stabilize, starting from the given
+        centroids; returns the cluster index of every point or None if canceled
+        '''
+        k = len(centroids)
+        labels = None
+        while True:
+
+            if self.canceled():
+                return None
+
+            self.iterations += 1
+
+            previous = labels
+            labels,dist = self.assign(points, centroids)
+            self.repair(points, centroids, labels, dist)
+
+            # centroids are already the means of unchanged clusters
+            if previous is not None and np.array_equal(labels, previous):
+                self.shift = 0.0
+                break
+
+            new_centroids = centroids_from_labels(points, labels, k)
+            self.shift = self.shift_of(new_centroids, centroids)
+            centroids = new_centroids
+
+            if self.shift < self.cutoff or self.exhausted():
+                break
+
+        self.converged = self.shift < self.cutoff
+        self.labels = labels
+        self.centroids = centroids
+        return labels
+
+    def exhausted(self):
+        '''
+        True if the maximum number of iterations is reached
+        '''
+        return self.max_iterations is not None and self.iterations >= self.max_iterations
+
+    def repair(self, points, centroids, labels, dist=None):
+        '''
+        Re-seeds empty clusters in place with the points farthest from
+        their centroids (taken from clusters with further members);
+        returns the rows of the moved points
+        '''
+        k = len(centroids)
+        counts = np.bincount(labels, minlength=k)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty) == 0:
+            return empty
+
+        if dist is None:
+            self.evaluations += len(points)
+            dist = self.engine.paired(points.x, points.y, points.a,
+                                      centroids.x[labels], centroids.y[labels],
+                                      None if centroids.a is None else centroids.a[labels])
+        moved = []
+        for row in np.argsort(-dist, kind='stable'):
+            if len(moved) == len(empty):
+                break
+            if counts[labels[row]] > 1:
+                counts[labels[row]] -= 1
+                labels[row] = empty[len(moved)]
+                counts[labels[row]] += 1
+                moved.append(row)
+        self.repairs += len(moved)
+        return np.array(moved, dtype=np.intp)
+
+    def shift_of(self, new_centroids, centroids):
+        '''
+        Largest distance moved by any centroid
+        '''
+        return float(self.engine.paired(new_centroids.x, new_centroids.y, new_centroids.a,
+                                        centroids.x, centroids.y, centroids.a).max())
+
+
+class HamerlyKMeans(LloydKMeans):
+    '''
+    K-Means with the triangle inequality bounds of Hamerly (2010):
+    an upper bound on the distance to the own centroid and a lower bound
+    on the distance to all other centroids let most points keep their
+    cluster without any distance evaluation in later iterations
+    '''
+    def fit(self, points, centroids):
+        '''
+        Iterates until the centroids stabilize, starting from the given
+        centroids; returns the cluster index of every point or None if canceled
+        '''
+        k = len(centroids)
+        x,y,a = points.x,points.y,points.a
+        labels = None
+        while True:
+
+            if self.canceled():
+                return None
+
+            self.iterations += 1
+
+            previous = None if labels is None else labels.copy()
+            if labels is None:
+                self.evaluations += len(points)*k
+                labels,upper,lower = self.engine.nearest_two(x, y, a,
+                                                             centroids.x, centroids.y, centroids.a)
+            else:
+                # half the distance from each centroid to its closest neighbour
+                between = self.engine.cdist(centroids.x, centroids.y, centroids.a,
+                                            centroids.x, centroids.y, centroids.a)
+                np.fill_diagonal(between, np.inf)
+                bound = np.maximum(0.5*between.min(axis=1)[labels], lower)
+
+                # tighten the upper bound where it does not settle the assignment
+                rows = np.flatnonzero(upper > bound)
+                if len(rows) > 0:
+                    own = labels[rows]
+                    self.evaluations += len(rows)
+                    upper[rows] = self.engine.paired(x[rows], y[rows],
+                                                     None if a is None else a[rows],
+                                                     centroids.x[own], centroids.y[own],
+                                                     None if centroids.a is None else centroids.a[own])
+                    rows = rows[upper[rows] > bound[rows]]
+
+                # search all centroids for the remaining points
+                if len(rows) > 0:
+                    self.evaluations += len(rows)*k
+                    labels[rows],upper[rows],lower[rows] = self.engine.nearest_two(
+                        x[rows], y[rows], None if a is None else a[rows],
+                        centroids.x, centroids.y, centroids.a)
+
+            # moved points get exact bounds in the next iteration
+            rows = self.repair(points, centroids, labels)
+            upper[rows] = np.inf
+            lower[rows] = 0.0
+
+            # centroids are already the means of unchanged clusters
+            if previous is not None and np.array_equal(labels, previous):
+                self.shift = 0.0
+                break
+
+            new_centroids = centroids_from_labels(points, labels, k)
+            moved = self.engine.paired(new_centroids.x, new_centroids.y, new_centroids.a,
+                                       centroids.x, centroids.y, centroids.a)
+            self.shift = float(moved.max())
+            centroids = new_centroids
+
+            if self.shift < self.cutoff or self.exhausted():
+                break
+
+            # shift the bounds by the movement of the centroids
+            order = np.argsort(moved)
+            upper += moved[labels]
+            lower -= np.where(labels==order[-1], moved[order[-2]], moved[order[-1]])
+
+        self.converged = self.shift < self.cutoff
+        self.labels = labels
+        self.centroids = centroids
+        return labels
+
+
+class MiniBatchKMeans(LloydKMeans):
+    '''
+    Mini-Batch K-Means according to Sculley (2010): each iteration
+    assigns a random batch of points and moves every centroid towards
+    the mean of its batch members with a per-centroid learning rate of
+    one over the (weighted) number of points assigned so far
+    '''
+    def __init__(self, engine, cutoff, batch_size, max_iterations=100,
+                 rng=None, canceled=None):
+        """!
+        @brief Constructor of the Mini-Batch K-Means engine.
+
+        @param[in] engine (DistanceEngine): Distance calculation reference.
+        @param[in] cutoff (float): Centroid shift for termination of iterations.
+        @param[in] batch_size (uint): Number of points sampled per iteration.
+        @param[in] max_iterations (uint): Maximum number of batch iterations.
+        @param[in] rng (numpy.random.Generator): Random generator for the batches.
+        @param[in] canceled (callable): Returns True if the computation should stop.
+        """
+
+        super().__init__(engine, cutoff, canceled, max_iterations)
+        self.batch_size = batch_size
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def fit(self, points, centroids):
+        '''
+        Iterates over random batches until the centroid shift or the
+        iteration budget is reached, starting from the given centroids;
+        returns the cluster index of every point from a final full
+        assignment or None if canceled
+        '''
+        k = len(centroids)
+        counts = np.zeros(k)
+        self.centroids = centroids
+        while not self.exhausted():
+
+            if self.canceled():
+                return None
+
+            self.iterations += 1
+
+            old = self.centroids
+            batch = points.subset(self.rng.integers(0, len(points), self.batch_size))
+            labels,_ = self.assign(batch, old)
+
+            # per-centroid learning rates as for sequential updates
+            w = batch.weights
+            members = np.bincount(labels, weights=w, minlength=k)
+            counts += members
+            rate = np.divide(1.0, counts, out=np.zeros(k), where=counts>0)
+            x = old.x+rate*(np.bincount(labels, weights=w*batch.x, minlength=k)-members*old.x)
+            y = old.y+rate*(np.bincount(labels, weights=w*batch.y, minlength=k)-members*old.y)
+            attributes = np.empty((k,points.attr_size))
+            for j in range(points.attr_size):
+                attributes[:,j] = old.attributes[:,j]+rate* \
+                    (np.bincount(labels, weights=w*batch.attributes[:,j], minlength=k)- \
+                     members*old.attributes[:,j])
+
+            self.centroids = PointStore(np.arange(k), x, y, attributes)
+            self.shift = self.shift_of(self.centroids, old)
+            if self.shift < self.cutoff:
+                break
+
+        # final full assignment of all points
+        self.converged = self.shift < self.cutoff
+        self.labels,dist = self.assign(points, self.centroids)
+        self.repair(points, self.centroids, self.labels, dist)
+        return self.labels
+
+
+class StreamingKMeans(LloydKMeans):
+    '''
+    K-Means on a stream of point chunks holding one chunk at a time:
+    the first pass moves every centroid towards the mean of its chunk
+    members after each chunk (sequential K-Means of MacQueen (1967) with
+    weighted learning rates), further passes accumulate the weighted sums
+    of exact Lloyd iterations over all chunks
+    '''
+    def fit(self, chunks, centroids):
+        '''
+        Iterates until the centroids stabilize, starting from the given
+        centroids, with chunks() returning a new iterator over point stores
+        for every pass; returns the final centroids or None if canceled
+        '''
+        k = len(centroids)
+        centroids = PointStore(np.arange(k), centroids.x, centroids.y,
+                               centroids.attributes, np.zeros(k))
+        while True:
+
+            if self.canceled():
+                return None
+
+            self.iterations += 1
+
+            online = self.iterations == 1
+            x,y = centroids.x.copy(),centroids.y.copy()
+            attributes = centroids.attributes.copy()
+            total = np.zeros(k)
+            sx,sy,sa = np.zeros(k),np.zeros(k),np.zeros(attributes.shape)
+            for chunk in chunks():
+                if self.canceled():
+                    return None
+                labels,_ = self.assign(chunk, PointStore(np.arange(k), x, y, attributes) \
+                                       if online else centroids)
+                w = chunk.weights
+                members = np.bincount(labels, weights=w, minlength=k)
+                cx = np.bincount(labels, weights=w*chunk.x, minlength=k)
+                cy = np.bincount(labels, weights=w*chunk.y, minlength=k)
+                ca = np.empty(attributes.shape)
+                for j in range(chunk.attr_size):
+                    ca[:,j] = np.bincount(labels, weights=w*chunk.attributes[:,j], minlength=k)
+                total += members
+                if online:
+                    # per-centroid learning rates as for sequential updates
+                    rate = np.divide(1.0, total, out=np.zeros(k), where=total>0)
+                    x += rate*(cx-members*x)
+                    y += rate*(cy-members*y)
+                    attributes += rate[:,None]*(ca-members[:,None]*attributes)
+                else:
+                    sx += cx
+                    sy += cy
+                    sa += ca
+
+            # clusters without members in this pass keep their centroids
+            if not online:
+                filled = total > 0
+                x[filled] = sx[filled]/total[filled]
+                y[filled] = sy[filled]/total[filled]
+                attributes[filled] = sa[filled]/total[filled,None]
+
+            new_centroids = PointStore(np.arange(k), x, y, attributes, total)
+            self.shift = self.shift_of(new_centroids, centroids)
+            centroids = new_centroids
+
+            if self.shift < self.cutoff or self.exhausted():
+                break
+
+        self.converged = self.shift < self.cutoff
+        self.centroids = centroids
+        return centroids
+
+
+class KDTreeKMeans(LloydKMeans):
+    '''
+    K-Means with the filtering algorithm of Kanungo et al. (2002):
+    a kd-tree over coordinates and standardized attributes is traversed
+    level by level and candidate centroids are discarded for a whole node
+    if they cannot be closest to any point of its bounding box, so that
+    distances are only computed for points in leaves with several
+    remaining candidates (planar distances only)
+    '''
+    def __init__(self, engine, cutoff, canceled=None, max_iterations=None, leaf_size=16):
+        """!
+        @brief Constructor of the kd-tree filtering K-Means engine.
+
+        @param[in] engine (DistanceEngine): Distance calculation reference (planar).
+        @param[in] cutoff (float): Centroid shift for termination of iterations.
+        @param[in] canceled (callable): Returns True if the computation should stop.
+        @param[in] max_iterations (uint): Maximum number of iterations (None for no limit).
+        @param[in] leaf_size (uint): Maximum number of points in a leaf of the kd-tree.
+        """
+
+        super().__init__(engine, cutoff, canceled, max_iterations)
+        self.leaf_size = leaf_size
+        self.tree = None
+
+    def fit(self, points, centroids):
+        '''
+        Builds the kd-tree once and iterates as Lloyd's algorithm
+        '''
+        self.tree = KDTree(np.column_stack((points.x, points.y, points.attributes)),
+                           self.leaf_size)
+        return super().fit(points, centroids)
+
+    def assign(self, points, centroids):
+        '''
+        Index of the closest centroid for every point (the distances
+        are not returned as they are not computed for filtered nodes)
+        '''
+        tree = self.tree
+        k = len(centroids)
+        labels = np.empty(len(points), dtype=np.intp)
+
+        nodes = np.zeros(1, dtype=np.intp)
+        candidates = np.ones((1,k), dtype=bool)
+        while len(nodes) > 0:
+
+            # discard centroids farther than the closest worst case
+            self.evaluations += len(nodes)*k
+            lower,upper = self.engine.box_bounds(tree.lo[nodes], tree.hi[nodes],
+                                                 centroids.x, centroids.y, centroids.a)
+            upper[~candidates] = np.inf
+            candidates &= lower <= upper.min(axis=1)[:,None]
+            single = candidates.sum(axis=1) == 1
+
+            # assign whole nodes with a single remaining candidate
+            rows,counts = tree.members(nodes[single])
+            labels[rows] = np.repeat(candidates[single].argmax(axis=1), counts)
+
+            # compute distances to the remaining candidates in leaves
+            leaf = ~single & tree.is_leaf(nodes)
+            if leaf.any():
+                rows,counts = tree.members(nodes[leaf])
+                pair_rows,pair_labels = np.nonzero(np.repeat(candidates[leaf], counts, axis=0))
+                pair_points = rows[pair_rows]
+                self.evaluations += len(pair_points)
+                dist = self.engine.paired(points.x[pair_points], points.y[pair_points],
+                                          None if points.a is None else points.a[pair_points],
+                                          centroids.x[pair_labels], centroids.y[pair_labels],
+                                          None if centroids.a is None else centroids.a[pair_labels])
+                # first candidate with the minimum distance per point
+                first = np.r_[0, np.cumsum(np.bincount(pair_rows))[:-1]]
+                hits = np.flatnonzero(dist == np.repeat(np.minimum.reduceat(dist, first),
+                                                        np.diff(np.r_[first, len(dist)])))
+                hits = hits[np.r_[True, pair_rows[hits][1:] != pair_rows[hits][:-1]]]
+                labels[pair_points[hits]] = pair_labels[hits]
+
+            # descend into both children of the remaining inner nodes
+            inner = ~single & ~tree.is_leaf(nodes)
+            nodes = np.concatenate((tree.left[nodes[inner]], tree.right[nodes[inner]]))
+            candidates = np.concatenate((candidates[inner], candidates[inner]))
+
+        return labels, None
+
+
+class FuzzyCMeans:
+    '''
+    Vectorized Fuzzy C-Means (Bezdek, 1981): the memberships of all
+    points are kept as a k x n array (raised to the power of the
+    fuzzifier), updated by broadcasting over the point-to-centroid
+    distances, and the centroids follow from matrix products
+    '''
+    def __init__(self, engine, fuzzifier, cutoff, canceled=None, max_iterations=None,
+                 floor=1.e6*float_info.epsilon):
+        """!
+        @brief Constructor of the Fuzzy C-Means engine.
+
+        @param[in] engine (DistanceEngine): Distance calculation reference.
+        @param[in] fuzzifier (float): Fuzzifier coefficient m (> 1).
+        @param[in] cutoff (float): Centroid shift for termination of iterations.
+        @param[in] canceled (callable): Returns True if the computation should stop.
+        @param[in] max_iterations (uint): Maximum number of iterations (None for no limit).
+        @param[in] floor (float): Smallest distance of a point to a centroid in the
+                                  membership formula (avoids division by zero).
+        """
+
+        self.engine = engine
+        self.m = fuzzifier
+        self.cutoff = cutoff
+        self.floor = floor
+        self.canceled = canceled if canceled is not None else lambda: False
+        self.max_iterations = max_iterations
+
+        self.iterations = 0
+        self.shift = 0.0
+        self.converged = False
+        self.centroids = None
+
+    def memberships(self, points, centroids):
+        '''
+        Memberships of all points (columns) in the clusters (rows)
+        raised to the power of the fuzzifier
+        '''
+        weights = self.engine.cdist(centroids.x, centroids.y,
+                                    None if points.a is None else centroids.attributes,
+                                    points.x, points.y, points.a)
+        np.maximum(weights, self.floor, out=weights)
+        weights **= -2.0/(self.m-1.0)
+        weights /= weights.sum(axis=0)
+        weights **= self.m
+        return weights
+
+    def update(self, points, weights, centroids):
+        '''
+        Means of all points weighted with the memberships for every cluster
+        '''
+        weighted = weights*points.weights
+        total = weighted.sum(axis=1)
+        return PointStore(np.arange(len(centroids)), weighted@points.x/total,
+                          weighted@points.y/total, weighted@points.attributes/total[:,None])
+
+    def labels(self, weights):
+        '''
+        Cluster with the highest membership for every point
+        '''
+        return weights.argmax(axis=0)
+
+    def fit(self, points, centroids):
+        '''
+        Iterates until the centroids stabilize, starting from the given
+        centroids; returns the memberships or None if canceled
+        '''
+        while True:
+
+            if self.canceled():
+                return None
+
+            self.iterations += 1
+
+            weights = self.memberships(points, centroids)
+            new_centroids = self.update(points, weights, centroids)
+
+            self.shift = float(self.engine.paired(new_centroids.x, new_centroids.y,
+                                                  new_centroids.a, centroids.x,
+                                                  centroids.y, centroids.a).max())
+            centroids = new_centroids
+
+            if self.shift < self.cutoff or (self.max_iterations is not None and \
+                                            self.iterations >= self.max_iterations):
+                break
+
+        self.converged = self.shift < self.cutoff
+        self.centroids = centroids
+        return weights
+
+
+class SparseFuzzyCMeans(FuzzyCMeans):
+    '''
+    Truncated Fuzzy C-Means: only the memberships in the clusters of the
+    top closest centroids are kept for every point (renormalized to a
+    sum of one) as n x top arrays of cluster indices and memberships, so
+    that memory and centroid updates scale with the number of retained
+    memberships instead of the number of clusters
+    '''
+    def __init__(self, engine, fuzzifier, cutoff, top, canceled=None, max_iterations=None,
+                 floor=1.e6*float_info.epsilon):
+        """!
+        @brief Constructor of the truncated Fuzzy C-Means engine.
+
+        @param[in] engine (DistanceEngine): Distance calculation reference.
+        @param[in] fuzzifier (float): Fuzzifier coefficient m (> 1).
+        @param[in] cutoff (float): Centroid shift for termination of iterations.
+        @param[in] top (uint): Number of memberships kept for every point.
+        @param[in] canceled (callable): Returns True if the computation should stop.
+        @param[in] max_iterations (uint): Maximum number of iterations (None for no limit).
+        @param[in] floor (float): Smallest distance of a point to a centroid in the
+                                  membership formula (avoids division by zero).
+        """
+
+        super().__init__(engine, fuzzifier, cutoff, canceled, max_iterations, floor)
+        self.top = top
+
+    def memberships(self, points, centroids):
+        '''
+        Cluster indices and memberships raised to the power of the fuzzifier
+        for the closest centroids of all points in descending order
+        '''
+        clusters,weights = self.engine.nearest_m(points.x, points.y, points.a,
+                                                 centroids.x, centroids.y,
+                                                 None if points.a is None else \
+                                                 centroids.attributes, self.top)
+        np.maximum(weights, self.floor, out=weights)
+        weights **= -2.0/(self.m-1.0)
+        weights /= weights.sum(axis=1)[:,None]
+        weights **= self.m
+        return clusters, weights
+
+    def update(self, points, weights, centroids):
+        '''
+        Means of all points weighted with the retained memberships for every
+        cluster (clusters without memberships keep their centroids)
+        '''
+        clusters,weights = weights
+        k = len(centroids)
+        top = clusters.shape[1]
+        clusters = clusters.ravel()
+        weighted = (weights*points.weights[:,None]).ravel()
+        total = np.bincount(clusters, weights=weighted, minlength=k)
+        filled = total > 0
+        x,y = centroids.x.copy(),centroids.y.copy()
+        attributes = centroids.attributes.copy()
+        x[filled] = np.bincount(clusters, weights=weighted*np.repeat(points.x, top),
+                                minlength=k)[filled]/total[filled]
+        y[filled] = np.bincount(clusters, weights=weighted*np.repeat(points.y, top),
+                                minlength=k)[filled]/total[filled]
+        for j in range(points.attr_size):
+            attributes[filled,j] = np.bincount(clusters, weights=weighted* \
+                                               np.repeat(points.attributes[:,j], top),
+                                               minlength=k)[filled]/total[filled]
+        return PointStore(np.arange(k), x, y, attributes)
+
+    def labels(self, weights):
+        '''
+        Cluster with the highest membership for every point
+        '''
+        return weights[0][:,0]
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ ClusterPoints
+                                 A QGIS plugin
+ Cluster Points conducts spatial clustering of points based on their mutual distance to each other. The user can select between the K-Means algorithm and (agglomerative) hierarchical clustering with several different link functions.
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2020-03-30
+        copyright            : (C) 2020 by Johannes Jenkner
+        email                : jjenkner@web.de
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Johannes Jenkner'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026 by Johannes Jenkner'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import numpy as np
+
+
+class PointStore:
+    '''
+    Columnar (struct-of-arrays) storage of points for clustering
+    with contiguous coordinate arrays and an attribute matrix
+    '''
+    def __init__(self, fids, x, y, attributes=None, weights=None):
+        """!
+        @brief Constructor of the point store.
+
+        @param[in] fids (array): Feature IDs of the points.
+        @param[in] x (array): x coordinates of the points.
+        @param[in] y (array): y coordinates of the points.
+        @param[in] attributes (array): n x m matrix of attribute values (optional).
+        @param[in] weights (array): Positive weights of the points (optional, default 1).
+        """
+
+        self.fids = np.ascontiguousarray(fids, dtype=np.int64)
+        self.x = np.ascontiguousarray(x, dtype=float)
+        self.y = np.ascontiguousarray(y, dtype=float)
+        if attributes is None:
+            attributes = np.empty((len(self.fids),0))
+        self.attributes = np.ascontiguousarray(attributes, dtype=float)
+        if weights is None:
+            weights = np.ones(len(self.fids))
+        self.weights = np.ascontiguousarray(weights, dtype=float)
+
+        # order of the feature IDs for mapping them to rows (built on demand)
+        self._order = None
+
+    @classmethod
+    def from_features(cls, features, id_attr=(), id_weight=None):
+        '''
+        Builds the store from point features, skipping features with
+        missing values in any of the attribute fields id_attr or in the
+        weight field id_weight
+        '''
+        fids = []
+        x = []
+        y = []
+        attributes = []
+        weights = []
+        for infeat in features:
+            values = []
+            for i in list(id_attr)+([] if id_weight is None else [id_weight]):
+                if infeat[i] or infeat[i]==0:
+                    values.append(infeat[i])
+                else:
+                    break
+            if len(values) < len(id_attr)+(id_weight is not None):
+                continue
+            point = infeat.geometry().asPoint()
+            fids.append(infeat.id())
+            x.append(point.x())
+            y.append(point.y())
+            attributes.append(values[:len(id_attr)])
+            weights.append(values[-1] if id_weight is not None else 1.0)
+        return cls(fids, x, y, np.array(attributes, dtype=float).reshape(len(fids),len(id_attr)),
+                   weights)
+
+    @classmethod
+    def concatenate(cls, stores):
+        '''
+        New store with the points of all given stores in order
+        '''
+        return cls(np.concatenate([store.fids for store in stores]),
+                   np.concatenate([store.x for store in stores]),
+                   np.concatenate([store.y for store in stores]),
+                   np.concatenate([store.attributes for store in stores]),
+                   np.concatenate([store.weights for store in stores]))
+
+    def __len__(self):
+        return len(self.fids)
+
+    @property
+    def attr_size(self):
+        return self.attributes.shape[1]
+
+    @property
+    def weighted(self):
+        '''
+        True if any point has a weight different from 1
+        '''
+        return bool((self.weights != 1).any())
+
+    @property
+    def a(self):
+        '''
+        Attribute matrix as passed to the distance engine (None without attributes)
+        '''
+        return self.attributes if self.attr_size > 0 else None
+
+    def subset(self, rows):
+        '''
+        New store with the given rows
+        '''
+        return PointStore(self.fids[rows], self.x[rows], self.y[rows],
+                          self.attributes[rows], self.weights[rows])
+
+    def merge_duplicates(self, tolerance=0.0):
+        '''
+        New store with one representative for every group of points with
+        identical coordinates and attribute values (or within the same grid
+        cell of size tolerance), weighted with the total weight of its
+        members, and the row of the representative for every point
+        '''
+        columns = np.column_stack((self.x, self.y, self.attributes))
+        if tolerance > 0:
+            columns = np.floor(columns/tolerance)
+        _,first,inverse = np.unique(columns, axis=0, return_index=True, return_inverse=True)
+
+        # keep representatives in the order of their first member
+        order = np.argsort(first)
+        rank = np.empty(len(order), dtype=np.intp)
+        rank[order] = np.arange(len(order))
+        inverse = rank[inverse.ravel()]
+        first = first[order]
+
+        weights = np.bincount(inverse, weights=self.weights)
+        if tolerance > 0:
+            x = np.bincount(inverse, weights=self.weights*self.x)/weights
+            y = np.bincount(inverse, weights=self.weights*self.y)/weights
+            attributes = np.empty((len(first),self.attr_size))
+            for j in range(self.attr_size):
+                attributes[:,j] = np.bincount(inverse, weights=self.weights* \
+                                              self.attributes[:,j])/weights
+        else:
+            x,y,attributes = self.x[first],self.y[first],self.attributes[first]
+        return PointStore(self.fids[first], x, y, attributes, weights), inverse
+
+    def rows(self, fids):
+        '''
+        Row indices of the given feature IDs
+        '''
+        if self._order is None:
+            self._order = np.argsort(self.fids, kind='stable')
+        fids = np.asarray(fids, dtype=np.int64)
+        return self._order[np.searchsorted(self.fids, fids, sorter=self._order)]
+
+    def row(self, fid):
+        '''
+        Row index of a single feature ID
+        '''
+        return int(self.rows([fid])[0])
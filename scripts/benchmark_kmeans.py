@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the K-Means iteration schemes on synthetic planar data
+
+Runs Lloyd's algorithm and kd-tree filtering from the same K-Means++
+seeds for a grid of point and cluster numbers and prints the run time,
+the number of computed distances and whether both schemes agree.
+The numerical modules of the plugin do not need QGIS, e.g.
+
+    python scripts/benchmark_kmeans.py --points 10000 100000 --clusters 10 100
+"""
+
+import argparse
+import importlib
+import os
+import random
+import sys
+from time import perf_counter
+
+import numpy as np
+
+plugin_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(plugin_dir))
+plugin = os.path.basename(plugin_dir)
+distance_engine = importlib.import_module(plugin+'.distance_engine')
+kmeans_engines = importlib.import_module(plugin+'.kmeans_engines')
+point_store = importlib.import_module(plugin+'.point_store')
+
+
+def synthetic_points(n, attributes, rng, groups=50):
+    '''
+    Points scattered around random group centres with standard normal attributes
+    '''
+    centres = rng.normal(size=(groups,2))*1000
+    members = rng.integers(0, groups, n)
+    return point_store.PointStore(np.arange(n),
+                                  centres[members,0]+rng.normal(size=n)*100,
+                                  centres[members,1]+rng.normal(size=n)*100,
+                                  rng.normal(size=(n,attributes))*100)
+
+
+def run(scheme, engine, points, inits, cutoff):
+    start = perf_counter()
+    kmeans = scheme(engine, cutoff)
+    labels = kmeans.fit(points, points.subset(inits))
+    return labels, kmeans, perf_counter()-start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--points', type=int, nargs='+', default=[10000, 50000, 200000])
+    parser.add_argument('--clusters', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--attributes', type=int, default=0,
+                        help='number of attribute columns')
+    parser.add_argument('--percent', type=int, default=0,
+                        help='percentage contribution of the attributes')
+    parser.add_argument('--manhattan', action='store_true')
+    parser.add_argument('--cutoff', type=float, default=1.e-3,
+                        help='centroid shift for termination of iterations')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    engine = distance_engine.DistanceEngine(None, args.percent, args.manhattan)
+    print('{:>9} {:>5} {:>6} {:>10} {:>10} {:>8} {:>10} {:>6}'.format(
+          'points', 'k', 'iter', 'lloyd [s]', 'kdtree [s]', 'speedup',
+          'distances', 'equal'))
+    for n in args.points:
+        points = synthetic_points(n, args.attributes, np.random.default_rng(args.seed))
+        for k in args.clusters:
+            if k > n:
+                continue
+            inits = kmeans_engines.kmeans_plusplus(engine, points, k,
+                                                   random.Random(args.seed))
+            labels,lloyd,lloyd_time = run(kmeans_engines.LloydKMeans, engine,
+                                          points, inits, args.cutoff)
+            labels_kd,kdtree,kdtree_time = run(kmeans_engines.KDTreeKMeans, engine,
+                                               points, inits, args.cutoff)
+            print('{:>9} {:>5} {:>6} {:>10.2f} {:>10.2f} {:>8.1f} {:>10.1%} {:>6}'.format(
+                  n, k, lloyd.iterations, lloyd_time, kdtree_time, lloyd_time/kdtree_time,
+                  kdtree.evaluations/lloyd.evaluations,
+                  str(bool((labels == labels_kd).all()))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# coding=utf-8
+"""Tests of the cluster quality scores against brute force definitions.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Johannes Jenkner'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026 by Johannes Jenkner'
+
+import math
+import unittest
+
+import numpy as np
+
+from ..cluster_scores import ClusterScores
+from ..distance_engine import DistanceEngine
+from ..kmeans_engines import LloydKMeans
+from ..point_store import PointStore
+
+
+def brute_force_silhouette(x, y, labels, weights=None):
+    '''
+    Mean silhouette coefficient of planar points with the mean distances
+    and the mean coefficient weighted (zero for points alone in their cluster)
+    '''
+    n = len(x)
+    weights = [1.0]*n if weights is None else weights
+    coefficients = []
+    for i in range(n):
+        dist = {}
+        for j in range(n):
+            if j != i:
+                dist.setdefault(labels[j],[]).append((weights[j],
+                                                      math.hypot(x[i]-x[j],y[i]-y[j])))
+        if labels[i] not in dist:
+            coefficients.append(0.0)
+            continue
+        mean = {label: sum(w*d for w,d in pairs)/sum(w for w,d in pairs)
+                for label,pairs in dist.items()}
+        a = mean[labels[i]]
+        b = min(value for label,value in mean.items() if label != labels[i])
+        coefficients.append((b-a)/max(a,b))
+    return sum(w*c for w,c in zip(weights,coefficients))/sum(weights)
+
+
+def brute_force_calinski_harabasz(x, y, labels):
+    '''
+    Calinski-Harabasz index of unweighted planar points
+    '''
+    n = len(x)
+    clusters = sorted(set(labels))
+    cx,cy = np.mean(x),np.mean(y)
+    between = within = 0.0
+    for label in clusters:
+        members = [i for i in range(n) if labels[i] == label]
+        mx = sum(x[i] for i in members)/len(members)
+        my = sum(y[i] for i in members)/len(members)
+        between += len(members)*((mx-cx)**2+(my-cy)**2)
+        within += sum((x[i]-mx)**2+(y[i]-my)**2 for i in members)
+    k = len(clusters)
+    return between/(k-1)/(within/(n-k))
+
+
+class ClusterScoresTest(unittest.TestCase):
+    """Test the silhouette coefficient and the Calinski-Harabasz index"""
+
+    def setUp(self):
+        rng = np.random.default_rng(9)
+        centres = np.array([[0.0,0.0],[100.0,0.0],[0.0,100.0]])
+        members = rng.integers(0, 3, 90)
+        self.points = PointStore(np.arange(90),
+                                 centres[members,0]+rng.normal(size=90)*15,
+                                 centres[members,1]+rng.normal(size=90)*15)
+        self.engine = DistanceEngine(None,0,False)
+        self.labels = rng.integers(0, 4, 90)
+        # a single point alone in its cluster
+        self.labels[self.labels==3] = 2
+        self.labels[7] = 3
+
+    def test_silhouette(self):
+        """Silhouette of unweighted points equals the definition."""
+        scorer = ClusterScores(self.engine,self.points)
+        self.assertAlmostEqual(scorer.silhouette(self.labels,4),
+                               brute_force_silhouette(self.points.x,self.points.y,
+                                                      self.labels.tolist()))
+
+    def test_sampled_silhouette(self):
+        """Sampled silhouette equals the definition on the sampled points."""
+        scorer = ClusterScores(self.engine,self.points,sample_size=40,
+                               rng=np.random.default_rng(10))
+        sample = scorer.sample
+        self.assertEqual(len(sample),40)
+        self.assertEqual(len(np.unique(sample)),40)
+        labels = self.labels.copy()
+        labels[7] = 0
+        self.assertAlmostEqual(scorer.silhouette(labels,3),
+                               brute_force_silhouette(self.points.x[sample],
+                                                      self.points.y[sample],
+                                                      labels[sample].tolist()))
+
+    def test_weighted_silhouette(self):
+        """Weighted silhouette equals the definition with weighted means."""
+        weighted = self.points.subset(np.arange(90))
+        weighted.weights = np.random.default_rng(11).uniform(0.5, 3.0, 90)
+        scorer = ClusterScores(self.engine,weighted)
+        self.assertAlmostEqual(scorer.silhouette(self.labels,4),
+                               brute_force_silhouette(weighted.x,weighted.y,
+                                                      self.labels.tolist(),
+                                                      weighted.weights.tolist()))
+
+    def test_calinski_harabasz(self):
+        """Calinski-Harabasz index of unweighted points equals the definition."""
+        scorer = ClusterScores(self.engine,self.points)
+        score = scorer.scores(self.labels,4)
+        self.assertAlmostEqual(score['calinski_harabasz'],
+                               brute_force_calinski_harabasz(self.points.x,self.points.y,
+                                                             self.labels.tolist()))
+        self.assertEqual(score['k'],4)
+
+    def test_best(self):
+        """The number of clusters of well separated groups has the highest silhouette."""
+        scorer = ClusterScores(self.engine,self.points)
+        scores = []
+        for k in range(2,6):
+            kmeans = LloydKMeans(self.engine,1.e-6)
+            labels = kmeans.fit(self.points,self.points.subset(np.arange(k)*17))
+            scores.append(scorer.scores(labels,k))
+        best = ClusterScores.best(scores)
+        self.assertEqual(best,3)
+        self.assertEqual(max(score['silhouette'] for score in scores),
+                         scores[best-2]['silhouette'])
+        # the first of tied scores is kept
+        self.assertEqual(ClusterScores.best([{'k': 2,'silhouette': 0.5},
+                                             {'k': 3,'silhouette': 0.5}]),2)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ClusterScoresTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,122 @@
+# coding=utf-8
+"""Tests of the batched distance engine against scalar distances.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Johannes Jenkner'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026 by Johannes Jenkner'
+
+import math
+import unittest
+
+import numpy as np
+
+from .. import distance_engine
+from ..distance_engine import DistanceEngine,manhattan_error_bound
+
+
+def scalar_distance(p1, p2, a1, a2, pa, manhattan):
+    '''
+    Distance of two points computed term by term like the former
+    measureLine based implementation (planar measurements)
+    '''
+    dist = 0
+    if manhattan:
+        if pa < 100:
+            dist += (1-0.01*pa)*(abs(p1[0]-p2[0])+abs(p1[1]-p2[1])+ \
+                                 abs(p1[1]-p2[1])+abs(p1[0]-p2[0]))
+        if pa > 0:
+            dist += 2*0.01*pa*sum(abs(u-v) for u,v in zip(a1,a2))
+    else:
+        if pa < 100:
+            dist += (1-0.01*pa)*math.hypot(p1[0]-p2[0],p1[1]-p2[1])
+        if pa > 0:
+            dist += 0.01*pa*math.sqrt(sum((u-v)**2 for u,v in zip(a1,a2)))
+    return dist
+
+
+class DistanceEngineTest(unittest.TestCase):
+    """Test the vectorized distance kernels"""
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.x1,self.y1 = rng.normal(size=(2,37))*100
+        self.x2,self.y2 = rng.normal(size=(2,11))*100
+        self.a1 = rng.normal(size=(37,3))
+        self.a2 = rng.normal(size=(11,3))
+        self.block_entries = distance_engine.block_entries
+        # small blocks to run through the blocked loops
+        distance_engine.block_entries = 50
+
+    def tearDown(self):
+        distance_engine.block_entries = self.block_entries
+
+    def reference(self, pa, manhattan):
+        return np.array([[scalar_distance((self.x1[i],self.y1[i]),(self.x2[j],self.y2[j]),
+                                          self.a1[i],self.a2[j],pa,manhattan)
+                          for j in range(len(self.x2))] for i in range(len(self.x1))])
+
+    def test_cdist(self):
+        """Distance matrices equal the scalar distances."""
+        for manhattan in (False,True):
+            for pa in (0,30,100):
+                engine = DistanceEngine(None,pa,manhattan)
+                dist = engine.cdist(self.x1,self.y1,self.a1,self.x2,self.y2,self.a2)
+                np.testing.assert_allclose(dist,self.reference(pa,manhattan),rtol=1e-12)
+
+    def test_nearest(self):
+        """Nearest points and distances follow the distance matrix."""
+        reference = self.reference(30,False)
+        engine = DistanceEngine(None,30,False)
+        labels,dist = engine.nearest(self.x1,self.y1,self.a1,self.x2,self.y2,self.a2)
+        np.testing.assert_array_equal(labels,reference.argmin(axis=1))
+        np.testing.assert_allclose(dist,reference.min(axis=1),rtol=1e-12)
+        labels,dist,second = engine.nearest_two(self.x1,self.y1,self.a1,
+                                                self.x2,self.y2,self.a2)
+        np.testing.assert_allclose(second,np.sort(reference,axis=1)[:,1],rtol=1e-12)
+        labels,dist = engine.nearest_m(self.x1,self.y1,self.a1,self.x2,self.y2,self.a2,4)
+        np.testing.assert_allclose(dist,np.sort(reference,axis=1)[:,:4],rtol=1e-12)
+
+    def test_pdist(self):
+        """Condensed distances equal the scalar distances of all pairs i<j."""
+        engine = DistanceEngine(None,30,True)
+        dist = engine.pdist(self.x1,self.y1,self.a1)
+        n = len(self.x1)
+        reference = [scalar_distance((self.x1[i],self.y1[i]),(self.x1[j],self.y1[j]),
+                                     self.a1[i],self.a1[j],30,True)
+                     for i in range(n) for j in range(i+1,n)]
+        np.testing.assert_allclose(dist,reference,rtol=1e-12)
+
+    def test_paired(self):
+        """Paired distances equal the diagonal of the distance matrix."""
+        engine = DistanceEngine(None,30,False)
+        dist = engine.paired(self.x1[:11],self.y1[:11],self.a1[:11],
+                             self.x2,self.y2,self.a2)
+        np.testing.assert_allclose(dist,np.diag(self.reference(30,False)[:11]),rtol=1e-12)
+
+    def test_manhattan_error_bound(self):
+        """Parallel arcs exceed the great circle legs by at most the bound."""
+        rng = np.random.default_rng(7)
+        engine = DistanceEngine(None,0,True,'haversine')
+        for lat,dlon in ((10,5),(60,20),(85,180)):
+            x1,x2 = rng.uniform(0,dlon,(2,500))
+            y1,y2 = rng.uniform(-lat,lat,(2,500))
+            legs = engine._geodesic(x1,y1,x2,y1)+engine._geodesic(x1,y2,x2,y2)+ \
+                   2*engine._geodesic(x1,y1,x1,y2)
+            deviation = (engine._axes(x1,y1,x2,y2)-legs)/legs
+            self.assertGreaterEqual(deviation.min(),-1e-12)
+            self.assertLessEqual(deviation.max(),manhattan_error_bound(lat,dlon))
+        self.assertEqual(manhattan_error_bound(45,0),0.0)
+        self.assertAlmostEqual(manhattan_error_bound(90,180),np.pi/2-1)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(DistanceEngineTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
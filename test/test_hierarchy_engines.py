@@ -0,0 +1,162 @@
+# coding=utf-8
+"""Tests of the hierarchical clustering engines against naive merging.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Johannes Jenkner'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026 by Johannes Jenkner'
+
+import unittest
+
+import numpy as np
+
+from ..distance_engine import DistanceEngine
+from ..hierarchy_engines import (lance_williams,cut_tree,NNChainLinkage,GenericLinkage,
+                                 BoruvkaLinkage)
+from ..point_store import PointStore
+
+
+def naive_linkage(link, dist, sizes):
+    '''
+    Merges the globally closest pair of clusters of a full distance matrix
+    in every step; returns the merge heights in order and the cluster
+    index of every point for every number of clusters
+    '''
+    n = len(sizes)
+    dist = dist.copy()
+    np.fill_diagonal(dist, np.inf)
+    sizes = sizes.astype(float)
+    labels = np.arange(n)
+    heights = []
+    partitions = {n: np.unique(labels, return_inverse=True)[1]}
+    for step in range(n-1):
+        i,j = np.unravel_index(np.argmin(dist), dist.shape)
+        heights.append(dist[i,j])
+        others = np.flatnonzero(np.isfinite(dist[i]) & (np.arange(n) != j))
+        dist[j,others] = dist[others,j] = [lance_williams(link, dist[i,l], dist[j,l],
+                                                          dist[i,j], sizes[i], sizes[j],
+                                                          sizes[l]) for l in others]
+        dist[i,:] = dist[:,i] = np.inf
+        sizes[j] += sizes[i]
+        labels[labels == i] = j
+        partitions[n-step-1] = np.unique(labels, return_inverse=True)[1]
+    return np.array(heights), partitions
+
+
+def prim_edges(dist):
+    '''
+    Edge lengths of the minimum spanning tree of a full distance matrix
+    '''
+    n = len(dist)
+    inside = np.zeros(n, dtype=bool)
+    inside[0] = True
+    closest = dist[0].copy()
+    edges = []
+    for step in range(n-1):
+        j = int(np.argmin(np.where(inside, np.inf, closest)))
+        edges.append(closest[j])
+        inside[j] = True
+        closest = np.minimum(closest, dist[j])
+    return np.sort(edges)
+
+
+def same_partition(labels1, labels2):
+    '''
+    True if both labelings group the points identically
+    '''
+    pairs = np.unique(np.column_stack((labels1, labels2)), axis=0)
+    return len(pairs) == len(np.unique(labels1)) == len(np.unique(labels2))
+
+
+class HierarchyTest(unittest.TestCase):
+    """Test that the linkage engines reproduce naive merging"""
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        n = 60
+        self.x,self.y = rng.normal(size=(2,n))*100
+        self.a = rng.normal(size=(n,2))
+        self.sizes = rng.integers(1, 4, n).astype(float)
+        self.engine = DistanceEngine(None,20,False)
+        condensed = self.engine.pdist(self.x,self.y,self.a)
+        self.dist = np.zeros((n,n))
+        self.dist[np.triu_indices(n,1)] = condensed
+        self.dist += self.dist.T
+        self.ks = (2,3,5,10)
+
+    def check(self, linkage):
+        """Merge heights and tree cuts of an engine equal naive merging."""
+        n = len(self.sizes)
+        heights,partitions = naive_linkage(linkage.link,self.dist,self.sizes)
+        merges = linkage.fit(self.dist[np.triu_indices(n,1)],self.sizes.copy())
+        if linkage.ordered:
+            np.testing.assert_allclose(merges[:,2],heights,rtol=1e-12)
+        else:
+            np.testing.assert_allclose(np.sort(merges[:,2]),np.sort(heights),rtol=1e-12)
+        for k,labels in cut_tree(merges,n,self.ks,linkage.ordered).items():
+            self.assertTrue(same_partition(labels,partitions[k]))
+
+    def test_lance_williams(self):
+        """Updates of single, complete and average linkage equal their definitions."""
+        rng = np.random.default_rng(4)
+        d = rng.uniform(size=(3,5))
+        self.assertTrue(np.allclose(lance_williams('single',d[0],d[1],d[2],2,3,1),
+                                    np.minimum(d[0],d[1])))
+        self.assertTrue(np.allclose(lance_williams('complete',d[0],d[1],d[2],2,3,1),
+                                    np.maximum(d[0],d[1])))
+        self.assertTrue(np.allclose(lance_williams('average',d[0],d[1],d[2],2,3,1),
+                                    0.4*d[0]+0.6*d[1]))
+        with self.assertRaises(ValueError):
+            lance_williams('unknown',d[0],d[1],d[2],2,3,1)
+
+    def test_nn_chain(self):
+        """Nearest-neighbor chains reproduce the reducible linkages."""
+        for link in NNChainLinkage.reducible:
+            self.check(NNChainLinkage(link))
+        with self.assertRaises(ValueError):
+            NNChainLinkage('median')
+
+    def test_generic(self):
+        """The generic algorithm reproduces all linkages in the order of merging."""
+        for link in NNChainLinkage.reducible+('median','centroid'):
+            self.check(GenericLinkage(link))
+
+    def test_boruvka(self):
+        """Minimum spanning tree edges give the single linkage of naive merging."""
+        n = len(self.sizes)
+        points = PointStore(np.arange(n),self.x,self.y,self.a)
+        for manhattan in (False,True):
+            for pa in (0,20):
+                engine = DistanceEngine(None,pa,manhattan)
+                dist = np.zeros((n,n))
+                dist[np.triu_indices(n,1)] = engine.pdist(self.x,self.y,self.a)
+                dist += dist.T
+                merges = BoruvkaLinkage(engine,leaf_size=4).fit(points)
+                np.testing.assert_allclose(np.sort(merges[:,2]),prim_edges(dist),rtol=1e-12)
+                _,partitions = naive_linkage('single',dist,np.ones(n))
+                for k,labels in cut_tree(merges,n,self.ks).items():
+                    self.assertTrue(same_partition(labels,partitions[k]))
+
+    def test_boruvka_duplicates(self):
+        """Co-located points are joined by edges of length zero."""
+        rows = np.repeat(np.arange(20),3)
+        points = PointStore(np.arange(len(rows)),self.x[rows],self.y[rows])
+        engine = DistanceEngine(None,0,False)
+        merges = BoruvkaLinkage(engine,leaf_size=4).fit(points)
+        dist = np.zeros((len(rows),len(rows)))
+        dist[np.triu_indices(len(rows),1)] = engine.pdist(points.x,points.y,None)
+        dist += dist.T
+        np.testing.assert_allclose(np.sort(merges[:,2]),prim_edges(dist),atol=1e-9)
+        self.assertEqual((merges[:,2]==0).sum(),40)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(HierarchyTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,344 @@
+# coding=utf-8
+"""Tests of the K-Means engines against brute force references.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Johannes Jenkner'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026 by Johannes Jenkner'
+
+import random
+import unittest
+from bisect import bisect
+from sys import float_info
+
+import numpy as np
+
+from ..distance_engine import DistanceEngine
+from ..kd_tree import KDTree
+from ..kmeans_engines import (LloydKMeans,HamerlyKMeans,MiniBatchKMeans,KDTreeKMeans,
+                              StreamingKMeans,FuzzyCMeans,SparseFuzzyCMeans,centroids_from_labels,
+                              sensitivity_coreset,kmeans_plusplus,kmeans_parallel)
+from ..point_store import PointStore
+
+
+def synthetic_points(n, attributes, rng, groups=8):
+    '''
+    Points scattered around random group centres with standard normal attributes
+    '''
+    centres = rng.normal(size=(groups,2))*100
+    members = rng.integers(0, groups, n)
+    return PointStore(np.arange(n),
+                      centres[members,0]+rng.normal(size=n)*30,
+                      centres[members,1]+rng.normal(size=n)*30,
+                      rng.normal(size=(n,attributes)),
+                      rng.uniform(0.5, 2.0, n))
+
+
+def brute_force_kmeans(engine, points, centroids):
+    '''
+    Lloyd iterations point by point until the labels do not change
+    '''
+    cx,cy,ca = centroids.x.copy(),centroids.y.copy(),centroids.attributes.copy()
+    labels = None
+    while True:
+        new_labels = np.array([np.argmin([engine.paired(points.x[i:i+1],points.y[i:i+1],
+                                                        points.attributes[i:i+1],
+                                                        cx[j:j+1],cy[j:j+1],ca[j:j+1])[0]
+                                          for j in range(len(cx))])
+                               for i in range(len(points))])
+        if labels is not None and (new_labels==labels).all():
+            return labels
+        labels = new_labels
+        for j in range(len(cx)):
+            w = points.weights[labels==j]
+            cx[j] = np.dot(w,points.x[labels==j])/w.sum()
+            cy[j] = np.dot(w,points.y[labels==j])/w.sum()
+            ca[j] = np.dot(w,points.attributes[labels==j])/w.sum()
+
+
+def brute_force_fuzzy_cmeans(engine, points, centroids, m, iterations):
+    '''
+    Fuzzy C-Means iterations with memberships computed point by point
+    '''
+    cx,cy,ca = centroids.x.copy(),centroids.y.copy(),centroids.attributes.copy()
+    k = len(cx)
+    for iteration in range(iterations):
+        u = np.empty((k,len(points)))
+        for i in range(len(points)):
+            dist = [engine.paired(points.x[i:i+1],points.y[i:i+1],points.attributes[i:i+1],
+                                  cx[j:j+1],cy[j:j+1],ca[j:j+1])[0] for j in range(k)]
+            for j in range(k):
+                u[j,i] = 1/sum((dist[j]/dist[l])**(2/(m-1)) for l in range(k))
+        w = u**m*points.weights
+        cx = w@points.x/w.sum(axis=1)
+        cy = w@points.y/w.sum(axis=1)
+        ca = w@points.attributes/w.sum(axis=1)[:,None]
+    return u, cx, cy
+
+
+def quadratic_plusplus(engine, points, k, sampler):
+    '''
+    K-Means++ seeding as implemented before the linear version: distances
+    to all seeds and all prefix sums are recomputed for every new seed
+    '''
+    x,y,a = points.x,points.y,points.a
+    inits = [sampler.choice(range(len(points)))]
+    while len(inits)<k:
+        weights = engine.cdist(x[inits],y[inits],None if a is None else a[inits],
+                               x,y,a).min(axis=0).tolist()
+        p = sampler.uniform(0,sum(weights)-float_info.epsilon)
+        p = bisect([sum(weights[:i+1]) for i in range(len(weights))],p)
+        inits.append(p)
+    return inits
+
+
+class FullBatches:
+    '''
+    Random generator stand-in drawing every point once per batch
+    '''
+    def integers(self, low, high, size):
+        return np.arange(low, high)
+
+
+class KMeansTest(unittest.TestCase):
+    """Test that the K-Means engines find the same partitions"""
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.points = synthetic_points(400,2,rng)
+        self.inits = rng.choice(len(self.points),6,replace=False)
+
+    def fit(self, scheme, engine):
+        kmeans = scheme(engine,0.0)
+        labels = kmeans.fit(self.points,self.points.subset(self.inits))
+        return labels, kmeans
+
+    def test_lloyd(self):
+        """Lloyd's algorithm equals point by point iterations."""
+        for manhattan in (False,True):
+            engine = DistanceEngine(None,20,manhattan)
+            labels,kmeans = self.fit(LloydKMeans,engine)
+            np.testing.assert_array_equal(labels,brute_force_kmeans(engine,self.points,
+                                          self.points.subset(self.inits)))
+            self.assertEqual(kmeans.shift,0.0)
+
+    def test_hamerly(self):
+        """Hamerly's bounds keep the labels of Lloyd's algorithm."""
+        for manhattan in (False,True):
+            for pa in (0,20):
+                engine = DistanceEngine(None,pa,manhattan)
+                labels,lloyd = self.fit(LloydKMeans,engine)
+                hamerly_labels,hamerly = self.fit(HamerlyKMeans,engine)
+                np.testing.assert_array_equal(hamerly_labels,labels)
+                self.assertEqual(hamerly.iterations,lloyd.iterations)
+                self.assertLess(hamerly.evaluations,lloyd.evaluations)
+
+    def test_kdtree(self):
+        """Kd-tree filtering keeps the labels of Lloyd's algorithm."""
+        for manhattan in (False,True):
+            for pa in (0,20):
+                engine = DistanceEngine(None,pa,manhattan)
+                labels,lloyd = self.fit(LloydKMeans,engine)
+                kdtree_labels,kdtree = self.fit(KDTreeKMeans,engine)
+                np.testing.assert_array_equal(kdtree_labels,labels)
+                self.assertEqual(kdtree.iterations,lloyd.iterations)
+
+    def test_kdtree_nodes(self):
+        """Leaves partition the points and boxes enclose their members."""
+        coords = np.column_stack((self.points.x,self.points.y,self.points.attributes))
+        tree = KDTree(coords,leaf_size=7)
+        for node in range(len(tree)):
+            rows,_ = tree.members(np.array([node]))
+            np.testing.assert_array_equal(coords[rows].min(axis=0),tree.lo[node])
+            np.testing.assert_array_equal(coords[rows].max(axis=0),tree.hi[node])
+        leaves = np.flatnonzero(tree.is_leaf(np.arange(len(tree))))
+        rows,counts = tree.members(leaves)
+        np.testing.assert_array_equal(np.sort(rows),np.arange(len(coords)))
+        self.assertLessEqual(counts.max(),7)
+
+    def test_fuzzy_cmeans(self):
+        """Vectorized memberships and centroids equal point by point iterations."""
+        # no point coincides with an initial centroid
+        points = self.points.subset(np.setdiff1d(np.arange(len(self.points)),self.inits)[:120])
+        centroids = self.points.subset(self.inits)
+        engine = DistanceEngine(None,20,False)
+        fcm = FuzzyCMeans(engine,2.5,0.0,max_iterations=3)
+        weights = fcm.fit(points,centroids)
+        u,cx,cy = brute_force_fuzzy_cmeans(engine,points,centroids,2.5,3)
+        np.testing.assert_allclose(weights,u**2.5,rtol=1e-9)
+        np.testing.assert_allclose(fcm.centroids.x,cx,rtol=1e-9)
+        np.testing.assert_allclose(fcm.centroids.y,cy,rtol=1e-9)
+
+    def test_sparse_fuzzy_cmeans(self):
+        """Truncated memberships of all clusters equal the dense memberships."""
+        k = len(self.inits)
+        for manhattan in (False,True):
+            engine = DistanceEngine(None,20,manhattan)
+            dense = FuzzyCMeans(engine,2.0,1.e-6)
+            weights = dense.fit(self.points,self.points.subset(self.inits))
+            sparse = SparseFuzzyCMeans(engine,2.0,1.e-6,k)
+            clusters,sparse_weights = sparse.fit(self.points,self.points.subset(self.inits))
+            self.assertEqual(sparse.iterations,dense.iterations)
+            np.testing.assert_allclose(sparse.centroids.x,dense.centroids.x,rtol=1e-9)
+            np.testing.assert_allclose(sparse.centroids.y,dense.centroids.y,rtol=1e-9)
+            np.testing.assert_allclose(np.take_along_axis(weights,clusters.T,axis=0),
+                                       sparse_weights.T,rtol=1e-9)
+            np.testing.assert_array_equal(sparse.labels((clusters,sparse_weights)),
+                                          dense.labels(weights))
+
+            # fewer memberships are renormalized to a sum of one
+            truncated = SparseFuzzyCMeans(engine,2.0,1.e-6,2)
+            clusters,sparse_weights = truncated.fit(self.points,self.points.subset(self.inits))
+            self.assertEqual(clusters.shape,(len(self.points),2))
+            np.testing.assert_allclose((sparse_weights**0.5).sum(axis=1),1.0)
+
+    def test_repair(self):
+        """Identical seeds leave no cluster empty and count the moved points."""
+        engine = DistanceEngine(None,20,False)
+        inits = np.r_[np.repeat(self.inits[0],3),self.inits[1:]]
+        centroids = self.points.subset(inits)
+        lloyd = LloydKMeans(engine,0.0)
+        labels,dist = lloyd.assign(self.points,centroids)
+        self.assertEqual(len(np.unique(labels)),len(inits)-2)
+        moved = lloyd.repair(self.points,centroids,labels,dist)
+        self.assertEqual(len(moved),2)
+        self.assertEqual(lloyd.repairs,2)
+        self.assertEqual(np.bincount(labels,minlength=len(inits)).min(),1)
+        # the farthest points are moved
+        np.testing.assert_array_equal(np.sort(moved),np.sort(np.argsort(-dist)[:2]))
+
+        for scheme in (LloydKMeans,HamerlyKMeans):
+            kmeans = scheme(engine,0.0)
+            labels = kmeans.fit(self.points,self.points.subset(inits))
+            self.assertGreater(np.bincount(labels,minlength=len(inits)).min(),0)
+            self.assertGreaterEqual(kmeans.repairs,2)
+        hamerly = HamerlyKMeans(engine,0.0)
+        np.testing.assert_array_equal(hamerly.fit(self.points,self.points.subset(inits)),
+                                      LloydKMeans(engine,0.0).fit(self.points,
+                                                                  self.points.subset(inits)))
+
+    def test_iteration_cap(self):
+        """The iteration cap stops before convergence."""
+        engine = DistanceEngine(None,20,False)
+        for scheme in (LloydKMeans,HamerlyKMeans):
+            kmeans = scheme(engine,1.e-9,max_iterations=2)
+            kmeans.fit(self.points,self.points.subset(self.inits))
+            self.assertEqual(kmeans.iterations,2)
+            self.assertFalse(kmeans.converged)
+            self.assertGreater(kmeans.shift,1.e-9)
+
+    def test_unchanged_labels(self):
+        """Iterations from converged centroids stop as soon as no label changes."""
+        engine = DistanceEngine(None,20,False)
+        for scheme in (LloydKMeans,HamerlyKMeans):
+            first = scheme(engine,0.0)
+            labels = first.fit(self.points,self.points.subset(self.inits))
+            second = scheme(engine,0.0)
+            np.testing.assert_array_equal(second.fit(self.points,first.centroids),labels)
+            self.assertEqual(second.iterations,2)
+            self.assertEqual(second.shift,0.0)
+
+    def chunks(self, size, order=None):
+        '''
+        Function returning a new iterator over chunks of the points for every pass
+        '''
+        rows = np.arange(len(self.points)) if order is None else order
+        return lambda: (self.points.subset(rows[start:start+size])
+                        for start in range(0, len(rows), size))
+
+    def test_streaming(self):
+        """Chunked passes reach a fixed point of Lloyd's algorithm for any chunking."""
+        engine = DistanceEngine(None,20,False)
+        order = np.random.default_rng(8).permutation(len(self.points))
+        for size,rows in ((50,None),(37,order),(400,None),(1,order)):
+            streaming = StreamingKMeans(engine,1.e-9,max_iterations=100)
+            centroids = streaming.fit(self.chunks(size,rows),self.points.subset(self.inits))
+            self.assertTrue(streaming.converged)
+
+            # final centroids are the weighted means of their members
+            lloyd = LloydKMeans(engine,1.e-6)
+            labels = lloyd.fit(self.points,centroids)
+            self.assertEqual(lloyd.iterations,1)
+            means = centroids_from_labels(self.points,labels,len(self.inits))
+            np.testing.assert_allclose(centroids.x,means.x,rtol=1e-9)
+            np.testing.assert_allclose(centroids.y,means.y,rtol=1e-9)
+            np.testing.assert_allclose(centroids.attributes,means.attributes,
+                                       rtol=1e-9,atol=1e-12)
+            np.testing.assert_allclose(centroids.weights,means.weights,rtol=1e-9)
+    def test_sensitivity_coreset(self):
+        """Coresets keep the total weight and the cost of fixed centroids."""
+        rng = np.random.default_rng(12)
+        points = synthetic_points(5000,2,rng)
+        engine = DistanceEngine(None,20,False)
+        centroids = points.subset(rng.choice(len(points),6,replace=False))
+        full = (points.weights*engine.nearest(points.x,points.y,points.a,centroids.x,
+                                              centroids.y,centroids.a)[1]).sum()
+        for seed in range(3):
+            coreset = sensitivity_coreset(engine,points,6,1000,random.Random(seed))
+            self.assertLessEqual(len(coreset),1000)
+            self.assertAlmostEqual(coreset.weights.sum()/points.weights.sum(),1.0,delta=0.03)
+            cost = (coreset.weights*engine.nearest(coreset.x,coreset.y,coreset.a,centroids.x,
+                                                   centroids.y,centroids.a)[1]).sum()
+            self.assertAlmostEqual(cost/full,1.0,delta=0.1)
+            # rows of the coreset are distinct points of the input
+            self.assertEqual(len(np.unique(coreset.fids)),len(coreset))
+        np.testing.assert_array_equal(
+            sensitivity_coreset(engine,points,6,1000,random.Random(5)).weights,
+            sensitivity_coreset(engine,points,6,1000,random.Random(5)).weights)
+
+    def test_kmeans_plusplus(self):
+        """Linear K-Means++ draws the seeds of the former quadratic version."""
+        points = self.points.subset(np.arange(150))
+        points.weights[:] = 1.0
+        for manhattan in (False,True):
+            engine = DistanceEngine(None,20,manhattan)
+            for seed in range(5):
+                self.assertEqual(kmeans_plusplus(engine,points,8,random.Random(seed)),
+                                 quadratic_plusplus(engine,points,8,random.Random(seed)))
+
+    def test_kmeans_parallel(self):
+        """K-Means|| draws k distinct seeds reproducibly for a given seed."""
+        engine = DistanceEngine(None,20,False)
+        for seed in range(3):
+            inits = kmeans_parallel(engine,self.points,6,random.Random(seed))
+            self.assertEqual(len(inits),6)
+            self.assertEqual(len(set(inits)),6)
+            self.assertEqual(kmeans_parallel(engine,self.points,6,random.Random(seed)),inits)
+
+    def test_minibatch(self):
+        """Mini-Batch K-Means is reproducible for a seeded generator."""
+        engine = DistanceEngine(None,20,False)
+        results = []
+        for repeat in range(2):
+            kmeans = MiniBatchKMeans(engine,1.e-3,64,max_iterations=30,
+                                     rng=np.random.default_rng(13))
+            results.append((kmeans.fit(self.points,self.points.subset(self.inits)),kmeans))
+        np.testing.assert_array_equal(results[0][0],results[1][0])
+        np.testing.assert_array_equal(results[0][1].centroids.x,results[1][1].centroids.x)
+        self.assertEqual(results[0][1].iterations,results[1][1].iterations)
+        self.assertEqual(len(np.unique(results[0][0])),len(self.inits))
+
+    def test_minibatch_full_batch(self):
+        """A batch of all points gives the centroid update of Lloyd's algorithm."""
+        engine = DistanceEngine(None,20,False)
+        minibatch = MiniBatchKMeans(engine,0.0,len(self.points),max_iterations=1,
+                                    rng=FullBatches())
+        minibatch.fit(self.points,self.points.subset(self.inits))
+        lloyd = LloydKMeans(engine,0.0,max_iterations=1)
+        lloyd.fit(self.points,self.points.subset(self.inits))
+        np.testing.assert_allclose(minibatch.centroids.x,lloyd.centroids.x,rtol=1e-12)
+        np.testing.assert_allclose(minibatch.centroids.y,lloyd.centroids.y,rtol=1e-12)
+        np.testing.assert_allclose(minibatch.centroids.attributes,lloyd.centroids.attributes,
+                                   rtol=1e-9,atol=1e-12)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(KMeansTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,77 @@
+# coding=utf-8
+"""Tests of the columnar point store.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Johannes Jenkner'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026 by Johannes Jenkner'
+
+import unittest
+
+import numpy as np
+
+from ..point_store import PointStore
+
+
+class PointStoreTest(unittest.TestCase):
+    """Test merging of duplicates and the mapping of feature IDs"""
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        n = 300
+        # few distinct locations and attribute values to produce duplicates
+        self.points = PointStore(rng.permutation(n)*7+3,
+                                 rng.integers(0, 6, n)*10.0,
+                                 rng.integers(0, 5, n)*10.0,
+                                 rng.integers(0, 2, (n,1)).astype(float),
+                                 rng.uniform(0.5, 2.0, n))
+
+    def test_merge_duplicates(self):
+        """Representatives carry the total weight of their identical members."""
+        points = self.points
+        merged,inverse = points.merge_duplicates()
+        groups = {}
+        for i in range(len(points)):
+            key = (points.x[i],points.y[i],points.attributes[i,0])
+            groups.setdefault(key,[]).append(i)
+        self.assertEqual(len(merged),len(groups))
+        for row,members in enumerate(sorted(groups.values())):
+            # representatives in the order of their first member
+            self.assertEqual(merged.fids[row],points.fids[members[0]])
+            self.assertAlmostEqual(merged.weights[row],points.weights[members].sum())
+            np.testing.assert_array_equal(inverse[members],row)
+        np.testing.assert_array_equal(merged.x[inverse],points.x)
+        np.testing.assert_array_equal(merged.y[inverse],points.y)
+        np.testing.assert_array_equal(merged.attributes[inverse],points.attributes)
+
+    def test_merge_within_tolerance(self):
+        """Points in a grid cell merge into their weighted mean."""
+        points = self.points
+        merged,inverse = points.merge_duplicates(25.0)
+        cells = np.floor(np.column_stack((points.x,points.y,points.attributes))/25.0)
+        for row in range(len(merged)):
+            members = np.flatnonzero(inverse==row)
+            self.assertEqual(len(np.unique(cells[members],axis=0)),1)
+            w = points.weights[members]
+            self.assertAlmostEqual(merged.weights[row],w.sum())
+            self.assertAlmostEqual(merged.x[row],np.dot(w,points.x[members])/w.sum())
+            self.assertAlmostEqual(merged.y[row],np.dot(w,points.y[members])/w.sum())
+        self.assertEqual(len(merged),len(np.unique(cells,axis=0)))
+
+    def test_rows(self):
+        """Feature IDs map to their rows."""
+        rows = np.random.default_rng(6).permutation(len(self.points))
+        np.testing.assert_array_equal(self.points.rows(self.points.fids[rows]),rows)
+        self.assertEqual(self.points.row(self.points.fids[17]),17)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(PointStoreTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)